@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class AccountsConfig(AppConfig):
     name = 'accounts'
+
+    def ready(self):
+        from . import signals  # noqa: F401 (registra i receiver che invalidano l'utente in sessione)
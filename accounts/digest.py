@@ -0,0 +1,98 @@
+from datetime import timedelta
+from django.core.cache import cache
+from django.db.models import Count, Exists, Max, Min, OuterRef, Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+from cinema.models import Film, Proiezione
+from .models import InvioNewsletter
+
+TEMPLATE_DIGEST = "accounts/email/digest.txt"
+CACHE_TIMEOUT = 60 * 60
+
+
+def ultimo_high_water_mark():
+    # fino a dove è arrivato l'ultimo digest inviato a tutti (se non ce n'è nessuno: l'ultima settimana);
+    # un invio interrotto non conta, altrimenti le sue novità non verrebbero mai annunciate
+    hwm = InvioNewsletter.objects.filter(completato_il__isnull=False).aggregate(m=Max("digest_fino_al"))["m"]
+    return hwm or timezone.now() - timedelta(days=7)
+
+
+def _ultima_modifica():
+    # due MAX su colonne indicizzate: costano come una lettura dell'indice, non una scansione
+    film = Film.objects.aggregate(m=Max("aggiornato_il"))["m"]
+    proiezioni = Proiezione.objects.aggregate(m=Max("creato_il"))["m"]
+    return max(filter(None, [film, proiezioni]), default=None)
+
+
+def costruisci_digest(dal=None):
+    """
+    Costruisce il digest "novità della settimana" con le sole righe cambiate dopo `dal`
+    (di default l'high-water mark dell'ultimo digest). Il risultato renderizzato resta in cache
+    finché non cambia nulla nel catalogo.
+    """
+    dal = dal or ultimo_high_water_mark()
+    oggi = timezone.localdate()
+    ultima_modifica = _ultima_modifica()
+
+    chiave = f"digest:{dal.timestamp()}:{ultima_modifica.timestamp() if ultima_modifica else 0}:{oggi.isoformat()}"
+    digest = cache.get(chiave)
+    if digest is not None:
+        return digest
+
+    al = timezone.now()
+
+    # proiezioni aggiunte dopo l'high-water mark, già aggregate per film
+    nuove_proiezioni = {
+        r["film_id"]: r
+        for r in (
+            Proiezione.objects
+            .future(al)
+            .filter(creato_il__gt=dal)
+            .values("film_id")
+            .annotate(n=Count("id"), prima=Min("data_ora"))
+        )
+    }
+
+    dal_giorno = timezone.localtime(dal).date()
+    films = list(
+        Film.objects
+        .filter(
+            # una modifica conta solo per i film ancora attuali: con proiezioni future o in uscita da dopo
+            # `dal` (una sinossi corretta su un film di anni fa non è una novità)
+            Q(aggiornato_il__gt=dal) & (
+                Q(in_programmazione__gt=dal_giorno)
+                | Q(uscita_locale__gt=dal_giorno)
+                | Exists(Proiezione.objects.future(al).filter(film=OuterRef("pk")))
+            )
+            | Q(in_programmazione__gt=dal_giorno, in_programmazione__lte=oggi)
+            | Q(uscita_locale__gt=dal_giorno, uscita_locale__lte=oggi)
+            | Q(id__in=nuove_proiezioni.keys())
+        )
+        .only("id", "titolo", "regista", "rassegna", "uscita_locale", "in_programmazione")
+        .order_by("titolo")
+    )
+
+    for film in films:
+        r = nuove_proiezioni.get(film.id)
+        film.nuove_proiezioni = r["n"] if r else 0
+        film.prima_nuova_proiezione = r["prima"] if r else None
+
+    in_programmazione = [f for f in films if not f.rassegna and f.in_programmazione and f.in_programmazione <= oggi]
+    prossimamente = [f for f in films if not f.rassegna and f.in_programmazione and f.in_programmazione > oggi]
+    rassegna = [f for f in films if f.rassegna]
+
+    corpo = render_to_string(TEMPLATE_DIGEST, {
+        "dal": dal,
+        "in_programmazione": in_programmazione,
+        "prossimamente": prossimamente,
+        "rassegna": rassegna,
+    })
+
+    digest = {
+        "dal": dal,
+        "al": al,
+        "corpo": corpo,
+        "vuoto": not films,
+    }
+    cache.set(chiave, digest, CACHE_TIMEOUT)
+    return digest
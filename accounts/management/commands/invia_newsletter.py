@@ -0,0 +1,75 @@
+from django.core.management.base import BaseCommand, CommandError
+from accounts.models import InvioNewsletter
+from accounts.newsletter import TEMPLATE_DEFAULT, crea_invio, crea_invio_digest, esegui_invio
+
+
+class Command(BaseCommand):
+    help = "Invia la newsletter a tutti gli iscritti a blocchi, con throttling e possibilità di riprendere un invio interrotto."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--oggetto", help="Oggetto della mail (obbligatorio per un nuovo invio).")
+        parser.add_argument("--messaggio", default="", help="Testo libero inserito nel template.")
+        parser.add_argument(
+            "--digest",
+            action="store_true",
+            help="Genera il corpo con le novità (film e proiezioni) dall'ultimo digest inviato.",
+        )
+        parser.add_argument(
+            "--template",
+            default=TEMPLATE_DEFAULT,
+            help=f"Template del corpo della mail (default: {TEMPLATE_DEFAULT}).",
+        )
+        parser.add_argument(
+            "--batch",
+            type=int,
+            default=200,
+            help="Quanti iscritti servire per blocco (default: 200).",
+        )
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=0,
+            help="Massimo numero di mail al secondo (default: 0 = nessun limite).",
+        )
+        parser.add_argument(
+            "--riprendi",
+            type=int,
+            metavar="ID",
+            help="Riprende l'invio con questo id dal punto in cui si era interrotto.",
+        )
+
+    def handle(self, *args, **options):
+        if options["batch"] < 1:
+            raise CommandError("--batch deve essere almeno 1.")
+
+        if options["riprendi"]:
+            try:
+                invio = InvioNewsletter.objects.get(pk=options["riprendi"])
+            except InvioNewsletter.DoesNotExist:
+                raise CommandError(f"Invio {options['riprendi']} inesistente.")
+            if invio.completato:
+                self.stdout.write(self.style.WARNING("Invio già completato, niente da fare."))
+                return
+            self.stdout.write(self.style.NOTICE(f"Riprendo l'invio #{invio.pk} dopo l'iscritto {invio.ultimo_iscritto_id}..."))
+        elif options["digest"]:
+            invio = crea_invio_digest(options["oggetto"])
+            if invio is None:
+                self.stdout.write(self.style.WARNING("Nessuna novità dall'ultimo digest, niente da inviare."))
+                return
+            self.stdout.write(self.style.NOTICE(f"Creato digest #{invio.pk} (novità fino al {invio.digest_fino_al:%d/%m/%Y %H:%M})."))
+        else:
+            if not options["oggetto"]:
+                raise CommandError("Specifica --oggetto, --digest oppure --riprendi ID.")
+            invio = crea_invio(options["oggetto"], options["template"], {"messaggio": options["messaggio"]})
+            self.stdout.write(self.style.NOTICE(f"Creato invio #{invio.pk}."))
+
+        def progresso(inv):
+            self.stdout.write(f"  inviate {inv.inviati} mail (ultimo iscritto: {inv.ultimo_iscritto_id})")
+
+        esegui_invio(
+            invio,
+            batch_size=options["batch"],
+            messaggi_al_secondo=options["rate"] or None,
+            on_batch=progresso,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Invio #{invio.pk} completato: {invio.inviati} mail."))
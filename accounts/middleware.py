@@ -0,0 +1,106 @@
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth import HASH_SESSION_KEY, SESSION_KEY
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.functional import SimpleLazyObject
+
+# Utente in sessione (opt-in con ACCOUNTS_CACHE_UTENTE): id, username, socio, flag e nomi dei gruppi
+# vengono salvati nella sessione insieme a una versione. Finché la versione in cache non cambia
+# (salvataggio dell'utente, cambio gruppi: vedi signals.py) la richiesta non legge accounts_user e auth_group.
+# Gli altri campi restano differiti: se un template li usa vengono caricati con una query.
+#
+# La versione sta nella cache: con più processi serve una cache condivisa (file o redis), altrimenti
+# una modifica fatta in un processo non viene vista dagli altri.
+
+CHIAVE_SESSIONE = "_utente_cache"
+CAMPI = ["id", "username", "socio", "is_superuser", "is_staff", "is_active"]
+
+
+def _chiave_versione(user_id):
+    return f"utente:{user_id}:versione"
+
+
+def versione_utente(user_id):
+    chiave = _chiave_versione(user_id)
+    versione = cache.get(chiave)
+    if versione is None:
+        versione = time.time_ns()
+        cache.set(chiave, versione, timeout=None)
+    return versione
+
+
+def invalida_utente(user_id):
+    cache.set(_chiave_versione(user_id), time.time_ns(), timeout=None)
+
+
+def _utente_da_sessione(dati):
+    User = auth.get_user_model()
+    # from_db vuole i valori nell'ordine dei campi del modello
+    campi = [f.attname for f in User._meta.concrete_fields if f.attname in CAMPI]
+    user = User.from_db(DEFAULT_DB_ALIAS, campi, [dati[c] for c in campi])
+    user._nomi_gruppi = frozenset(dati["gruppi"])
+    return user
+
+
+def _carica_utente(request):
+    session = request.session
+    user_id = session.get(SESSION_KEY)
+    dati = session.get(CHIAVE_SESSIONE)
+
+    if user_id is not None and dati:
+        if (
+            str(dati["id"]) == str(user_id)
+            and dati["hash"] == session.get(HASH_SESSION_KEY)
+            and dati["versione"] == versione_utente(dati["id"])
+        ):
+            return _utente_da_sessione(dati)
+
+    # percorso normale di Django (verifica anche l'hash della password), poi salvo in sessione
+    user = auth.get_user(request)
+    if user.is_authenticated:
+        versione = versione_utente(user.pk)  # letta prima dei gruppi: una modifica nel frattempo la cambia
+        gruppi = list(user.groups.values_list("name", flat=True))
+        user._nomi_gruppi = frozenset(gruppi)
+        session[CHIAVE_SESSIONE] = {
+            **{c: getattr(user, c) for c in CAMPI},
+            "gruppi": gruppi,
+            "hash": session.get(HASH_SESSION_KEY),
+            "versione": versione,
+        }
+    elif CHIAVE_SESSIONE in session:
+        del session[CHIAVE_SESSIONE]
+    return user
+
+
+def _utente(request):
+    if not hasattr(request, "_cached_user"):
+        request._cached_user = _carica_utente(request)
+    return request._cached_user
+
+
+class UtenteInCacheMiddleware:
+    # va dopo AuthenticationMiddleware e ne sostituisce request.user (e request.auser per le viste async)
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, "ACCOUNTS_CACHE_UTENTE", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.user = SimpleLazyObject(lambda: _utente(request))
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        request.user = SimpleLazyObject(lambda: _utente(request))
+        request.auser = lambda: sync_to_async(_utente)(request)  # sessione e database vanno letti fuori dall'event loop
+        return await self.get_response(request)
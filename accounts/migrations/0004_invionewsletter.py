@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_remove_newslettersubscription_consent_at_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvioNewsletter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('oggetto', models.CharField(max_length=200)),
+                ('corpo', models.TextField()),
+                ('creato_il', models.DateTimeField(auto_now_add=True)),
+                ('completato_il', models.DateTimeField(blank=True, null=True)),
+                ('ultimo_iscritto_id', models.PositiveBigIntegerField(default=0)),
+                ('inviati', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Invii newsletter',
+                'ordering': ['-creato_il', '-id'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_invionewsletter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invionewsletter',
+            name='digest_fino_al',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
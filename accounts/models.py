@@ -19,3 +19,25 @@ class NewsletterSubscription(models.Model):
     def __str__(self):
         return self.email
 
+
+
+class InvioNewsletter(models.Model):
+    oggetto = models.CharField(max_length=200)
+    corpo = models.TextField() # testo renderizzato una sola volta per tutto l'invio
+    creato_il = models.DateTimeField(auto_now_add=True)
+    completato_il = models.DateTimeField(null=True, blank=True)
+    ultimo_iscritto_id = models.PositiveBigIntegerField(default=0) # cursore: ultimo iscritto già servito, permette di riprendere un invio interrotto
+    inviati = models.PositiveIntegerField(default=0)
+    digest_fino_al = models.DateTimeField(null=True, blank=True, db_index=True) # se l'invio è un digest: fino a quando arrivano le novità incluse (high-water mark)
+
+    class Meta:
+        verbose_name_plural = "Invii newsletter"
+        ordering = ["-creato_il", "-id"]
+
+    @property
+    def completato(self):
+        return self.completato_il is not None
+
+    def __str__(self):
+        return f"{self.oggetto} ({self.inviati} inviati)"
+
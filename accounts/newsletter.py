@@ -0,0 +1,80 @@
+import time
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.template.loader import render_to_string
+from django.utils import timezone
+from .digest import costruisci_digest
+from .models import InvioNewsletter, NewsletterSubscription
+
+TEMPLATE_DEFAULT = "accounts/email/newsletter.txt"
+
+
+def crea_invio(oggetto, template_name=TEMPLATE_DEFAULT, context=None):
+    # il template viene renderizzato una volta sola: tutti gli iscritti ricevono lo stesso testo
+    ctx = {"oggetto": oggetto}
+    ctx.update(context or {})
+    corpo = render_to_string(template_name, ctx)
+    return InvioNewsletter.objects.create(oggetto=oggetto, corpo=corpo)
+
+
+def crea_invio_digest(oggetto=None):
+    # restituisce None se dall'ultimo digest non è cambiato nulla
+    digest = costruisci_digest()
+    if digest["vuoto"]:
+        return None
+    return InvioNewsletter.objects.create(
+        oggetto=oggetto or "Le novità della settimana",
+        corpo=digest["corpo"],
+        digest_fino_al=digest["al"],
+    )
+
+
+def esegui_invio(invio, batch_size=200, messaggi_al_secondo=None, on_batch=None):
+    """
+    Invia la newsletter agli iscritti con id > invio.ultimo_iscritto_id, a blocchi di batch_size.
+    Dopo ogni blocco salva il cursore: se il processo viene interrotto, rilanciandolo si riparte
+    dal primo iscritto non ancora servito.
+    """
+    if invio.completato:
+        return invio
+
+    # una sola connessione SMTP riutilizzata per tutti i blocchi
+    connection = get_connection()
+    connection.open()
+    try:
+        while True:
+            inizio = time.monotonic()
+
+            iscritti = list(
+                NewsletterSubscription.objects
+                .filter(id__gt=invio.ultimo_iscritto_id)
+                .order_by("id")
+                .values_list("id", "email")[:batch_size]
+            )
+            if not iscritti:
+                break
+
+            messaggi = [
+                EmailMessage(invio.oggetto, invio.corpo, settings.DEFAULT_FROM_EMAIL, [email], connection=connection)
+                for _, email in iscritti
+            ]
+            connection.send_messages(messaggi)
+
+            invio.ultimo_iscritto_id = iscritti[-1][0]
+            invio.inviati += len(iscritti)
+            invio.save(update_fields=["ultimo_iscritto_id", "inviati"])
+
+            if on_batch:
+                on_batch(invio)
+
+            # throttling: non superiamo messaggi_al_secondo (es. limiti del provider SMTP)
+            if messaggi_al_secondo:
+                attesa = len(iscritti) / messaggi_al_secondo - (time.monotonic() - inizio)
+                if attesa > 0:
+                    time.sleep(attesa)
+    finally:
+        connection.close()
+
+    invio.completato_il = timezone.now()
+    invio.save(update_fields=["completato_il"])
+    return invio
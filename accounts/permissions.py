@@ -1,12 +1,24 @@
+from django.db.models import CharField, Case, Exists, OuterRef, Value, When
+
 GROUP_SEGRETARIO = "segretario"
 GROUP_GESTORE = "gestore_film"
 
 STAFF_GROUPS = [GROUP_SEGRETARIO, GROUP_GESTORE]
 
+# chi può eliminare chi: ruolo di chi elimina -> ruoli eliminabili
+RUOLI_ELIMINABILI = {
+    "segretario": {"cliente"},
+    "gestore_film": {"cliente", "segretario"},
+    "admin": {"cliente", "segretario", "gestore_film", "staff"},
+}
+
 
 def has_any_group(user, names):
     if not user.is_authenticated:
         return False
+    nomi = getattr(user, "_nomi_gruppi", None)  # gruppi già noti (utente in sessione, accounts/middleware.py)
+    if nomi is not None:
+        return not nomi.isdisjoint(names)
     return user.groups.filter(name__in=names).exists()
 
 
@@ -51,18 +63,29 @@ def can_delete_user(actor, target):
     if target.is_superuser: # Non si può eliminare l'admin
         return False
 
-    a = role(actor)
-    t = role(target)
+    return role(target) in RUOLI_ELIMINABILI.get(role(actor), set())
+
+
+def annota_ruoli(qs):
+    # stesso risultato di role(), ma calcolato dal database per tutti gli utenti del queryset
+    # (un Exists sui gruppi per riga invece di due query per utente)
+    gruppi = qs.model.groups.through.objects
 
-    if a == "segretario":
-        return t == "cliente"
-    if a == "gestore_film":
-        return t in {"cliente", "segretario"}
-    if a == "admin":
-        return t in {"cliente", "segretario", "gestore_film", "staff"}
+    def in_gruppo(nome):
+        return Exists(gruppi.filter(user_id=OuterRef("pk"), group__name=nome))
 
-    return False
+    return qs.annotate(ruolo=Case(
+        When(is_superuser=True, then=Value("admin")),
+        When(in_gruppo(GROUP_GESTORE), then=Value("gestore_film")),
+        When(in_gruppo(GROUP_SEGRETARIO), then=Value("segretario")),
+        When(is_staff=True, then=Value("staff")),
+        default=Value("cliente"),
+        output_field=CharField(),
+    ))
 
 # Mi server per utilizzare {{staff_mode }} nei template
 def staff_flags(request):
-    return {"staff_mode": is_operational_staff(request.user)}
+    return {
+        "staff_mode": is_operational_staff(request.user),
+        "gestore_mode": request.user.is_staff or has_any_group(request.user, [GROUP_GESTORE]),
+    }
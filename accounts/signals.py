@@ -0,0 +1,37 @@
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from .middleware import invalida_utente
+from .models import User
+
+
+def _invalida_utenti_gruppo(group):
+    for user_id in group.user_set.values_list("pk", flat=True):
+        invalida_utente(user_id)
+
+
+@receiver([post_save, post_delete], sender=User)
+def utente_modificato(sender, instance, **kwargs):
+    invalida_utente(instance.pk)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def gruppi_modificati(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        # user.groups.add/remove/clear
+        if action.startswith("post_"):
+            invalida_utente(instance.pk)
+    elif action == "pre_clear":
+        # group.user_set.clear(): dopo non si sa più chi c'era
+        _invalida_utenti_gruppo(instance)
+    elif action.startswith("post_") and pk_set:
+        # group.user_set.add/remove
+        for user_id in pk_set:
+            invalida_utente(user_id)
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def gruppo_modificato(sender, instance, **kwargs):
+    # gruppo rinominato o eliminato: cambiano i nomi in sessione dei suoi utenti
+    _invalida_utenti_gruppo(instance)
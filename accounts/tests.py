@@ -1,10 +1,21 @@
 from datetime import timedelta
+from importlib import import_module
+from io import StringIO
+from django.apps import apps
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
-from django.test import TestCase
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
-from accounts.permissions import GROUP_SEGRETARIO
+from accounts.digest import costruisci_digest
+from accounts.models import InvioNewsletter, NewsletterSubscription
+from accounts.newsletter import crea_invio, esegui_invio
+from accounts.permissions import GROUP_GESTORE, GROUP_SEGRETARIO, annota_ruoli, role
 from cinema.models import Film, Proiezione, Sala, Posto
 from sales.models import Biglietto
 
@@ -69,3 +80,308 @@ class UserDeleteViewTests(TestCase):
         self.assertEqual(resp.status_code, 200)
         self.assertFalse(User.objects.filter(id=target.id).exists())
 
+
+
+class UserListViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.g_segretario = Group.objects.create(name=GROUP_SEGRETARIO)
+        cls.g_gestore = Group.objects.create(name=GROUP_GESTORE)
+        cls.staff = User.objects.create_user(username="seg", password="pass", email="segre@segre.it")
+        cls.staff.groups.add(cls.g_segretario)
+        cls.gestore = User.objects.create_user(username="gest", password="pass", email="gest@gest.it")
+        cls.gestore.groups.add(cls.g_gestore)
+
+        sala = Sala.objects.create(nome="Sala 1")
+        posto = Posto.objects.create(sala=sala, fila="A", numero_posto="1")
+        film = Film.objects.create(
+            titolo="Film Test",
+            descrizione="...",
+            data_uscita=timezone.localdate() - timedelta(days=10),
+            durata_minuti=120,
+            genere="Test",
+            regista="Reg",
+            cast_principale="Cast",
+            locandina_url="https://example.com/poster.jpg",
+        )
+        proiezione = Proiezione.objects.create(film=film, sala=sala, data_ora=timezone.now() + timedelta(days=2))
+
+        cls.prenotato = User.objects.create_user(username="cliente_prenotato", password="pass", email="p@x.it")
+        Biglietto.objects.create(utente=cls.prenotato, proiezione=proiezione, posto=posto)
+        cls.libero = User.objects.create_user(username="cliente_libero", password="pass", email="l@x.it", socio=True)
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def _query_pagina(self, **params):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse("accounts:user_list"), params)
+        return len(ctx.captured_queries)
+
+    # annota_ruoli dà lo stesso risultato di role() utente per utente
+    def test_ruoli_annotati_come_role(self):
+        for u in annota_ruoli(User.objects.all()):
+            self.assertEqual(u.ruolo, role(u))
+
+    # Il segretario può eliminare solo i clienti senza prenotazioni attive
+    def test_eliminabile(self):
+        response = self.client.get(reverse("accounts:user_list"))
+        clienti = {u.username: u for u in response.context["client_users"]}
+        staff = {u.username: u for u in response.context["staff_users"]}
+
+        self.assertTrue(clienti["cliente_libero"].eliminabile)
+        self.assertTrue(clienti["cliente_libero"].socio)
+        self.assertFalse(clienti["cliente_prenotato"].eliminabile)
+        self.assertFalse(staff["gest"].eliminabile)
+        self.assertFalse(staff["seg"].eliminabile)
+
+    # Il numero di query non dipende dal numero di clienti; la ricerca filtra per username o email
+    def test_query_costanti_e_ricerca(self):
+        prima = self._query_pagina()
+        for i in range(20):
+            User.objects.create_user(username=f"altro{i}", password="pass", email=f"altro{i}@x.it")
+        self.assertEqual(self._query_pagina(), prima)
+
+        response = self.client.get(reverse("accounts:user_list"), {"q": "l@x.it"})
+        self.assertEqual([u.username for u in response.context["client_users"]], ["cliente_libero"])
+
+
+class InvioNewsletterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.iscritti = [
+            NewsletterSubscription.objects.create(email=f"iscritto{i}@x.it") for i in range(5)
+        ]
+
+    # Tutti gli iscritti ricevono la mail, anche se serviti a blocchi
+    def test_invio_a_blocchi_raggiunge_tutti_gli_iscritti(self):
+        invio = crea_invio("Novità della settimana", context={"messaggio": "Ciao"})
+
+        esegui_invio(invio, batch_size=2)
+
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual({m.to[0] for m in mail.outbox}, {s.email for s in self.iscritti})
+        invio.refresh_from_db()
+        self.assertTrue(invio.completato)
+        self.assertEqual(invio.inviati, 5)
+
+    # Un invio interrotto riparte dal primo iscritto non ancora servito
+    def test_invio_interrotto_riprende_dal_cursore(self):
+        invio = crea_invio("Novità della settimana")
+        invio.ultimo_iscritto_id = self.iscritti[2].id
+        invio.inviati = 3
+        invio.save()
+
+        call_command("invia_newsletter", riprendi=invio.pk, batch=10, stdout=StringIO())
+
+        self.assertEqual([m.to[0] for m in mail.outbox], [s.email for s in self.iscritti[3:]])
+        invio.refresh_from_db()
+        self.assertEqual(invio.inviati, 5)
+
+
+class DigestNewsletterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.sala = Sala.objects.create(nome="Sala 1")
+        cls.film_vecchio = Film.objects.create(
+            titolo="Film Vecchio",
+            descrizione="...",
+            data_uscita=timezone.localdate() - timedelta(days=60),
+            durata_minuti=100,
+            genere="Test",
+            regista="Reg",
+            cast_principale="Cast",
+            locandina_url="https://example.com/poster.jpg",
+        )
+        # il film esisteva già prima dell'ultimo digest
+        Film.objects.filter(pk=cls.film_vecchio.pk).update(aggiornato_il=timezone.now() - timedelta(days=10))
+
+        InvioNewsletter.objects.create(
+            oggetto="Digest precedente",
+            corpo="...",
+            digest_fino_al=timezone.now() - timedelta(days=2),
+            completato_il=timezone.now() - timedelta(days=2),
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    # Il digest contiene solo i film cambiati dopo l'high-water mark
+    def test_digest_include_solo_le_novita(self):
+        Film.objects.create(
+            titolo="Film Nuovo",
+            descrizione="...",
+            data_uscita=timezone.localdate() - timedelta(days=1),
+            durata_minuti=100,
+            genere="Test",
+            regista="Reg",
+            cast_principale="Cast",
+            locandina_url="https://example.com/poster2.jpg",
+        )
+
+        digest = costruisci_digest()
+
+        self.assertFalse(digest["vuoto"])
+        self.assertIn("Film Nuovo", digest["corpo"])
+        self.assertNotIn("Film Vecchio", digest["corpo"])
+
+    # Una nuova proiezione fa rientrare nel digest anche un film non modificato
+    def test_digest_segnala_nuove_proiezioni(self):
+        Proiezione.objects.create(film=self.film_vecchio, sala=self.sala, data_ora=timezone.now() + timedelta(days=1))
+
+        digest = costruisci_digest()
+
+        self.assertIn("Film Vecchio", digest["corpo"])
+        self.assertIn("1 nuove proiezioni", digest["corpo"])
+
+    # Un invio interrotto non sposta l'high-water mark: le sue novità restano nel prossimo digest
+    def test_invio_non_completato_non_conta(self):
+        Proiezione.objects.create(film=self.film_vecchio, sala=self.sala, data_ora=timezone.now() + timedelta(days=1))
+        InvioNewsletter.objects.create(oggetto="Digest interrotto", corpo="...", digest_fino_al=timezone.now())
+
+        digest = costruisci_digest()
+
+        self.assertIn("Film Vecchio", digest["corpo"])
+
+    # Un film che esce in sala nella finestra del digest ci entra anche se nessuno lo ha modificato
+    def test_digest_include_uscite_locali(self):
+        Film.objects.filter(pk=self.film_vecchio.pk).update(
+            uscita_locale=timezone.localdate(),
+            in_programmazione=timezone.localdate() - timedelta(days=20),
+        )
+
+        digest = costruisci_digest()
+
+        self.assertIn("Film Vecchio", digest["corpo"])
+
+    # Correggere la scheda di un film vecchio, senza proiezioni future, non lo fa annunciare come novità
+    def test_modifica_film_vecchio_non_annunciata(self):
+        self.film_vecchio.descrizione = "Sinossi corretta"
+        self.film_vecchio.save()
+
+        digest = costruisci_digest()
+
+        self.assertTrue(digest["vuoto"])
+
+    # Dopo la migrazione che aggiunge aggiornato_il e creato_il il catalogo esistente non è "nuovo"
+    def test_primo_digest_dopo_la_migrazione(self):
+        migrazione = import_module("cinema.migrations.0004_film_aggiornato_il_proiezione_creato_il")
+        InvioNewsletter.objects.all().delete()  # nessun digest ancora inviato
+        Proiezione.objects.create(film=self.film_vecchio, sala=self.sala, data_ora=timezone.now() + timedelta(days=10))
+        # AddField ha messo a tutte le righe l'ora della migrazione
+        Film.objects.update(aggiornato_il=timezone.now())
+        Proiezione.objects.update(creato_il=timezone.now())
+
+        migrazione.retrodata(apps, None)
+
+        self.assertTrue(costruisci_digest()["vuoto"])
+
+    # Se il catalogo non cambia, il digest viene servito dalla cache senza riscansionare i film
+    def test_digest_in_cache_finche_non_cambia_nulla(self):
+        Proiezione.objects.create(film=self.film_vecchio, sala=self.sala, data_ora=timezone.now() + timedelta(days=1))
+        primo = costruisci_digest()
+
+        with self.assertNumQueries(3):  # high-water mark + MAX(film) + MAX(proiezioni)
+            secondo = costruisci_digest()
+
+        self.assertEqual(primo["corpo"], secondo["corpo"])
+
+
+@override_settings(ACCOUNTS_CACHE_UTENTE=True)
+class UtenteInCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.g_gestore = Group.objects.create(name=GROUP_GESTORE)
+        cls.utente = User.objects.create_user(username="cliente", password="pass", email="c@x.it")
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.utente)
+
+    # Dalla seconda richiesta utente e gruppi arrivano dalla sessione
+    def test_nessuna_query_su_utente_e_gruppi(self):
+        self.client.get(reverse("info"))
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("info"))
+
+        self.assertEqual(response.wsgi_request.user.username, "cliente")
+        tabelle = " ".join(q["sql"] for q in ctx.captured_queries)
+        self.assertNotIn("accounts_user", tabelle)
+        self.assertNotIn("auth_group", tabelle)
+
+    # Un cambio di gruppi viene visto alla richiesta successiva
+    def test_cambio_gruppi_invalida(self):
+        self.assertFalse(self.client.get(reverse("info")).context["gestore_mode"])
+
+        self.utente.groups.add(self.g_gestore)
+        self.assertTrue(self.client.get(reverse("info")).context["gestore_mode"])
+
+        self.g_gestore.user_set.clear()
+        self.assertFalse(self.client.get(reverse("info")).context["gestore_mode"])
+
+    # Un cambio password chiude la sessione come senza cache
+    def test_cambio_password_chiude_la_sessione(self):
+        self.client.get(reverse("info"))
+
+        self.utente.set_password("nuova")
+        self.utente.save()
+
+        self.assertFalse(self.client.get(reverse("info")).wsgi_request.user.is_authenticated)
+
+
+
+class MiePrenotazioniTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="u", password="pass", email="u@x.it", socio=True)
+        cls.sala = Sala.objects.create(nome="Sala 1")
+        cls.posto = Posto.objects.create(sala=cls.sala, fila="A", numero_posto="1")
+        cls.film = Film.objects.create(
+            titolo="Film Test", descrizione="...", data_uscita=timezone.localdate() - timedelta(days=400),
+            durata_minuti=100, genere="Test", regista="Reg", cast_principale="Cast",
+            locandina_url="https://example.com/poster.jpg",
+        )
+        now = timezone.now()
+        cls.tra_poco = Biglietto.objects.create(
+            proiezione=Proiezione.objects.create(film=cls.film, sala=cls.sala, data_ora=now + timedelta(minutes=30)),
+            posto=cls.posto, utente=cls.user,
+        )
+        cls.domani = Biglietto.objects.create(
+            proiezione=Proiezione.objects.create(film=cls.film, sala=cls.sala, data_ora=now + timedelta(days=1)),
+            posto=cls.posto, utente=cls.user,
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def _storico(self, n):
+        proiezioni = Proiezione.objects.bulk_create([
+            Proiezione(film=self.film, sala=self.sala, data_ora=timezone.now() - timedelta(days=i + 1)) for i in range(n)
+        ])
+        Biglietto.objects.bulk_create([Biglietto(proiezione=p, posto=self.posto, utente=self.user) for p in proiezioni])
+
+    # Prossime proiezioni subito, con l'annullabilità calcolata dal database; lo storico non viene letto
+    def test_prossime_senza_storico(self):
+        url = reverse("accounts:mie_prenotazioni")
+        with CaptureQueriesContext(connection) as senza_storico:
+            resp = self.client.get(url)
+        self.assertEqual([(b.pk, b.annullabile) for b in resp.context["prossime"]], [(self.tra_poco.pk, False), (self.domani.pk, True)])
+        self.assertNotIn("passate", resp.context)
+
+        self._storico(50)
+        with CaptureQueriesContext(connection) as con_storico:
+            self.client.get(url)
+        self.assertEqual(len(senza_storico), len(con_storico))
+
+    def test_storico_a_pagine(self):
+        self._storico(12)
+        url = reverse("accounts:mie_prenotazioni")
+        resp = self.client.get(url, {"storico": 1})
+        self.assertEqual(len(resp.context["passate"]), 10)
+        self.assertEqual(resp.context["pagina_successiva"], 2)
+
+        resp = self.client.get(url, {"storico": 2}, headers={"X-Requested-With": "XMLHttpRequest"})
+        self.assertTemplateNotUsed(resp, "accounts/mie_prenotazioni.html")
+        self.assertEqual(len(resp.context["passate"]), 2)
+        self.assertIsNone(resp.context["pagina_successiva"])
@@ -1,4 +1,3 @@
-from datetime import timedelta
 from django.contrib import messages
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login
@@ -8,9 +7,12 @@ from sales.models import Biglietto
 from django.views.generic import ListView, View
 from .forms import RegisterForm
 from .models import User
-from .permissions import can_manage_users, can_delete_user, STAFF_GROUPS, is_cliente
+from django.db.models import BooleanField, Case, Exists, OuterRef, Q, Value, When
+from .permissions import can_manage_users, can_delete_user, STAFF_GROUPS, is_cliente, annota_ruoli, role, RUOLI_ELIMINABILI
 from braces.views import GroupRequiredMixin
 
+PAGINA_STORICO = 10  # biglietti passati per pagina
+
 @login_required
 def prenotazioni_utente(request, user_id):
     if not can_manage_users(request.user):
@@ -23,26 +25,8 @@ def prenotazioni_utente(request, user_id):
         messages.error(request, "Puoi vedere le prenotazioni solo dei clienti.")
         return redirect("accounts:user_list")
 
-    now = timezone.now()
-    qs = (
-        Biglietto.objects
-        .filter(utente=target)
-        .select_related("proiezione__film", "proiezione__sala", "posto")
-        .order_by("-proiezione__data_ora")
-    )
-
-    items = []
-    for b in qs:
-        can_cancel = now < (b.proiezione.data_ora - timedelta(hours=1)) # Non è possibile cancellare una prenotazione meno di un'ora della proiezione
-        items.append({"b": b, "can_cancel": can_cancel})
-
-    # riuso lo stesso template "mie_prenotazioni"
-    return render(request, "accounts/mie_prenotazioni.html", {
-        "items": items,
-        "now": now,
-        "profile_user": target,   
-        "as_staff_view": True,    
-    })
+    # riuso la stessa pagina di "mie_prenotazioni"
+    return _pagina_prenotazioni(request, target, profile_user=target, as_staff_view=True)
 
 
 class ToggleSocioView(GroupRequiredMixin, View):
@@ -71,21 +55,43 @@ class UserListView(GroupRequiredMixin, ListView):
     group_required = ["segretario", "gestore_film"]
     superuser_allowed = True
     raise_exception = True
+    paginate_by = 25
+
+    def get_utenti(self):
+        # ruolo, socio, prenotazioni attive ed eliminabilità di ogni utente calcolati nella stessa query
+        qs = annota_ruoli(User.objects.filter(is_superuser=False)) # non visualizziamo l'admin
+
+        q = self.request.GET.get("q", "").strip()
+        if q:
+            qs = qs.filter(Q(username__icontains=q) | Q(email__icontains=q))
+
+        qs = qs.annotate(prenotazioni_attive=Exists(
+            Biglietto.active.filter(utente=OuterRef("pk"))
+        ))
+
+        # stesse regole di UserDeleteView: ruolo eliminabile da chi guarda, nessuna prenotazione attiva, non se stessi
+        eliminabili = RUOLI_ELIMINABILI.get(role(self.request.user), set())
+        if eliminabili:
+            eliminabile = Case(
+                When(Q(ruolo__in=eliminabili, prenotazioni_attive=False) & ~Q(pk=self.request.user.pk), then=Value(True)),
+                default=Value(False),
+                output_field=BooleanField(),
+            )
+        else:
+            eliminabile = Value(False, output_field=BooleanField())
+
+        return qs.annotate(eliminabile=eliminabile).order_by("username")
 
     def get_queryset(self):
-        return User.objects.filter(is_superuser=False).order_by("username") # non visualizziamo l'admin
+        # la lista paginata è quella dei clienti, che possono essere molti
+        return self.get_utenti().exclude(ruolo__in=STAFF_GROUPS)
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
 
-        staff_users = User.objects.filter(groups__name__in=STAFF_GROUPS).distinct()
-
-        client_users = User.objects.exclude(
-            id__in=staff_users.values_list("id", flat=True)
-        )
-
-        ctx["staff_users"] = staff_users
-        ctx["client_users"] = client_users
+        ctx["staff_users"] = self.get_utenti().filter(ruolo__in=STAFF_GROUPS).prefetch_related("groups")
+        ctx["client_users"] = ctx["users"]
+        ctx["q"] = self.request.GET.get("q", "").strip()
         return ctx
 
 
@@ -96,9 +102,7 @@ class UserDeleteView(GroupRequiredMixin, View):
     def post(self, request, user_id):
         target = get_object_or_404(User, id=user_id)
 
-        today = timezone.localdate()
-
-        has_active_bookings = Biglietto.objects.filter(utente=target, proiezione__data_ora__date__gte=today,).exists()
+        has_active_bookings = Biglietto.active.filter(utente=target).exists()
 
         if has_active_bookings:
             messages.error(request, "Non puoi eliminare un utente con prenotazioni attive.")
@@ -136,24 +140,37 @@ def register(request):
 
 @login_required
 def mie_prenotazioni(request):
-    now = timezone.now()
+    return _pagina_prenotazioni(request, request.user)
+
 
+def _pagina_prenotazioni(request, utente, **contesto):
+    # Le prossime proiezioni sono poche e si caricano subito; lo storico (anni di biglietti per i soci
+    # più affezionati) solo su richiesta, una pagina alla volta: ?storico=N, che con fetch restituisce
+    # solo il frammento da aggiungere. Se il biglietto è annullabile lo calcola il database
+    now = timezone.now()
     qs = (
         Biglietto.objects
-        .filter(utente=request.user)
+        .filter(utente=utente)
         .select_related("proiezione__film", "proiezione__sala", "posto")
-        .order_by("-proiezione__data_ora")
+        .con_annullabilita(now)
     )
+    contesto["now"] = now
+
+    try:
+        pagina = max(int(request.GET.get("storico", 0)), 0)
+    except ValueError:
+        pagina = 0
+    contesto["storico"] = pagina
+    if pagina:
+        inizio = (pagina - 1) * PAGINA_STORICO
+        passate = list(
+            qs.filter(proiezione__data_ora__lt=now)
+            .order_by("-proiezione__data_ora", "-id")[inizio:inizio + PAGINA_STORICO + 1]  # +1: c'è un'altra pagina?
+        )
+        contesto["passate"] = passate[:PAGINA_STORICO]
+        contesto["pagina_successiva"] = pagina + 1 if len(passate) > PAGINA_STORICO else None
+        if request.headers.get("X-Requested-With") == "XMLHttpRequest":
+            return render(request, "accounts/_storico.html", contesto)
 
-    items = []
-    for b in qs:
-        can_cancel = now < (b.proiezione.data_ora - timedelta(hours=1)) # non si può disdire a meno di un'ora dalla proiezione
-        items.append({
-            "b": b,
-            "can_cancel": can_cancel,
-        })
-
-    return render(request, "accounts/mie_prenotazioni.html", {
-        "items": items,
-        "now": now,
-    })
+    contesto["prossime"] = list(qs.filter(proiezione__data_ora__gte=now).order_by("proiezione__data_ora", "id"))
+    return render(request, "accounts/mie_prenotazioni.html", contesto)
@@ -1,10 +1,11 @@
 from django.contrib import admin
-from .models import Film, Proiezione, Recensione, Sala, Posto
+from .models import Film, Proiezione, Recensione, Sala, Posto, StatisticheFilm
 
 admin.site.register(Film)
 admin.site.register(Proiezione)
 admin.site.register(Recensione)
 admin.site.register(Sala)
 admin.site.register(Posto)
+admin.site.register(StatisticheFilm)
 
 # Register your models here.
@@ -0,0 +1,154 @@
+import gzip
+import json
+from collections import defaultdict
+from datetime import timedelta
+from pathlib import Path
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Count, Max, Min, Sum
+from django.utils import timezone
+from sales.models import Biglietto
+from .models import Film, Proiezione, Recensione, StatisticheFilm
+
+# Archiviazione dei dati passati: le tabelle usate dal sito restano piccole.
+# - film senza proiezioni da ARCHIVIO_GIORNI_FILM giorni: film, proiezioni, biglietti e recensioni
+# - proiezioni più vecchie di ARCHIVIO_GIORNI_PROIEZIONI giorni (di film ancora presenti): proiezioni e biglietti
+# Le righe vengono scritte in un file JSONL compresso (una riga per record, {"modello", "dati"}) e poi
+# cancellate, nella stessa transazione in cui i loro totali vengono sommati a StatisticheFilm.
+# Se la transazione fallisce dopo la scrittura, il file può contenere righe ancora presenti nel database:
+# chi reimporta l'archivio deve deduplicare per (modello, id).
+
+
+class FileArchivio:
+    def __init__(self, percorso):
+        self.percorso = Path(percorso)
+        self.righe = 0
+
+    def __enter__(self):
+        self.percorso.parent.mkdir(parents=True, exist_ok=True)
+        self.file = gzip.open(self.percorso, "at", encoding="utf-8")
+        return self
+
+    def __exit__(self, *exc):
+        self.file.close()
+
+    def scrivi(self, modello, righe):
+        for dati in righe:
+            self.file.write(json.dumps({"modello": modello, "dati": dati}, cls=DjangoJSONEncoder) + "\n")
+            self.righe += 1
+
+    def flush(self):
+        # prima di cancellare le righe dal database
+        self.file.flush()
+
+
+def nuovo_file_archivio(cartella=None):
+    cartella = Path(cartella or settings.ARCHIVIO_CARTELLA)
+    return cartella / f"archivio-{timezone.now():%Y%m%d-%H%M%S}.jsonl.gz"
+
+
+def leggi_archivio(percorso):
+    with gzip.open(percorso, "rt", encoding="utf-8") as f:
+        for riga in f:
+            yield json.loads(riga)
+
+
+def _accumula(film_id, titolo, proiezioni, biglietti, recensioni=None):
+    p = proiezioni.aggregate(n=Count("id"), prima=Min("data_ora"), ultima=Max("data_ora"))
+    b = biglietti.aggregate(n=Count("id"), incasso=Sum("prezzo"))
+    r = recensioni.aggregate(n=Count("id"), somma=Sum("valutazione")) if recensioni is not None else {"n": 0, "somma": 0}
+
+    stat, _ = StatisticheFilm.objects.select_for_update().get_or_create(film_id=film_id, defaults={"titolo": titolo})
+    stat.titolo = titolo
+    stat.proiezioni += p["n"]
+    stat.biglietti += b["n"]
+    stat.incasso += b["incasso"] or 0
+    stat.recensioni += r["n"]
+    stat.somma_valutazioni += r["somma"] or 0
+    stat.prima_proiezione = min(filter(None, [stat.prima_proiezione, p["prima"]]), default=None)
+    stat.ultima_proiezione = max(filter(None, [stat.ultima_proiezione, p["ultima"]]), default=None)
+    return stat
+
+
+def film_da_archiviare(giorni, now=None):
+    limite = (now or timezone.now()) - timedelta(days=giorni)
+    return (
+        Film.objects
+        .annotate(ultima=Max("proiezione__data_ora"))
+        .filter(ultima__lt=limite)
+        .order_by("ultima")
+    )
+
+
+def proiezioni_da_archiviare(giorni, now=None):
+    limite = (now or timezone.now()) - timedelta(days=giorni)
+    return Proiezione.objects.filter(data_ora__lt=limite)
+
+
+@transaction.atomic
+def archivia_film(film, archivio):
+    proiezioni = Proiezione.objects.filter(film=film)
+    biglietti = Biglietto.objects.filter(proiezione__film=film)
+    recensioni = Recensione.objects.filter(film=film)
+
+    archivio.scrivi("cinema.film", Film.objects.filter(pk=film.pk).values())
+    archivio.scrivi("cinema.proiezione", proiezioni.values())
+    archivio.scrivi("sales.biglietto", biglietti.values())
+    archivio.scrivi("cinema.recensione", recensioni.values())
+    archivio.flush()
+
+    stat = _accumula(film.pk, film.titolo, proiezioni, biglietti, recensioni)
+    stat.film_archiviato_il = timezone.now()
+    stat.save()
+
+    biglietti.delete()
+    recensioni.delete()
+    proiezioni.delete()
+    Film.objects.filter(pk=film.pk).delete()
+
+
+@transaction.atomic
+def archivia_proiezioni(film_id, titolo, ids, archivio):
+    proiezioni = Proiezione.objects.filter(pk__in=ids)
+    biglietti = Biglietto.objects.filter(proiezione_id__in=ids)
+
+    archivio.scrivi("cinema.proiezione", proiezioni.values())
+    archivio.scrivi("sales.biglietto", biglietti.values())
+    archivio.flush()
+
+    _accumula(film_id, titolo, proiezioni, biglietti).save()
+
+    biglietti.delete()
+    proiezioni.delete()
+
+
+def esegui_archiviazione(archivio, giorni_film, giorni_proiezioni, batch_size=500, now=None):
+    """
+    Archivia prima i film scaduti (con tutti i loro dati, letti a blocchi di batch_size), poi le proiezioni
+    vecchie dei film rimasti, a blocchi di batch_size proiezioni per transazione. Restituisce il numero di film e proiezioni archiviati.
+    """
+    now = now or timezone.now()
+    # gli id prima di tutto: su SQLite non si può cancellare da una tabella mentre la si legge con iterator()
+    # (nessun isolamento tra le query della stessa connessione)
+    film_ids = list(film_da_archiviare(giorni_film, now).values_list("pk", flat=True))
+    film_archiviati = 0
+    for inizio in range(0, len(film_ids), batch_size):
+        for film in Film.objects.filter(pk__in=film_ids[inizio:inizio + batch_size]).order_by("pk"):
+            archivia_film(film, archivio)
+            film_archiviati += 1
+
+    proiezioni_archiviate = 0
+    vecchie = proiezioni_da_archiviare(giorni_proiezioni, now).order_by("film_id", "data_ora")
+    while True:
+        blocco = list(vecchie.values_list("id", "film_id", "film__titolo")[:batch_size])
+        if not blocco:
+            break
+        per_film = defaultdict(list)
+        for proiezione_id, film_id, titolo in blocco:
+            per_film[(film_id, titolo)].append(proiezione_id)
+        for (film_id, titolo), ids in per_film.items():
+            archivia_proiezioni(film_id, titolo, ids, archivio)
+        proiezioni_archiviate += len(blocco)
+
+    return film_archiviati, proiezioni_archiviate
@@ -0,0 +1,86 @@
+import time
+from django.core.cache import cache
+from django.utils import timezone
+
+# Versioni usate come chiave per i dati in cache (frammenti di template, programmazione per giorno, ...).
+# Ogni modifica rilevante assegna una nuova versione (vedi signals.py), così i dati vecchi non vengono
+# più letti e scadono da soli.
+
+CHIAVE_VERSIONE_PROGRAMMAZIONE = "programmazione:versione"
+
+
+def _chiave_versione(film_id):
+    return f"film:{film_id}:versione"
+
+
+def _chiave_versione_giorno(giorno):
+    return f"programmazione:{giorno.isoformat()}:versione"
+
+
+def _nuova_versione():
+    # time_ns e non un contatore: se la chiave viene espulsa dalla cache non si torna a una versione già usata
+    return time.time_ns()
+
+
+def leggi_versioni(chiavi):
+    # una sola lettura dalla cache; le chiavi mancanti ricevono una versione nuova
+    trovate = cache.get_many(chiavi)
+
+    mancanti = {k: _nuova_versione() for k in chiavi if k not in trovate}
+    if mancanti:
+        cache.set_many(mancanti, timeout=None)
+        trovate.update(mancanti)
+
+    return trovate
+
+
+async def aleggi_versioni(chiavi):
+    # come leggi_versioni, per le viste async (API JSON in cinema/views.py)
+    trovate = await cache.aget_many(chiavi)
+
+    mancanti = {k: _nuova_versione() for k in chiavi if k not in trovate}
+    if mancanti:
+        await cache.aset_many(mancanti, timeout=None)
+        trovate.update(mancanti)
+
+    return trovate
+
+
+def versioni_film(film_ids):
+    chiavi = {_chiave_versione(film_id): film_id for film_id in film_ids}
+    trovate = leggi_versioni(list(chiavi))
+    return {film_id: trovate[k] for k, film_id in chiavi.items()}
+
+
+def annota_versioni(films):
+    # una sola lettura dalla cache per tutta la pagina
+    films = list(films)
+    versioni = versioni_film([f.pk for f in films])
+    for film in films:
+        film.versione_cache = versioni[film.pk]
+    return films
+
+
+def invalida_film(film_id):
+    cache.set(_chiave_versione(film_id), _nuova_versione(), timeout=None)
+
+
+async def aversione_giorno(giorno):
+    # la programmazione di un giorno cambia se cambiano le proiezioni (versione globale)
+    # oppure i biglietti di quel giorno (versione del giorno)
+    chiave_giorno = _chiave_versione_giorno(giorno)
+    trovate = await aleggi_versioni([CHIAVE_VERSIONE_PROGRAMMAZIONE, chiave_giorno])
+    return f"{trovate[CHIAVE_VERSIONE_PROGRAMMAZIONE]}.{trovate[chiave_giorno]}"
+
+
+async def aversione_programmazione():
+    return (await aleggi_versioni([CHIAVE_VERSIONE_PROGRAMMAZIONE]))[CHIAVE_VERSIONE_PROGRAMMAZIONE]
+
+
+def invalida_programmazione():
+    cache.set(CHIAVE_VERSIONE_PROGRAMMAZIONE, _nuova_versione(), timeout=None)
+
+
+def invalida_giorno(data_ora):
+    giorno = timezone.localtime(data_ora).date()
+    cache.set(_chiave_versione_giorno(giorno), _nuova_versione(), timeout=None)
@@ -0,0 +1,71 @@
+from datetime import datetime, time, timedelta
+from django.db.models import Max
+from django.utils import timezone
+from .models import Film, Proiezione
+
+# Calendario di una sala: intervalli occupati (inizio, fine film + BUFFER_MINUTI) e spazi liberi.
+# Le stesse regole di Proiezione.clean: una nuova proiezione di durata D entra in uno spazio libero
+# lungo almeno D + BUFFER_MINUTI.
+
+MAX_GIORNI_INTERVALLO = 62
+
+
+def inizio_giorno(giorno):
+    return timezone.make_aware(datetime.combine(giorno, time.min))
+
+
+def _margine(durata_max):
+    # una proiezione iniziata prima di `dal` può ancora occupare la sala: allargo la ricerca
+    # all'indietro della durata massima dei film, poi scarto quelle già finite
+    return timedelta(minutes=(durata_max or 0) + Proiezione.BUFFER_MINUTI)
+
+
+def _righe_impegni(sala_id, dal, al, durata_max):
+    return (
+        Proiezione.objects
+        .filter(sala_id=sala_id, data_ora__gte=dal - _margine(durata_max), data_ora__lt=al)
+        .order_by("data_ora")
+        .values("id", "data_ora", "film_id", "film__titolo", "film__durata_minuti")
+    )
+
+
+def _impegni(righe, dal):
+    impegni = []
+    for r in righe:
+        fine = r["data_ora"] + timedelta(minutes=r["film__durata_minuti"] + Proiezione.BUFFER_MINUTI)
+        if fine <= dal:
+            continue
+        impegni.append({
+            "id": r["id"],
+            "film_id": r["film_id"],
+            "film": r["film__titolo"],
+            "inizio": r["data_ora"],
+            "fine": fine,
+        })
+    return impegni
+
+
+def impegni_sala(sala_id, dal, al):
+    durata_max = Film.objects.aggregate(m=Max("durata_minuti"))["m"]
+    return _impegni(_righe_impegni(sala_id, dal, al, durata_max), dal)
+
+
+async def aimpegni_sala(sala_id, dal, al):
+    # stessa cosa con l'ORM async (viste async sotto ASGI)
+    durata_max = (await Film.objects.aaggregate(m=Max("durata_minuti")))["m"]
+    return _impegni([r async for r in _righe_impegni(sala_id, dal, al, durata_max)], dal)
+
+
+def spazi_liberi(impegni, dal, al, durata_minuti=0):
+    # impegni ordinati per inizio; restituisce gli spazi [inizio, fine) lunghi almeno durata + buffer
+    minimo = timedelta(minutes=durata_minuti + Proiezione.BUFFER_MINUTI) if durata_minuti else timedelta(0)
+
+    liberi = []
+    cursore = dal
+    for impegno in impegni:
+        if impegno["inizio"] > cursore and impegno["inizio"] - cursore >= minimo:
+            liberi.append({"inizio": cursore, "fine": impegno["inizio"]})
+        cursore = max(cursore, impegno["fine"])
+    if al > cursore and al - cursore >= minimo:
+        liberi.append({"inizio": cursore, "fine": al})
+    return liberi
@@ -1,14 +1,17 @@
 from django import forms
 from django.utils import timezone
-from .models import Proiezione, Film, Recensione
+from datetime import time, timedelta
+from .models import Proiezione, Film, Recensione, Sala
 from django.core.exceptions import ValidationError
+from .pianta import leggi_pianta
 
 class ProiezioneForm(forms.ModelForm):
     class Meta:
         model = Proiezione
         fields = [
             "sala", 
-            "data_ora"
+            "data_ora",
+            "sala_attesa",
         ]
         widgets = {
             "sala": forms.Select(attrs={"class": "form-select"}),
@@ -16,6 +19,7 @@ class ProiezioneForm(forms.ModelForm):
                 attrs={"class": "form-control", "type": "datetime-local"},
                 format="%Y-%m-%dT%H:%M",
             ),
+            "sala_attesa": forms.NumberInput(attrs={"class": "form-control", "min": 1}),
         }
         input_formats = ["%Y-%m-%dT%H:%M"]
 
@@ -100,3 +104,55 @@ class RecensioneForm(forms.ModelForm):
         if not (1 <= int(v) <= 5):
             raise forms.ValidationError("La valutazione deve essere compresa tra 1 e 5.")
         return v
+
+
+class PianificazioneForm(forms.Form):
+    dal = forms.DateField(widget=forms.DateInput(attrs={"class": "form-control", "type": "date"}))
+    giorni = forms.IntegerField(min_value=1, max_value=14, initial=7, widget=forms.NumberInput(attrs={"class": "form-control"}))
+    apertura = forms.TimeField(initial=time(15, 0), widget=forms.TimeInput(attrs={"class": "form-control", "type": "time"}, format="%H:%M"))
+    chiusura = forms.TimeField(initial=time(23, 59), widget=forms.TimeInput(attrs={"class": "form-control", "type": "time"}, format="%H:%M"))
+    passo = forms.TypedChoiceField(
+        label="Orari ogni (minuti)", coerce=int, initial=15,
+        choices=[(5, "5"), (10, "10"), (15, "15"), (30, "30")],
+        widget=forms.Select(attrs={"class": "form-select"}),
+    )
+    sale = forms.ModelMultipleChoiceField(queryset=Sala.objects.order_by("nome"), widget=forms.CheckboxSelectMultiple)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if not self.is_bound:
+            self.initial.setdefault("dal", timezone.localdate() + timedelta(days=1))
+            self.initial.setdefault("sale", list(Sala.objects.values_list("pk", flat=True)))
+
+        # un campo per ogni film che può andare in programmazione: quante proiezioni nel periodo
+        self.films = list(Film.objects.filter(in_programmazione__isnull=False).order_by("titolo"))
+        for film in self.films:
+            self.fields[f"film_{film.pk}"] = forms.IntegerField(
+                label=f"{film.titolo} ({film.durata_minuti} min)",
+                min_value=0, initial=0, required=False,
+                widget=forms.NumberInput(attrs={"class": "form-control form-control-sm"}),
+            )
+
+    def campi_film(self):
+        return [self[f"film_{film.pk}"] for film in self.films]
+
+    def richieste(self):
+        return [(film, self.cleaned_data.get(f"film_{film.pk}") or 0) for film in self.films]
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if self.films and not any(n for _, n in self.richieste()):
+            raise ValidationError("Indica almeno un film con il numero di proiezioni da programmare.")
+        return cleaned_data
+
+
+class PiantaSalaForm(forms.Form):
+    nome = forms.CharField(label="Nome sala", max_length=50, widget=forms.TextInput(attrs={"class": "form-control"}))
+    pianta = forms.CharField(
+        widget=forms.Textarea(attrs={"class": "form-control font-monospace", "rows": 16, "spellcheck": "false"}),
+        help_text="Una fila per riga, es. \"A: oooo.oooo\". o = standard, p = premium, a = accessibile, . = corridoio, _ = vuoto.",
+    )
+
+    def clean_pianta(self):
+        # restituisce già i posti letti dalla pianta (ValidationError con la riga che non va)
+        return leggi_pianta(self.cleaned_data["pianta"])
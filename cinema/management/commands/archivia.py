@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from sales.models import Biglietto
+from cinema.archivio import (
+    FileArchivio, esegui_archiviazione, film_da_archiviare, nuovo_file_archivio, proiezioni_da_archiviare,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Sposta in un archivio JSONL compresso i film senza proiezioni da tempo (con proiezioni, biglietti e recensioni) "
+        "e le proiezioni vecchie, mantenendone i totali in StatisticheFilm."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--giorni-film", type=int, default=settings.ARCHIVIO_GIORNI_FILM,
+                            help=f"Giorni dall'ultima proiezione dopo cui un film viene archiviato (default: {settings.ARCHIVIO_GIORNI_FILM}).")
+        parser.add_argument("--giorni-proiezioni", type=int, default=settings.ARCHIVIO_GIORNI_PROIEZIONI,
+                            help=f"Età oltre cui una proiezione viene archiviata (default: {settings.ARCHIVIO_GIORNI_PROIEZIONI}).")
+        parser.add_argument("--batch", type=int, default=500, help="Proiezioni per transazione e film letti per blocco (default: 500).")
+        parser.add_argument("--cartella", default=None, help="Cartella dell'archivio (default: ARCHIVIO_CARTELLA).")
+        parser.add_argument("--dry-run", action="store_true", help="Mostra cosa verrebbe archiviato senza modificare nulla.")
+
+    def handle(self, *args, **options):
+        giorni_film, giorni_proiezioni = options["giorni_film"], options["giorni_proiezioni"]
+        if giorni_film < 1 or giorni_proiezioni < giorni_film or options["batch"] < 1:
+            raise CommandError("Servono --giorni-film >= 1, --giorni-proiezioni >= --giorni-film e --batch >= 1.")
+
+        if options["dry_run"]:
+            film = film_da_archiviare(giorni_film)
+            proiezioni = proiezioni_da_archiviare(giorni_proiezioni).exclude(film__in=film)
+            self.stdout.write(f"Film da archiviare: {film.count()}")
+            self.stdout.write(f"Proiezioni vecchie di altri film: {proiezioni.count()} "
+                              f"({Biglietto.objects.filter(proiezione__in=proiezioni).count()} biglietti)")
+            return
+
+        percorso = nuovo_file_archivio(options["cartella"])
+        with FileArchivio(percorso) as archivio:
+            film, proiezioni = esegui_archiviazione(archivio, giorni_film, giorni_proiezioni, options["batch"])
+
+        if not archivio.righe:
+            percorso.unlink(missing_ok=True)
+            self.stdout.write("Niente da archiviare.")
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Archiviati {film} film e {proiezioni} proiezioni di altri film ({archivio.righe} righe) in {percorso}."
+        ))
@@ -0,0 +1,70 @@
+from datetime import timedelta
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_time
+from cinema.models import Film, Sala
+from cinema.pianificatore import pianifica, salva_pianificazione
+
+
+class Command(BaseCommand):
+    help = "Propone (e con --salva crea) le proiezioni di un periodo: film con il numero di proiezioni desiderate, sale e orari di apertura."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dal", help="Primo giorno YYYY-MM-DD (default: domani).")
+        parser.add_argument("--giorni", type=int, default=7, help="Quanti giorni pianificare (default: 7).")
+        parser.add_argument(
+            "--film", action="append", default=[], metavar="ID:N",
+            help="Film e numero di proiezioni nel periodo, ripetibile (es. --film 3:10 --film 5:6).",
+        )
+        parser.add_argument("--sala", type=int, action="append", default=[], help="Id sala, ripetibile (default: tutte).")
+        parser.add_argument("--apertura", default="15:00", help="Orario del primo spettacolo (default: 15:00).")
+        parser.add_argument("--chiusura", default="23:59", help="Entro quando finisce l'ultimo film (default: 23:59).")
+        parser.add_argument("--passo", type=int, default=15, help="Gli spettacoli iniziano a multipli di questi minuti (default: 15).")
+        parser.add_argument("--salva", action="store_true", help="Crea le proiezioni proposte.")
+
+    def handle(self, *args, **options):
+        dal = parse_date(options["dal"]) if options["dal"] else timezone.localdate() + timedelta(days=1)
+        apertura = parse_time(options["apertura"])
+        chiusura = parse_time(options["chiusura"])
+        if not dal or not apertura or not chiusura:
+            raise CommandError("Date o orari non validi.")
+        if options["giorni"] < 1 or options["passo"] < 1:
+            raise CommandError("--giorni e --passo devono essere positivi.")
+
+        richieste = []
+        for voce in options["film"]:
+            try:
+                film_id, n = (int(x) for x in voce.split(":"))
+                richieste.append((Film.objects.get(pk=film_id), n))
+            except (ValueError, Film.DoesNotExist):
+                raise CommandError(f"Film non valido: {voce} (formato ID:N)")
+        if not richieste:
+            raise CommandError("Indica almeno un film con --film ID:N.")
+
+        sale = Sala.objects.order_by("nome")
+        if options["sala"]:
+            sale = sale.filter(pk__in=options["sala"])
+        sale = list(sale)
+        if not sale:
+            raise CommandError("Nessuna sala.")
+
+        proposte, mancanti = pianifica(
+            richieste, sale, dal, options["giorni"], apertura, chiusura, passo_minuti=options["passo"],
+        )
+
+        for p in proposte:
+            inizio = timezone.localtime(p["inizio"])
+            self.stdout.write(f"{inizio:%a %d/%m %H:%M}  {p['sala'].nome:<10} {p['film'].titolo}")
+        for film, n in mancanti.items():
+            self.stdout.write(self.style.WARNING(f"Senza spazio: {film.titolo} ({n} proiezioni)"))
+
+        if not options["salva"]:
+            self.stdout.write(self.style.NOTICE(f"{len(proposte)} proiezioni proposte (usa --salva per crearle)."))
+            return
+
+        try:
+            create = salva_pianificazione(proposte)
+        except ValidationError as e:
+            raise CommandError(f"Pianificazione non salvata: {' '.join(e.messages)}")
+        self.stdout.write(self.style.SUCCESS(f"Create {len(create)} proiezioni."))
@@ -0,0 +1,56 @@
+import sys
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from cinema.models import Sala
+from cinema.pianta import applica_pianta, confronta_pianta, esporta_pianta, leggi_pianta
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa la pianta di una sala da un file di testo o JSON (vedi cinema/pianta.py) "
+        "e allinea i posti con poche query bulk; la sala viene creata se non esiste."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("sala", help="Nome della sala.")
+        parser.add_argument("file", nargs="?", default="-", help="File della pianta (default: standard input).")
+        parser.add_argument("--dry-run", action="store_true", help="Mostra le differenze senza modificare i posti.")
+        parser.add_argument("--esporta", action="store_true", help="Stampa la pianta attuale della sala ed esce.")
+
+    def handle(self, *args, **options):
+        sala = Sala.objects.filter(nome=options["sala"]).first()
+
+        if options["esporta"]:
+            if sala is None:
+                raise CommandError(f"La sala '{options['sala']}' non esiste.")
+            self.stdout.write(esporta_pianta(sala))
+            return
+
+        try:
+            if options["file"] == "-":
+                testo = sys.stdin.read()
+            else:
+                with open(options["file"], encoding="utf-8") as f:
+                    testo = f.read()
+        except OSError as e:
+            raise CommandError(f"Impossibile leggere la pianta: {e}")
+
+        try:
+            posti = leggi_pianta(testo)
+            if options["dry_run"]:
+                modifiche = confronta_pianta(sala, posti)
+            else:
+                with transaction.atomic():
+                    if sala is None:
+                        sala = Sala.objects.create(nome=options["sala"])
+                    modifiche = applica_pianta(sala, posti)
+        except ValidationError as e:
+            raise CommandError("Pianta non valida: " + " ".join(e.messages))
+
+        prefisso = "[dry-run] " if options["dry_run"] else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefisso}{options['sala']}: {len(posti)} posti nella pianta, {len(modifiche['nuovi'])} nuovi, "
+            f"{len(modifiche['modificati'])} modificati, {len(modifiche['rimossi'])} tolti, "
+            f"{modifiche['invariati']} invariati."
+        ))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from cinepiu.precompila import precompila_template
+
+
+class Command(BaseCommand):
+    help = "Compila (e con il loader in cache mette in memoria) tutti i template del progetto, riportando il tempo di compilazione di ciascuno."
+
+    def handle(self, *args, **options):
+        risultati = precompila_template()
+        errori = [r for r in risultati if r[2]]
+
+        # i più lenti per primi
+        for nome, ms, errore in sorted(risultati, key=lambda r: r[1], reverse=True):
+            if errore:
+                self.stdout.write(self.style.ERROR(f"{ms:8.2f} ms  {nome}  ERRORE: {errore}"))
+            else:
+                self.stdout.write(f"{ms:8.2f} ms  {nome}")
+
+        totale = sum(r[1] for r in risultati)
+        self.stdout.write(self.style.SUCCESS(f"{len(risultati)} template compilati in {totale:.2f} ms."))
+
+        if errori:
+            raise CommandError(f"{len(errori)} template non compilano.")
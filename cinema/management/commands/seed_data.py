@@ -1,13 +1,15 @@
 from __future__ import annotations
 import random
-from datetime import timedelta
+from datetime import time, timedelta
+from decimal import Decimal
 from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group, Permission
 from django.db import transaction
 from django.utils import timezone
 from cinema.models import Film, Sala, Posto, Proiezione
-from sales.models import Biglietto
+from cinema.pianta import applica_pianta, leggi_pianta
+from sales.models import Biglietto, Tariffa
 
 
 class Command(BaseCommand):
@@ -47,6 +49,9 @@ class Command(BaseCommand):
         self.stdout.write(self.style.NOTICE("Creazione sale + posti..."))
         sale = self._crea_sale_e_posti()
 
+        self.stdout.write(self.style.NOTICE("Creazione tariffe..."))
+        self._crea_tariffe()
+
         self.stdout.write(self.style.NOTICE("Creazione film..."))
         films = self._crea_film()
 
@@ -124,22 +129,28 @@ class Command(BaseCommand):
         sala1, _ = Sala.objects.get_or_create(nome="Sala 1")
         sala2, _ = Sala.objects.get_or_create(nome="Sala 2")
 
-        def gen_posti(sala, righe=10, posti_per_riga=12):
-            for i in range(righe):
-                fila = chr(ord("A") + i)  # A, B, C...
-                for n in range(1, posti_per_riga + 1):
-                    Posto.objects.get_or_create(
-                        sala=sala,
-                        fila=fila,
-                        numero_posto=str(n),
-                    )
-
-        gen_posti(sala1, righe=10, posti_per_riga=12)
-        gen_posti(sala2, righe=8, posti_per_riga=10)
+        # piante delle sale (formato in cinema/pianta.py): posti creati/aggiornati in blocco
+        applica_pianta(sala1, leggi_pianta(
+            "\n".join(["_oooooo.oooooo_"] * 7 + ["_pppppp.pppppp_"] * 2 + ["aa_oooo.oooo_aa"])
+        ))
+        applica_pianta(sala2, leggi_pianta(
+            "\n".join(["_ooooo.ooooo_"] * 7 + ["aa_ooo.ooo_aa"])
+        ))
 
         return [sala1, sala2]
 
 
+    def _crea_tariffe(self):
+        # oltre al prezzo base (PREZZO_BASE): posti premium, serate del weekend e rassegna
+        tariffe = [
+            {"nome": "Premium", "prezzo": Decimal("10.00"), "categoria": Posto.Categoria.PREMIUM, "priorita": 20},
+            {"nome": "Weekend sera", "prezzo": Decimal("9.00"), "giorni_settimana": "45", "ora_da": time(20, 0), "priorita": 10},
+            {"nome": "Rassegna", "prezzo": Decimal("6.00"), "sconto_socio": Decimal("1.00"), "rassegna": True, "priorita": 30},
+        ]
+        for dati in tariffe:
+            Tariffa.objects.get_or_create(nome=dati.pop("nome"), defaults=dati)
+
+
     def _crea_film(self):
         data = [
             {
@@ -272,7 +283,7 @@ class Command(BaseCommand):
 
         for p in random.sample(proiezioni, k=min(5, len(proiezioni))):
             # prendo 3 posti random della sala della proiezione
-            posti = list(Posto.objects.filter(sala=p.sala))
+            posti = list(Posto.objects.filter(sala=p.sala, attivo=True))
             random.shuffle(posti)
 
 
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:52
+
+from datetime import datetime, time, timedelta
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F, Value
+from django.db.models.functions import Least
+
+# Margine oltre la finestra di default del digest (7 giorni): le righe già esistenti non devono
+# risultare novità al primo digest dopo la migrazione
+MARGINE = timedelta(days=30)
+
+
+def retrodata(apps, schema_editor):
+    # AddField assegna a tutte le righe esistenti l'ora della migrazione: si retrodatano a un momento
+    # passato plausibile, mai nel futuro
+    Film = apps.get_model("cinema", "Film")
+    Proiezione = apps.get_model("cinema", "Proiezione")
+    limite = django.utils.timezone.now() - MARGINE
+
+    Proiezione.objects.update(creato_il=Least(F("data_ora") - MARGINE, Value(limite)))
+
+    films = list(Film.objects.only("id", "in_programmazione", "uscita_locale"))
+    for film in films:
+        giorni = [g for g in (film.in_programmazione, film.uscita_locale) if g]
+        prima = django.utils.timezone.make_aware(datetime.combine(min(giorni), time())) if giorni else limite
+        film.aggiornato_il = min(prima, limite)
+    Film.objects.bulk_update(films, ["aggiornato_il"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinema', '0003_alter_recensione_options_recensione_create_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='film',
+            name='aggiornato_il',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='proiezione',
+            name='creato_il',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='film',
+            name='in_programmazione',
+            field=models.DateField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(retrodata, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinema', '0004_film_aggiornato_il_proiezione_creato_il'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatisticheFilm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('film_id', models.PositiveBigIntegerField(unique=True)),
+                ('titolo', models.CharField(max_length=200)),
+                ('proiezioni', models.PositiveIntegerField(default=0)),
+                ('biglietti', models.PositiveIntegerField(default=0)),
+                ('incasso', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('recensioni', models.PositiveIntegerField(default=0)),
+                ('somma_valutazioni', models.PositiveIntegerField(default=0)),
+                ('prima_proiezione', models.DateTimeField(blank=True, null=True)),
+                ('ultima_proiezione', models.DateTimeField(blank=True, null=True)),
+                ('film_archiviato_il', models.DateTimeField(blank=True, null=True)),
+                ('aggiornato_il', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Statistiche film',
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinema', '0005_statistichefilm'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='proiezione',
+            index=models.Index(fields=['data_ora'], name='proiezione_data_ora_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='proiezione',
+            index=models.Index(fields=['film', 'data_ora'], name='proiezione_film_data_idx'),
+        ),
+    ]
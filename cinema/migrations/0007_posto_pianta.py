@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:21
+
+from django.db import migrations, models
+
+
+def posizioni_esistenti(apps, schema_editor):
+    # i posti creati prima della pianta: riga dall'ordine delle file, colonna dal numero del posto
+    Posto = apps.get_model("cinema", "Posto")
+    posti = list(Posto.objects.order_by("sala_id", "fila", "id"))
+    file = {}
+    for posto in posti:
+        righe = file.setdefault(posto.sala_id, {})
+        posto.riga = righe.setdefault(posto.fila, len(righe) + 1)
+        posto.colonna = int(posto.numero_posto) if posto.numero_posto.isdigit() else 0
+    Posto.objects.bulk_update(posti, ["riga", "colonna"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinema', '0006_proiezione_proiezione_data_ora_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='posto',
+            name='attivo',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='posto',
+            name='categoria',
+            field=models.CharField(choices=[('STD', 'Standard'), ('PRE', 'Premium'), ('ACC', 'Accessibile')], default='STD', max_length=3),
+        ),
+        migrations.AddField(
+            model_name='posto',
+            name='colonna',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='posto',
+            name='riga',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.RunPython(posizioni_esistenti, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinema', '0007_posto_pianta'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='proiezione',
+            name='sala_attesa',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='Clienti ammessi contemporaneamente alla scelta dei posti (vuoto = senza coda).', null=True, verbose_name="sala d'attesa"),
+        ),
+    ]
@@ -17,7 +17,8 @@ class Film(models.Model):
     trailer_url = models.URLField(blank=True, null=True)
     rassegna = models.BooleanField(default=False) #Booleano che indica se un film appartiene alla rassegna
     uscita_locale = models.DateField(blank=True, null=True) #Indica qunado il film uscirà nel nostro cinema (non ci sono controlli, quindi un film potrebbe uscire in una data precedente al giorno della prima proiezione)
-    in_programmazione = models.DateField(blank=True, null=True) #Indica quando un film passa nella sezione "Programmazione" del sito e diventa in prenotabile
+    in_programmazione = models.DateField(blank=True, null=True, db_index=True) #Indica quando un film passa nella sezione "Programmazione" del sito e diventa in prenotabile
+    aggiornato_il = models.DateTimeField(auto_now=True, db_index=True) #Ultima modifica, usata per costruire il digest della newsletter in modo incrementale
 
     #Trasforma un URL normale in un URL embed
     @property
@@ -83,13 +84,34 @@ class Film(models.Model):
 
 
 
+class ProiezioneQuerySet(models.QuerySet):
+    def future(self, now=None):
+        # la parte "viva" della tabella: proiezioni non ancora iniziate
+        return self.filter(data_ora__gte=now or timezone.now())
+
+
+class ProiezioniFutureManager(models.Manager.from_queryset(ProiezioneQuerySet)):
+    def get_queryset(self):
+        return super().get_queryset().future()
+
+
 class Proiezione(models.Model):
     film = models.ForeignKey(Film, on_delete=models.PROTECT)
     sala = models.ForeignKey('Sala', on_delete=models.PROTECT)
     data_ora = models.DateTimeField()
+    creato_il = models.DateTimeField(auto_now_add=True, db_index=True)
+    # proiezioni molto richieste: quanti clienti possono scegliere i posti insieme, gli altri
+    # aspettano il proprio turno (vedi sales/ammissione.py). Vuoto = nessuna sala d'attesa
+    sala_attesa = models.PositiveSmallIntegerField(
+        null=True, blank=True, verbose_name="sala d'attesa",
+        help_text="Clienti ammessi contemporaneamente alla scelta dei posti (vuoto = senza coda).",
+    )
 
     BUFFER_MINUTI = 15  # tempo minimo tra un film e l'altro
 
+    objects = ProiezioneQuerySet.as_manager()  # resta il manager di default (admin, relazioni, dumpdata)
+    future = ProiezioniFutureManager()
+
     def clean(self):
         errors = {}
 
@@ -140,6 +162,12 @@ class Proiezione(models.Model):
                 name="uniq_proiezione_sala_orario"
             )
         ]
+        # l'indice del vincolo (sala, data_ora) copre già le query per sala;
+        # questi servono alle query per intervallo di date e per film
+        indexes = [
+            models.Index(fields=["data_ora"], name="proiezione_data_ora_idx"),
+            models.Index(fields=["film", "data_ora"], name="proiezione_film_data_idx"),
+        ]
 
     def __str__(self):
         return f"{self.film.titolo} - {self.data_ora} in {self.sala}"
@@ -164,6 +192,32 @@ class Recensione(models.Model):
 
 
 
+class StatisticheFilm(models.Model):
+    # totali dei dati archiviati (vedi cinema/archivio.py): restano anche quando film, proiezioni,
+    # biglietti e recensioni vengono tolti dalle tabelle. Totale di un film = dati presenti + questi.
+    film_id = models.PositiveBigIntegerField(unique=True) # non una FK: il film può essere già stato archiviato
+    titolo = models.CharField(max_length=200)
+    proiezioni = models.PositiveIntegerField(default=0)
+    biglietti = models.PositiveIntegerField(default=0)
+    incasso = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    recensioni = models.PositiveIntegerField(default=0)
+    somma_valutazioni = models.PositiveIntegerField(default=0)
+    prima_proiezione = models.DateTimeField(null=True, blank=True)
+    ultima_proiezione = models.DateTimeField(null=True, blank=True)
+    film_archiviato_il = models.DateTimeField(null=True, blank=True) # valorizzato quando viene archiviato anche il film
+    aggiornato_il = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Statistiche film"
+
+    @property
+    def valutazione_media(self):
+        return self.somma_valutazioni / self.recensioni if self.recensioni else None
+
+    def __str__(self):
+        return f"Statistiche {self.titolo}"
+
+
 class Sala(models.Model):
     nome = models.CharField(max_length=50)
 
@@ -177,9 +231,19 @@ class Sala(models.Model):
 
 
 class Posto(models.Model):
+    class Categoria(models.TextChoices):
+        STANDARD = "STD", "Standard"
+        PREMIUM = "PRE", "Premium"
+        ACCESSIBILE = "ACC", "Accessibile"
+
     sala = models.ForeignKey(Sala, on_delete=models.CASCADE)
     numero_posto = models.CharField(max_length=10)
     fila = models.CharField(max_length=5)
+    # posizione nella pianta della sala (cinema/pianta.py): le colonne senza posto sono corridoi o spazi vuoti
+    riga = models.PositiveSmallIntegerField(default=0)
+    colonna = models.PositiveSmallIntegerField(default=0)
+    categoria = models.CharField(max_length=3, choices=Categoria.choices, default=Categoria.STANDARD)
+    attivo = models.BooleanField(default=True) # i posti tolti dalla pianta restano per lo storico dei biglietti
 
     class Meta:
         verbose_name_plural = "Posti"
@@ -0,0 +1,113 @@
+import math
+from datetime import datetime, timedelta
+from django.db import transaction
+from django.utils import timezone
+from .calendario import impegni_sala, inizio_giorno
+from .models import Proiezione
+
+# Pianificatore della settimana: dati i film con il numero di proiezioni desiderate, le sale,
+# l'orario di apertura e i vincoli di Proiezione.clean (uscita_locale, durata + BUFFER_MINUTI,
+# nessuna sovrapposizione in sala), propone un palinsesto valido.
+#
+# Algoritmo greedy di interval packing, giorno per giorno:
+# - ogni film ha una quota giornaliera = proiezioni mancanti / giorni rimanenti (arrotondata per eccesso),
+#   così le proiezioni si distribuiscono sulla settimana invece di finire tutte nei primi giorni;
+# - per ogni sala si scorre la giornata dall'apertura: nel primo orario libero si mette il film
+#   con più quota residua che ci sta (a parità, il più lungo: riempie meglio gli spazi);
+# - gli impegni già presenti in sala sono intervalli occupati da saltare.
+# Costo O(giorni * sale * proiezioni_per_sala * film).
+
+
+def _arrotonda(dt, passo_minuti):
+    # porta dt al primo multiplo di passo_minuti (ora locale) non precedente
+    locale = timezone.localtime(dt)
+    mezzanotte = locale.replace(hour=0, minute=0, second=0, microsecond=0)
+    minuti = math.ceil((locale - mezzanotte).total_seconds() / 60 / passo_minuti) * passo_minuti
+    return mezzanotte + timedelta(minutes=minuti)
+
+
+def _orari_giorno(giorno, apertura, chiusura):
+    inizio = timezone.make_aware(datetime.combine(giorno, apertura))
+    fine = timezone.make_aware(datetime.combine(giorno, chiusura))
+    if fine <= inizio:  # chiusura dopo mezzanotte
+        fine += timedelta(days=1)
+    return inizio, fine
+
+
+def pianifica(richieste, sale, dal, giorni, apertura, chiusura, passo_minuti=15):
+    """
+    richieste: [(film, proiezioni desiderate)]; sale: [Sala]; dal: date; apertura/chiusura: time.
+    Restituisce (proposte, mancanti): proposte = [{"film", "sala", "inizio", "fine"}] ordinate,
+    mancanti = {film: proiezioni che non è stato possibile inserire}.
+    """
+    buffer = timedelta(minutes=Proiezione.BUFFER_MINUTI)
+    now = timezone.now()
+    rimanenti = {film: n for film, n in richieste if n > 0}
+    proposte = []
+
+    al = inizio_giorno(dal + timedelta(days=giorni + 1))
+    occupati = {sala.pk: impegni_sala(sala.pk, inizio_giorno(dal), al) for sala in sale}
+
+    for indice in range(giorni):
+        giorno = dal + timedelta(days=indice)
+        giorni_rimanenti = giorni - indice
+        quota = {
+            film: math.ceil(n / giorni_rimanenti)
+            for film, n in rimanenti.items()
+            if n > 0 and (film.uscita_locale is None or film.uscita_locale <= giorno)
+        }
+        apre, chiude = _orari_giorno(giorno, apertura, chiusura)
+
+        for sala in sale:
+            intervalli = sorted(
+                [(i["inizio"], i["fine"]) for i in occupati[sala.pk]],
+                key=lambda i: i[0],
+            )
+            cursore = _arrotonda(max(apre, now), passo_minuti)
+
+            while cursore < chiude:
+                # se il cursore cade in un intervallo occupato salto alla sua fine
+                dentro = next(((a, b) for a, b in intervalli if a <= cursore < b), None)
+                if dentro:
+                    cursore = _arrotonda(dentro[1], passo_minuti)
+                    continue
+
+                prossimo = min((a for a, _ in intervalli if a > cursore), default=None)
+                limite = min(prossimo, chiude + buffer) if prossimo else chiude + buffer
+
+                candidati = [
+                    film for film, q in quota.items()
+                    if q > 0
+                    and cursore + timedelta(minutes=film.durata_minuti) <= chiude  # il film finisce entro la chiusura
+                    and cursore + timedelta(minutes=film.durata_minuti) + buffer <= limite
+                ]
+                if not candidati:
+                    if prossimo is None:
+                        break
+                    cursore = prossimo  # il prossimo giro salta alla fine dell'impegno
+                    continue
+
+                film = max(candidati, key=lambda f: (quota[f], f.durata_minuti, -f.pk))
+                fine = cursore + timedelta(minutes=film.durata_minuti) + buffer
+                proposte.append({"film": film, "sala": sala, "inizio": cursore, "fine": fine})
+                intervalli.append((cursore, fine))
+                quota[film] -= 1
+                rimanenti[film] -= 1
+                cursore = _arrotonda(fine, passo_minuti)
+
+    proposte.sort(key=lambda p: (p["inizio"], p["sala"].nome))
+    mancanti = {film: n for film, n in rimanenti.items() if n > 0}
+    return proposte, mancanti
+
+
+@transaction.atomic
+def salva_pianificazione(proposte):
+    # ogni proiezione passa comunque da Proiezione.clean: se qualcosa è cambiato nel frattempo
+    # viene sollevata ValidationError e non si salva nulla
+    create = []
+    for p in proposte:
+        proiezione = Proiezione(film=p["film"], sala=p["sala"], data_ora=p["inizio"])
+        proiezione.clean()
+        proiezione.save()
+        create.append(proiezione)
+    return create
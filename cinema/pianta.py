@@ -0,0 +1,223 @@
+import json
+from operator import attrgetter, itemgetter
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+from sales.models import Biglietto
+from .cache import invalida_programmazione
+from .models import Posto
+
+# Pianta di una sala in formato testo compatto, una riga per fila (lo schermo è in alto):
+#
+#   # commento
+#   A: oooooo.oooooo
+#   B: _ooooo.ooooo_
+#   J: aa_ppp.ppp_aa
+#
+# o = posto standard, p = premium, a = accessibile (spazio carrozzina),
+# . = corridoio, _ = spazio vuoto. L'etichetta "A:" è facoltativa: senza, le file prendono
+# le lettere successive. I posti sono numerati da sinistra, saltando corridoi e spazi vuoti.
+# Lo stesso schema in JSON: [{"fila": "A", "schema": "ooo.ooo"}, "ooo.ooo", ...]
+# (oppure {"file": [...]}).
+#
+# applica_pianta confronta la pianta con i posti della sala per (fila, numero) e scrive solo le
+# differenze: una bulk_create per i posti nuovi e una bulk_update per quelli spostati, cambiati
+# o tolti, nella stessa transazione. I posti tolti non si cancellano (i biglietti li referenziano
+# con PROTECT), diventano attivo=False.
+
+CATEGORIE = {
+    "o": Posto.Categoria.STANDARD,
+    "p": Posto.Categoria.PREMIUM,
+    "a": Posto.Categoria.ACCESSIBILE,
+}
+SIMBOLI = {categoria: simbolo for simbolo, categoria in CATEGORIE.items()}
+CORRIDOIO, VUOTO = ".", "_"
+
+CAMPI_PIANTA = ["riga", "colonna", "categoria", "attivo"]
+
+
+def _etichetta(indice):
+    # 0 -> A, 25 -> Z, 26 -> AA
+    etichetta = ""
+    indice += 1
+    while indice:
+        indice, resto = divmod(indice - 1, 26)
+        etichetta = chr(ord("A") + resto) + etichetta
+    return etichetta
+
+
+def _file_da_testo(testo):
+    file = []
+    for numero, linea in enumerate(testo.splitlines(), start=1):
+        linea = linea.split("#", 1)[0].strip()
+        if not linea:
+            continue
+        fila, _, schema = linea.rpartition(":")
+        file.append((fila.strip() or None, schema.strip(), f"riga {numero}"))
+    return file
+
+
+def _file_da_json(testo):
+    try:
+        dati = json.loads(testo)
+    except ValueError as e:
+        raise ValidationError(f"JSON non valido: {e}")
+    if isinstance(dati, dict):
+        dati = dati.get("file")
+    if not isinstance(dati, list):
+        raise ValidationError('Il JSON deve essere una lista di file (o un oggetto con la chiave "file").')
+
+    file = []
+    for i, elemento in enumerate(dati, start=1):
+        if isinstance(elemento, str):
+            elemento = {"schema": elemento}
+        if not isinstance(elemento, dict) or not isinstance(elemento.get("schema"), str):
+            raise ValidationError(f'Fila {i}: serve una stringa o un oggetto con "schema".')
+        file.append((elemento.get("fila") or None, elemento["schema"], f"fila {i}"))
+    return file
+
+
+def leggi_pianta(testo):
+    """Restituisce i posti della pianta: [{"fila", "numero_posto", "riga", "colonna", "categoria"}]."""
+    testo = (testo or "").strip()
+    file = _file_da_json(testo) if testo.startswith(("[", "{")) else _file_da_testo(testo)
+
+    posti, errori, etichette = [], [], set()
+    for riga, (fila, schema, dove) in enumerate(file, start=1):
+        fila = fila or _etichetta(riga - 1)
+        if len(fila) > Posto._meta.get_field("fila").max_length:
+            errori.append(f"{dove}: etichetta '{fila}' troppo lunga.")
+        if fila in etichette:
+            errori.append(f"{dove}: la fila '{fila}' è ripetuta.")
+        etichette.add(fila)
+
+        numero = 0
+        for colonna, simbolo in enumerate(schema, start=1):
+            if simbolo in (CORRIDOIO, VUOTO, " "):
+                continue
+            if simbolo.lower() not in CATEGORIE:
+                errori.append(f"{dove}: simbolo '{simbolo}' non valido (usa o, p, a, '.', '_').")
+                continue
+            numero += 1
+            posti.append({
+                "fila": fila,
+                "numero_posto": str(numero),
+                "riga": riga,
+                "colonna": colonna,
+                "categoria": CATEGORIE[simbolo.lower()],
+            })
+
+    if errori:
+        raise ValidationError(errori)
+    if not posti:
+        raise ValidationError("La pianta non contiene posti.")
+    return posti
+
+
+def esporta_pianta(sala):
+    """Pianta in formato testo dei posti attivi della sala (le colonne vuote in tutte le file sono corridoi)."""
+    posti = list(Posto.objects.filter(sala=sala, attivo=True).order_by("riga", "fila", "colonna"))
+    if not posti:
+        return ""
+    colonne = max(p.colonna for p in posti)
+    occupate = {p.colonna for p in posti}
+
+    file = {}
+    for p in posti:
+        file.setdefault((p.riga, p.fila), {})[p.colonna] = SIMBOLI.get(p.categoria, "o")
+
+    righe = []
+    for (_, fila), celle in file.items():
+        schema = "".join(
+            celle.get(c) or (VUOTO if c in occupate else CORRIDOIO)
+            for c in range(1, colonne + 1)
+        ).rstrip(CORRIDOIO + VUOTO)
+        righe.append(f"{fila}: {schema}")
+    return "\n".join(righe)
+
+
+def griglia(posti):
+    """
+    Dispone i posti (oggetti o dict con fila, numero_posto, riga e colonna) in file di celle allineate
+    per colonna, con None al posto di corridoi e spazi vuoti. Restituisce (numero di colonne, [{"fila", "celle"}]).
+    I posti senza colonna (creati fuori dalla pianta) vengono messi in fila dopo gli altri.
+    """
+    posti = list(posti)
+    campi = ("riga", "fila", "colonna", "numero_posto")
+    leggi = itemgetter(*campi) if posti and isinstance(posti[0], dict) else attrgetter(*campi)
+
+    file = {}
+    for posto in posti:
+        riga, fila, colonna, numero = leggi(posto)
+        file.setdefault((riga, fila), []).append((colonna, numero, posto))
+
+    posizioni, colonne = [], 0
+    for (_, fila), posti_fila in sorted(file.items(), key=lambda f: f[0]):
+        if not all(colonna for colonna, _, _ in posti_fila):
+            # senza colonna: dopo gli altri, in ordine di numero, ognuno nella cella successiva
+            posti_fila.sort(key=lambda c: (not c[0], c[0], int(c[1]) if c[1].isdigit() else 0, c[1]))
+            ultima = 0
+            for i, (colonna, numero, posto) in enumerate(posti_fila):
+                ultima = colonna or ultima + 1
+                posti_fila[i] = (ultima, numero, posto)
+        colonne = max(colonne, max(colonna for colonna, _, _ in posti_fila))
+        posizioni.append((fila, posti_fila))
+
+    righe = []
+    for fila, posti_fila in posizioni:
+        celle = [None] * colonne
+        for colonna, _, posto in posti_fila:
+            celle[colonna - 1] = posto
+        righe.append({"fila": fila, "celle": celle})
+    return colonne, righe
+
+
+def confronta_pianta(sala, posti, blocca=False):
+    """Differenze tra la pianta e i posti della sala: {"nuovi", "modificati", "rimossi", "invariati"}."""
+    qs = Posto.objects.filter(sala=sala)
+    if blocca:
+        qs = qs.select_for_update()  # come in prenota: nessuna modifica concorrente ai posti della sala
+    esistenti = {(p.fila, p.numero_posto): p for p in qs}
+    nuovi, modificati, invariati = [], [], 0
+
+    for dati in posti:
+        posto = esistenti.pop((dati["fila"], dati["numero_posto"]), None)
+        if posto is None:
+            nuovi.append(Posto(sala=sala, attivo=True, **dati))
+            continue
+        valori = {**dati, "attivo": True}
+        if all(getattr(posto, campo) == valori[campo] for campo in CAMPI_PIANTA):
+            invariati += 1
+            continue
+        for campo in CAMPI_PIANTA:
+            setattr(posto, campo, valori[campo])
+        modificati.append(posto)
+
+    rimossi = [p for p in esistenti.values() if p.attivo]
+    for posto in rimossi:
+        posto.attivo = False
+    return {"nuovi": nuovi, "modificati": modificati, "rimossi": rimossi, "invariati": invariati}
+
+
+@transaction.atomic
+def applica_pianta(sala, posti):
+    """Allinea i posti della sala alla pianta. ValidationError se si toglie un posto già venduto per una proiezione futura."""
+    modifiche = confronta_pianta(sala, posti, blocca=True)
+
+    venduti = (
+        Biglietto.objects
+        .filter(posto__in=modifiche["rimossi"], proiezione__data_ora__gte=timezone.now())
+        .values_list("posto__fila", "posto__numero_posto")
+        .distinct()
+    )
+    if venduti:
+        raise ValidationError(
+            "Non si possono togliere posti con biglietti per proiezioni future: "
+            + ", ".join(f"{fila}{numero}" for fila, numero in sorted(venduti))
+        )
+
+    Posto.objects.bulk_create(modifiche["nuovi"], batch_size=500)
+    Posto.objects.bulk_update(modifiche["modificati"] + modifiche["rimossi"], CAMPI_PIANTA, batch_size=500)
+    if modifiche["nuovi"] or modifiche["rimossi"]:
+        invalida_programmazione()  # cambia il numero di posti; le bulk non inviano post_save
+    return modifiche
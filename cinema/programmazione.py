@@ -0,0 +1,145 @@
+from datetime import datetime, time, timedelta
+from django.conf import settings
+from django.db.models import Count, OuterRef, Prefetch, Subquery
+from django.utils import timezone
+from django.utils.dateformat import format as formatta_data
+from .models import Posto, Proiezione
+
+
+def orizzonte_giorni():
+    # quanti giorni di programmazione mostrare nelle pagine (oggi compreso)
+    return settings.PROGRAMMAZIONE_ORIZZONTE_GIORNI
+
+
+def max_proiezioni_film():
+    # tetto alle proiezioni caricate per ogni film, anche se ne ha di più nella finestra
+    return settings.PROGRAMMAZIONE_MAX_PROIEZIONI_FILM
+
+
+def fine_finestra(now=None):
+    # mezzanotte (ora locale) dopo l'ultimo giorno dell'orizzonte
+    oggi = timezone.localtime(now or timezone.now()).date()
+    ultimo = oggi + timedelta(days=orizzonte_giorni())
+    return timezone.make_aware(datetime.combine(ultimo, time.min))
+
+
+def film_con_programmazione(film_qs, now=None):
+    """
+    Film con almeno una proiezione futura, ognuno con al massimo max_proiezioni_film() proiezioni
+    dentro l'orizzonte in film.proiezioni_future e la data dell'ultima proiezione in film.ultima_proiezione.
+    """
+    now = now or timezone.now()
+
+    ultima = (
+        Proiezione.objects
+        .filter(film=OuterRef("pk"))
+        .order_by("-data_ora")
+        .values("data_ora")[:1]
+    )
+
+    finestra = (
+        Proiezione.objects
+        .future(now)
+        .filter(data_ora__lt=fine_finestra(now))
+        .select_related("sala")
+        .order_by("data_ora")
+    )[:max_proiezioni_film()]  # prefetch con slice: Django lo traduce in una window function per film
+
+    return (
+        film_qs
+        .annotate(ultima_proiezione=Subquery(ultima))
+        .filter(ultima_proiezione__gte=now)
+        .prefetch_related(Prefetch("proiezione_set", queryset=finestra, to_attr="proiezioni_future"))
+    )
+
+
+def raggruppa_per_giorno(proiezioni):
+    # le proiezioni arrivano già ordinate per data_ora: un solo passaggio, giorni in ora locale
+    giorni = []
+    for p in proiezioni:
+        giorno = timezone.localtime(p.data_ora).date()
+        if not giorni or giorni[-1]["giorno"] != giorno:
+            giorni.append({"giorno": giorno, "proiezioni": []})
+        giorni[-1]["proiezioni"].append(p)
+    return giorni
+
+
+def prepara_card(films):
+    for film in films:
+        film.giorni = raggruppa_per_giorno(film.proiezioni_future)
+        ultima_mostrata = film.proiezioni_future[-1].data_ora if film.proiezioni_future else None
+        film.altre_date = ultima_mostrata is None or film.ultima_proiezione > ultima_mostrata
+        film.altre_date_dopo = ultima_mostrata
+    return films
+
+
+def giorni_json(giorni):
+    return [
+        {
+            "data": g["giorno"].isoformat(),
+            "giorno": formatta_data(g["giorno"], "l"),
+            "data_breve": formatta_data(g["giorno"], "d/m"),
+            "proiezioni": [
+                {
+                    "id": p.id,
+                    "ora": timezone.localtime(p.data_ora).strftime("%H:%M"),
+                    "sala": p.sala.nome,
+                }
+                for p in g["proiezioni"]
+            ],
+        }
+        for g in giorni
+    ]
+
+
+def _righe_del_giorno(giorno):
+    inizio = timezone.make_aware(datetime.combine(giorno, time.min))
+    fine = timezone.make_aware(datetime.combine(giorno + timedelta(days=1), time.min))
+
+    posti_sala = (
+        Posto.objects
+        .filter(sala=OuterRef("sala"), attivo=True)
+        .values("sala")
+        .annotate(n=Count("id"))
+        .values("n")
+    )
+
+    return (
+        Proiezione.objects
+        .filter(data_ora__gte=inizio, data_ora__lt=fine, film__in_programmazione__lte=giorno)
+        .annotate(occupati=Count("biglietti"), posti=Subquery(posti_sala))
+        .values(
+            "id", "data_ora", "sala_id", "sala__nome", "occupati", "posti",
+            "film_id", "film__titolo", "film__durata_minuti", "film__rassegna",
+        )
+        .order_by("film__titolo", "film_id", "data_ora")
+    )
+
+
+def _raggruppa_per_film(giorno, righe):
+    films = []
+    for r in righe:
+        if not films or films[-1]["id"] != r["film_id"]:
+            films.append({
+                "id": r["film_id"],
+                "titolo": r["film__titolo"],
+                "durata": r["film__durata_minuti"],
+                "rassegna": r["film__rassegna"],
+                "proiezioni": [],
+            })
+        films[-1]["proiezioni"].append({
+            "id": r["id"],
+            "ora": timezone.localtime(r["data_ora"]).strftime("%H:%M"),
+            "sala": r["sala__nome"],
+            "liberi": max((r["posti"] or 0) - r["occupati"], 0),
+        })
+
+    return {"data": giorno.isoformat(), "film": films}
+
+
+async def aprogrammazione_del_giorno(giorno):
+    """
+    Programmazione di un giorno (ora locale) in forma compatta per l'API JSON:
+    film, proiezioni, sala e posti liberi, con una sola query (ORM async).
+    """
+    return _raggruppa_per_film(giorno, [r async for r in _righe_del_giorno(giorno)])
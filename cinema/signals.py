@@ -0,0 +1,16 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .cache import invalida_film, invalida_programmazione
+from .models import Film, Proiezione
+
+
+@receiver([post_save, post_delete], sender=Film)
+def film_modificato(sender, instance, **kwargs):
+    invalida_film(instance.pk)
+    invalida_programmazione()
+
+
+@receiver([post_save, post_delete], sender=Proiezione)
+def proiezione_modificata(sender, instance, **kwargs):
+    invalida_film(instance.film_id)
+    invalida_programmazione()
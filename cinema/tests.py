@@ -1,11 +1,26 @@
-from datetime import timedelta
+import os
+import shutil
+import tempfile
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from io import StringIO
+from asgiref.sync import sync_to_async
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 from accounts.permissions import GROUP_GESTORE
-from cinema.models import Film, Proiezione, Sala
+from cinema.archivio import leggi_archivio
+from cinema.models import Film, Posto, Proiezione, Recensione, Sala, StatisticheFilm
+from cinema.pianificatore import pianifica, salva_pianificazione
+from cinema.pianta import applica_pianta, esporta_pianta, leggi_pianta
+from sales.models import Biglietto
 
 User = get_user_model()
 
@@ -85,3 +100,540 @@ class CinemaManagerRulesTests(TestCase):
         # Assert:
         self.assertEqual(resp.status_code, 200)
         self.assertEqual(Proiezione.objects.filter(sala=self.sala).count(), 1)
+
+
+class FrammentiFilmCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.g_gestore = Group.objects.create(name=GROUP_GESTORE)
+        cls.gestore = User.objects.create_user(username="gest", password="pass", email="g@x.it")
+        cls.gestore.groups.add(cls.g_gestore)
+
+        cls.sala = Sala.objects.create(nome="Sala 1")
+        cls.film = Film.objects.create(
+            titolo="Film Cache",
+            descrizione="...",
+            data_uscita=timezone.localdate() - timedelta(days=30),
+            durata_minuti=120,
+            genere="Test",
+            regista="Reg",
+            cast_principale="Cast",
+            locandina_url="https://example.com/poster.jpg",
+        )
+        cls.proiezione = Proiezione.objects.create(
+            film=cls.film,
+            sala=cls.sala,
+            data_ora=timezone.now() + timedelta(days=1),
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    # Modificare il film invalida la card in cache
+    def test_salvataggio_film_invalida_il_frammento(self):
+        self.assertContains(self.client.get(reverse("cinema:programmazione")), "Film Cache")
+
+        self.film.titolo = "Titolo Aggiornato"
+        self.film.save()
+
+        resp = self.client.get(reverse("cinema:programmazione"))
+        self.assertContains(resp, "Titolo Aggiornato")
+        self.assertNotContains(resp, "Film Cache")
+
+    # Anonimi e staff condividono la card, ma solo lo staff vede il link alle prenotazioni
+    def test_card_condivisa_tra_ruoli(self):
+        url = reverse("cinema:programmazione")
+        resp_anonimo = self.client.get(url)
+        self.assertNotContains(resp_anonimo, "Prenotazioni (staff)")
+
+        self.client.force_login(self.gestore)
+        resp_staff = self.client.get(url)
+        self.assertContains(resp_staff, "Prenotazioni (staff)")
+        self.assertContains(resp_staff, reverse("sales:prenota", args=[self.proiezione.pk]))
+
+    # Aggiungere una proiezione invalida la card del film
+    def test_nuova_proiezione_invalida_il_frammento(self):
+        self.client.get(reverse("cinema:programmazione"))
+
+        nuova = Proiezione.objects.create(
+            film=self.film,
+            sala=self.sala,
+            data_ora=self.proiezione.data_ora + timedelta(hours=4),
+        )
+
+        resp = self.client.get(reverse("cinema:programmazione"))
+        self.assertContains(resp, reverse("sales:prenota", args=[nuova.pk]))
+
+
+class PrecompilaTemplateTests(TestCase):
+    # Il comando compila i template del progetto e di tutte le app, senza errori
+    def test_precompila_tutti_i_template(self):
+        out = StringIO()
+        call_command("precompila_template", stdout=out)
+
+        output = out.getvalue()
+        self.assertIn("base.html", output)
+        self.assertIn("cinema/film_in_programmazione.html", output)
+        self.assertIn("sales/prenota.html", output)
+        self.assertNotIn("ERRORE", output)
+
+
+class ProgrammazioneFinestraTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.sala = Sala.objects.create(nome="Sala 1")
+        cls.film = Film.objects.create(
+            titolo="Film Finestra",
+            descrizione="...",
+            data_uscita=timezone.localdate() - timedelta(days=30),
+            durata_minuti=100,
+            genere="Test",
+            regista="Reg",
+            cast_principale="Cast",
+            locandina_url="https://example.com/poster.jpg",
+        )
+        domani = timezone.now() + timedelta(days=1)
+        cls.vicine = [
+            Proiezione.objects.create(film=cls.film, sala=cls.sala, data_ora=domani + timedelta(hours=3 * i))
+            for i in range(3)
+        ]
+        cls.lontana = Proiezione.objects.create(film=cls.film, sala=cls.sala, data_ora=timezone.now() + timedelta(days=60))
+
+    def setUp(self):
+        cache.clear()
+
+    # Le proiezioni oltre l'orizzonte non vengono caricate, ma resta il bottone "Altre date"
+    def test_proiezioni_oltre_orizzonte_non_mostrate(self):
+        resp = self.client.get(reverse("cinema:programmazione"))
+
+        for p in self.vicine:
+            self.assertContains(resp, reverse("sales:prenota", args=[p.pk]))
+        self.assertNotContains(resp, reverse("sales:prenota", args=[self.lontana.pk]))
+        self.assertContains(resp, "Altre date")
+
+    # Il numero di proiezioni caricate per film ha un tetto
+    @override_settings(PROGRAMMAZIONE_MAX_PROIEZIONI_FILM=2)
+    def test_tetto_proiezioni_per_film(self):
+        resp = self.client.get(reverse("cinema:programmazione"))
+
+        film = resp.context["films"][0]
+        self.assertEqual(film.proiezioni_future, self.vicine[:2])
+        self.assertNotContains(resp, reverse("sales:prenota", args=[self.vicine[2].pk]))
+
+    # L'endpoint "Altre date" restituisce le proiezioni successive già raggruppate per giorno
+    def test_altre_date_json(self):
+        url = reverse("cinema:film_altre_date", args=[self.film.pk])
+        resp = self.client.get(url, {"dopo": self.vicine[-1].data_ora.isoformat()})
+
+        data = resp.json()
+        self.assertEqual(len(data["giorni"]), 1)
+        self.assertEqual(data["giorni"][0]["data"], timezone.localtime(self.lontana.data_ora).date().isoformat())
+        self.assertEqual([p["id"] for p in data["giorni"][0]["proiezioni"]], [self.lontana.pk])
+        self.assertFalse(data["altre_date"])
+
+    # Una data impossibile è un errore del client; una data senza fuso è presa nell'ora locale
+    def test_altre_date_parametro_dopo(self):
+        url = reverse("cinema:film_altre_date", args=[self.film.pk])
+
+        self.assertEqual(self.client.get(url, {"dopo": "2024-13-45T00:00"}).status_code, 400)
+
+        dopo = timezone.localtime(self.vicine[-1].data_ora).replace(tzinfo=None)
+        data = self.client.get(url, {"dopo": dopo.isoformat()}).json()
+        self.assertEqual([p["id"] for p in data["giorni"][0]["proiezioni"]], [self.lontana.pk])
+
+
+class ProgrammazioneApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.sala = Sala.objects.create(nome="Sala 1")
+        cls.posti = [Posto.objects.create(sala=cls.sala, fila="A", numero_posto=str(n)) for n in range(1, 4)]
+        cls.film = Film.objects.create(
+            titolo="Film Api",
+            descrizione="...",
+            data_uscita=timezone.localdate() - timedelta(days=30),
+            durata_minuti=100,
+            genere="Test",
+            regista="Reg",
+            cast_principale="Cast",
+            locandina_url="https://example.com/poster.jpg",
+        )
+        cls.domani = timezone.localdate() + timedelta(days=1)
+        cls.proiezione = Proiezione.objects.create(
+            film=cls.film,
+            sala=cls.sala,
+            data_ora=timezone.make_aware(datetime.combine(cls.domani, time(20, 30))),
+        )
+        cls.url = reverse("cinema:programmazione_giorno", args=[cls.domani.isoformat()])
+
+    def setUp(self):
+        cache.clear()
+
+    # La risposta contiene film, proiezioni e posti liberi del giorno
+    def test_programmazione_del_giorno(self):
+        Biglietto.objects.create(proiezione=self.proiezione, posto=self.posti[0])
+
+        data = self.client.get(self.url).json()
+
+        self.assertEqual(data["data"], self.domani.isoformat())
+        self.assertEqual(data["film"][0]["titolo"], "Film Api")
+        self.assertEqual(data["film"][0]["proiezioni"], [
+            {"id": self.proiezione.id, "ora": "20:30", "sala": "Sala 1", "liberi": 2},
+        ])
+
+    # Con If-None-Match uguale all'ETag la risposta è 304 senza corpo
+    def test_etag_if_none_match(self):
+        etag = self.client.get(self.url)["ETag"]
+
+        resp = self.client.get(self.url, headers={"if-none-match": etag})
+
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.content, b"")
+
+    # Una prenotazione invalida solo la cache del suo giorno, e cambia l'ETag
+    def test_prenotazione_invalida_il_giorno(self):
+        prima = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Biglietto.objects.create(proiezione=self.proiezione, posto=self.posti[0])
+
+        dopo = self.client.get(self.url)
+        self.assertNotEqual(prima["ETag"], dopo["ETag"])
+        self.assertEqual(dopo.json()["film"][0]["proiezioni"][0]["liberi"], 2)
+
+    # La cache del giorno si invalida solo al commit, con una sola query per tutti i biglietti della transazione
+    def test_invalidazione_al_commit(self):
+        prima = self.client.get(self.url)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            for posto in self.posti:
+                Biglietto.objects.create(proiezione_id=self.proiezione.pk, posto=posto)
+            # non ancora confermati: chi legge ora non deve rimettere in cache questi dati come nuovi
+            self.assertEqual(self.client.get(self.url)["ETag"], prima["ETag"])
+
+        with self.assertNumQueries(1):
+            for callback in callbacks:
+                callback()
+        self.assertEqual(self.client.get(self.url).json()["film"][0]["proiezioni"][0]["liberi"], 0)
+
+    def test_data_non_valida(self):
+        resp = self.client.get(reverse("cinema:programmazione_giorno", args=["2026-02-30"]))
+        self.assertEqual(resp.status_code, 400)
+
+    # Sotto ASGI la vista async risponde senza passare da un thread (stessi dati e stesso ETag)
+    async def test_vista_async_sotto_asgi(self):
+        sync = await sync_to_async(self.client.get)(self.url)
+
+        resp = await self.async_client.get(self.url)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp["ETag"], sync["ETag"])
+        self.assertEqual(resp.json()["film"][0]["titolo"], "Film Api")
+
+
+class SalaImpegniTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.sala = Sala.objects.create(nome="Sala 1")
+        cls.film = Film.objects.create(
+            titolo="Film Calendario",
+            descrizione="...",
+            data_uscita=timezone.localdate() - timedelta(days=30),
+            durata_minuti=105,
+            genere="Test",
+            regista="Reg",
+            cast_principale="Cast",
+            locandina_url="https://example.com/poster.jpg",
+        )
+        cls.giorno = timezone.localdate() + timedelta(days=2)
+        cls.proiezione = Proiezione.objects.create(
+            film=cls.film,
+            sala=cls.sala,
+            data_ora=timezone.make_aware(datetime.combine(cls.giorno, time(18, 0))),
+        )
+        cls.url = reverse("cinema:sala_impegni", args=[cls.sala.id])
+
+    def setUp(self):
+        cache.clear()
+
+    # Gli impegni hanno già la fine calcolata (durata + buffer) e gli spazi liberi rispettano la durata richiesta
+    def test_impegni_e_spazi_liberi(self):
+        data = self.client.get(self.url, {"dal": self.giorno, "al": self.giorno, "durata": 120}).json()
+
+        self.assertEqual(len(data["impegni"]), 1)
+        self.assertTrue(data["impegni"][0]["inizio"].startswith(f"{self.giorno.isoformat()}T18:00"))
+        self.assertTrue(data["impegni"][0]["fine"].startswith(f"{self.giorno.isoformat()}T20:00"))  # 105 + 15 minuti
+        self.assertEqual(len(data["liberi"]), 2)
+        self.assertTrue(data["liberi"][0]["fine"].startswith(f"{self.giorno.isoformat()}T18:00"))
+        self.assertTrue(data["liberi"][1]["inizio"].startswith(f"{self.giorno.isoformat()}T20:00"))
+
+    # Uno spazio troppo corto per il film non viene proposto
+    def test_spazio_troppo_corto_escluso(self):
+        Proiezione.objects.create(
+            film=self.film,
+            sala=self.sala,
+            data_ora=timezone.make_aware(datetime.combine(self.giorno, time(21, 0))),
+        )
+
+        data = self.client.get(self.url, {"dal": self.giorno, "al": self.giorno + timedelta(days=1), "film": self.film.id}).json()
+
+        # tra le 20:00 e le 21:00 non c'è spazio per 105 + 15 minuti
+        self.assertEqual(len(data["liberi"]), 2)
+        self.assertTrue(data["liberi"][1]["inizio"].startswith(f"{self.giorno.isoformat()}T23:00"))
+
+    # Un film non numerico è un errore del client, non un 500
+    def test_film_non_valido(self):
+        self.assertEqual(self.client.get(self.url, {"film": "abc"}).status_code, 400)
+
+    # Con dal=oggi gli spazi liberi partono da adesso, non dalla mezzanotte
+    def test_nessuno_spazio_libero_nel_passato(self):
+        prima = timezone.now().replace(microsecond=0)
+
+        data = self.client.get(self.url).json()
+
+        self.assertGreaterEqual(datetime.fromisoformat(data["liberi"][0]["inizio"]), prima.replace(second=0))
+
+    # Il calendario è in cache, ma una nuova proiezione lo invalida
+    def test_cache_invalidata_da_nuova_proiezione(self):
+        params = {"dal": self.giorno, "al": self.giorno}
+        self.client.get(self.url, params)
+        with self.assertNumQueries(0):
+            self.client.get(self.url, params)
+
+        Proiezione.objects.create(
+            film=self.film,
+            sala=self.sala,
+            data_ora=timezone.make_aware(datetime.combine(self.giorno, time(21, 0))),
+        )
+
+        self.assertEqual(len(self.client.get(self.url, params).json()["impegni"]), 2)
+
+
+class PianificatoreTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.g_gestore = Group.objects.create(name=GROUP_GESTORE)
+        cls.gestore = User.objects.create_user(username="gest", password="pass", email="g@x.it")
+        cls.gestore.groups.add(cls.g_gestore)
+
+        cls.sala = Sala.objects.create(nome="Sala 1")
+        cls.film = Film.objects.create(
+            titolo="Film Pianificato",
+            descrizione="...",
+            data_uscita=timezone.localdate() - timedelta(days=30),
+            durata_minuti=105,
+            genere="Test",
+            regista="Reg",
+            cast_principale="Cast",
+            locandina_url="https://example.com/poster.jpg",
+        )
+        cls.giorno = timezone.localdate() + timedelta(days=2)
+
+    def _pianifica(self, n, giorni=1, apertura=time(15, 0), chiusura=time(23, 59)):
+        return pianifica([(self.film, n)], [self.sala], self.giorno, giorni, apertura, chiusura)
+
+    def _ore(self, proposte):
+        return [timezone.localtime(p["inizio"]).strftime("%H:%M") for p in proposte]
+
+    # Le proiezioni proposte saltano quelle esistenti (con il buffer) e finiscono entro la chiusura
+    def test_rispetta_sala_occupata_e_chiusura(self):
+        Proiezione.objects.create(
+            film=self.film,
+            sala=self.sala,
+            data_ora=timezone.make_aware(datetime.combine(self.giorno, time(18, 0))),
+        )
+
+        proposte, mancanti = self._pianifica(5)
+
+        self.assertEqual(self._ore(proposte), ["15:00", "20:00", "22:00"])
+        self.assertEqual(mancanti, {self.film: 2})
+        self.assertEqual(len(salva_pianificazione(proposte)), 3)  # tutte valide per Proiezione.clean
+
+    # Le proiezioni si distribuiscono sui giorni e non si va prima dell'uscita locale
+    def test_distribuzione_sui_giorni_e_uscita_locale(self):
+        self.film.uscita_locale = self.giorno + timedelta(days=1)
+        self.film.save()
+
+        proposte, _ = self._pianifica(4, giorni=3)
+
+        giorni = [timezone.localtime(p["inizio"]).date() for p in proposte]
+        self.assertEqual(len(proposte), 4)
+        self.assertNotIn(self.giorno, giorni)
+        self.assertEqual(giorni.count(self.giorno + timedelta(days=1)), 2)
+        self.assertEqual(giorni.count(self.giorno + timedelta(days=2)), 2)
+
+    # Dalla pagina del gestore l'anteprima non salva nulla, la conferma crea le proiezioni
+    def test_anteprima_e_conferma(self):
+        self.client.force_login(self.gestore)
+        url = reverse("cinema:pianifica_settimana")
+        dati = {
+            "dal": self.giorno.isoformat(),
+            "giorni": 1,
+            "apertura": "20:00",
+            "chiusura": "23:59",
+            "passo": 15,
+            "sale": [self.sala.id],
+            f"film_{self.film.id}": 2,
+            "anteprima": "1",
+        }
+
+        response = self.client.post(url, dati)
+        self.assertEqual(len(response.context["proposte"]), 2)
+        self.assertFalse(Proiezione.objects.exists())
+
+        dati.pop("anteprima")
+        dati["conferma"] = "1"
+        response = self.client.post(url, dati)
+        self.assertRedirects(response, reverse("cinema:film_gestisci"))
+        self.assertEqual(Proiezione.objects.filter(film=self.film, sala=self.sala).count(), 2)
+
+
+class ArchivioTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.utente = User.objects.create_user(username="cliente", password="pass", email="c@x.it")
+        cls.sala = Sala.objects.create(nome="Sala 1")
+        cls.posti = [Posto.objects.create(sala=cls.sala, fila="A", numero_posto=str(n)) for n in range(1, 3)]
+
+        def film(titolo):
+            return Film.objects.create(
+                titolo=titolo,
+                descrizione="...",
+                data_uscita=timezone.localdate() - timedelta(days=500),
+                durata_minuti=100,
+                genere="Test",
+                regista="Reg",
+                cast_principale="Cast",
+                locandina_url="https://example.com/poster.jpg",
+            )
+
+        # film non più in programmazione da 100 giorni, con biglietti e una recensione
+        cls.scaduto = film("Film Scaduto")
+        vecchia = Proiezione.objects.create(film=cls.scaduto, sala=cls.sala, data_ora=timezone.now() - timedelta(days=100))
+        for posto in cls.posti:
+            Biglietto.objects.create(proiezione=vecchia, posto=posto, prezzo=Decimal("8.00"))
+        Recensione.objects.create(film=cls.scaduto, autore=cls.utente, contenuto="Bello", valutazione=4)
+
+        # film ancora in programmazione, con una proiezione di oltre un anno fa
+        cls.attuale = film("Film Attuale")
+        cls.antica = Proiezione.objects.create(film=cls.attuale, sala=cls.sala, data_ora=timezone.now() - timedelta(days=400))
+        Biglietto.objects.create(proiezione=cls.antica, posto=cls.posti[0], prezzo=Decimal("6.00"))
+        cls.futura = Proiezione.objects.create(film=cls.attuale, sala=cls.sala, data_ora=timezone.now() + timedelta(days=1))
+
+    def setUp(self):
+        self.cartella = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cartella, ignore_errors=True)
+
+    # I dati scaduti finiscono nell'archivio e i loro totali in StatisticheFilm
+    def test_archivia_film_e_proiezioni_vecchie(self):
+        call_command("archivia", cartella=self.cartella, stdout=StringIO())
+
+        self.assertFalse(Film.objects.filter(pk=self.scaduto.pk).exists())
+        self.assertEqual(list(Proiezione.objects.values_list("pk", flat=True)), [self.futura.pk])
+        self.assertFalse(Biglietto.objects.exists())
+        self.assertFalse(Recensione.objects.exists())
+
+        scaduto = StatisticheFilm.objects.get(film_id=self.scaduto.pk)
+        self.assertEqual((scaduto.proiezioni, scaduto.biglietti, scaduto.incasso), (1, 2, Decimal("16.00")))
+        self.assertEqual(scaduto.valutazione_media, 4)
+        self.assertIsNotNone(scaduto.film_archiviato_il)
+
+        attuale = StatisticheFilm.objects.get(film_id=self.attuale.pk)
+        self.assertEqual((attuale.proiezioni, attuale.biglietti, attuale.incasso), (1, 1, Decimal("6.00")))
+        self.assertIsNone(attuale.film_archiviato_il)
+
+        (file,) = os.listdir(self.cartella)
+        modelli = [r["modello"] for r in leggi_archivio(os.path.join(self.cartella, file))]
+        self.assertEqual(sorted(modelli), sorted(
+            ["cinema.film", "cinema.proiezione", "cinema.proiezione", "cinema.recensione"] + ["sales.biglietto"] * 3
+        ))
+
+    # Più film scaduti, letti a blocchi più piccoli del loro numero: vengono archiviati tutti
+    def test_archivia_film_a_blocchi(self):
+        for titolo in ("Altro Scaduto 1", "Altro Scaduto 2"):
+            altro = Film.objects.create(
+                titolo=titolo, descrizione="...", data_uscita=timezone.localdate() - timedelta(days=500),
+                durata_minuti=100, genere="Test", regista="Reg", cast_principale="Cast",
+                locandina_url="https://example.com/poster.jpg",
+            )
+            Proiezione.objects.create(film=altro, sala=self.sala, data_ora=timezone.now() - timedelta(days=120))
+
+        call_command("archivia", cartella=self.cartella, batch=1, stdout=StringIO())
+
+        self.assertEqual(list(Film.objects.values_list("pk", flat=True)), [self.attuale.pk])
+        self.assertEqual(StatisticheFilm.objects.filter(film_archiviato_il__isnull=False).count(), 3)
+
+    # Con --dry-run non cambia nulla
+    def test_dry_run(self):
+        out = StringIO()
+        call_command("archivia", cartella=self.cartella, dry_run=True, stdout=out)
+
+        self.assertIn("Film da archiviare: 1", out.getvalue())
+        self.assertEqual(Proiezione.objects.count(), 3)
+        self.assertEqual(os.listdir(self.cartella), [])
+
+
+class PiantaSalaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.g_gestore = Group.objects.create(name=GROUP_GESTORE)
+        cls.gestore = User.objects.create_user(username="gest", password="pass", email="g@x.it")
+        cls.gestore.groups.add(cls.g_gestore)
+        cls.sala = Sala.objects.create(nome="Sala 1")
+
+    # Una sala grande si costruisce e si ricostruisce con poche query, scrivendo solo le differenze
+    def test_applica_pianta_in_blocco(self):
+        pianta = "\n".join(["oooooooooo.oooooooooo.oooooooooo"] * 16 + ["aa_ppppppp.pppppppppp.ppppppp_aa"])
+        with CaptureQueriesContext(connection) as query:
+            modifiche = applica_pianta(self.sala, leggi_pianta(pianta))
+        self.assertEqual(len(modifiche["nuovi"]), 508)
+        self.assertLess(len(query), 10)
+
+        posto = Posto.objects.get(sala=self.sala, fila="Q", numero_posto="1")
+        self.assertEqual((posto.riga, posto.colonna, posto.categoria), (17, 1, Posto.Categoria.ACCESSIBILE))
+        # la pianta esportata, reimportata, non cambia nulla
+        self.assertEqual(applica_pianta(self.sala, leggi_pianta(esporta_pianta(self.sala)))["invariati"], 508)
+
+        # tolgo l'ultima fila e sposto la prima di una colonna
+        nuova = "\n".join(["_oooooooooo.oooooooooo.oooooooooo"] + ["oooooooooo.oooooooooo.oooooooooo"] * 15)
+        modifiche = applica_pianta(self.sala, leggi_pianta(nuova))
+        self.assertEqual(
+            (len(modifiche["nuovi"]), len(modifiche["modificati"]), len(modifiche["rimossi"]), modifiche["invariati"]),
+            (0, 30, 28, 450),
+        )
+        self.assertEqual(Posto.objects.filter(sala=self.sala, attivo=True).count(), 480)
+
+    # Un posto già venduto per una proiezione futura non si può togliere dalla pianta
+    def test_posto_venduto_non_rimovibile(self):
+        applica_pianta(self.sala, leggi_pianta("A: ooo"))
+        film = Film.objects.create(
+            titolo="Film", descrizione="...", data_uscita=timezone.localdate() - timedelta(days=30),
+            durata_minuti=100, genere="Test", regista="Reg", cast_principale="Cast",
+            locandina_url="https://example.com/poster.jpg",
+        )
+        proiezione = Proiezione.objects.create(film=film, sala=self.sala, data_ora=timezone.now() + timedelta(days=1))
+        Biglietto.objects.create(proiezione=proiezione, posto=Posto.objects.get(sala=self.sala, numero_posto="3"))
+
+        with self.assertRaises(ValidationError):
+            applica_pianta(self.sala, leggi_pianta("A: oo"))
+        self.assertEqual(Posto.objects.filter(sala=self.sala, attivo=True).count(), 3)
+
+    def test_vista_anteprima_e_nuova_sala(self):
+        self.client.force_login(self.gestore)
+        url = reverse("cinema:sala_nuova")
+        dati = {"nome": "Sala 2", "pianta": "A: oo.oo\nB: a_.pp", "anteprima": "1"}
+
+        response = self.client.post(url, dati)
+        self.assertEqual(response.context["totale"], 7)
+        self.assertFalse(Sala.objects.filter(nome="Sala 2").exists())
+
+        dati.pop("anteprima")
+        dati["applica"] = "1"
+        response = self.client.post(url, dati)
+        sala = Sala.objects.get(nome="Sala 2")
+        self.assertRedirects(response, reverse("cinema:sala_pianta", args=[sala.pk]))
+        self.assertEqual(Posto.objects.filter(sala=sala).count(), 7)
+
+        response = self.client.post(url, {"nome": "Sala 3", "pianta": "A: oxo", "anteprima": "1"})
+        self.assertIn("pianta", response.context["form"].errors)
@@ -20,8 +20,15 @@ urlpatterns = [
     path("proiezione/crea/<int:film_id>/", views.ProiezioneCreateView.as_view(), name="proiezione_crea"),
     path("proiezione/<int:pk>/modifica/", views.ProiezioneUpdateView.as_view(), name="proiezione_modifica"),
     path("proiezione/<int:pk>/elimina/", views.ProiezioneDeleteView.as_view(), name="proiezione_elimina"),
+    path("proiezione/pianifica/", views.PianificaSettimanaView.as_view(), name="pianifica_settimana"),
+
+    path("sala/pianta/", views.PiantaSalaView.as_view(), name="sala_nuova"),
+    path("sala/<int:pk>/pianta/", views.PiantaSalaView.as_view(), name="sala_pianta"),
 
     path("api/sale/<int:sala_id>/impegni/", views.sala_impegni, name="sala_impegni"),
     path("ajax/film-suggestions/", views.film_suggestions, name="film_suggestions"),
+    path("api/film/<int:pk>/altre-date/", views.film_altre_date, name="film_altre_date"),
+    path("api/programmazione/", views.programmazione_giorno, name="programmazione_oggi"),
+    path("api/programmazione/<str:giorno>/", views.programmazione_giorno, name="programmazione_giorno"),
     
 ]   
\ No newline at end of file
@@ -1,42 +1,97 @@
-from django.db.models import Prefetch
 from django.utils import timezone
 from django.views.generic import ListView
 from django.contrib.auth.mixins import LoginRequiredMixin
 from braces.views import GroupRequiredMixin
-from .models import Film, Proiezione, Recensione
+from .models import Film, Proiezione, Recensione, Sala
 from django.views.generic import CreateView, DetailView, UpdateView, DeleteView, View
 from django.urls import reverse_lazy
 from django.contrib import messages
-from .forms import ProiezioneForm, FilmForm, RecensioneForm
-from django.http import JsonResponse
+from .forms import ProiezioneForm, FilmForm, RecensioneForm, PianificazioneForm, PiantaSalaForm
+from django.http import HttpResponse, JsonResponse
 from django.views.decorators.http import require_GET
+from django.db import transaction
 from django.db.models import Q
+from django.core.exceptions import ValidationError
 from accounts.permissions import is_operational_staff
-from django.shortcuts import get_object_or_404, redirect
+from django.shortcuts import aget_object_or_404, get_object_or_404, redirect, render
 from django.urls import reverse
+import hashlib
+import json
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import timedelta
+from .cache import annota_versioni, aversione_giorno, aversione_programmazione
+from .calendario import MAX_GIORNI_INTERVALLO, aimpegni_sala, inizio_giorno, spazi_liberi
+from .pianificatore import pianifica, salva_pianificazione
+from .pianta import applica_pianta, confronta_pianta, esporta_pianta, griglia
+from monitoraggio.metriche import registra_cache
+from .programmazione import (
+    aprogrammazione_del_giorno, film_con_programmazione, giorni_json, max_proiezioni_film, orizzonte_giorni,
+    prepara_card, raggruppa_per_giorno,
+)
 
-@require_GET
-def sala_impegni(request, sala_id):
-    now = timezone.now()
-    qs = (
-        Proiezione.objects
-        .filter(sala_id=sala_id, data_ora__gte=now)
-        .select_related("film")
-        .order_by("data_ora")[:50] # limita a 50 righe
-    )
+# Le API JSON di sola lettura (calendario sala, suggerimenti, altre date, programmazione) sono viste async:
+# sotto ASGI girano nell'event loop con ORM e cache async invece di occupare un thread ciascuna.
+# Sotto WSGI Django le esegue comunque, con async_to_sync.
+
+CACHE_TIMEOUT_CALENDARIO = 60 * 10
+
+
+def _orario(dt):
+    return timezone.localtime(dt).isoformat(timespec="minutes")
 
-    data = [
-        {
-            "data_ora": timezone.localtime(p.data_ora).strftime("%Y-%m-%d %H:%M"),
-            "film": p.film.titolo,
-        }
-        for p in qs
-    ]
-    return JsonResponse({"impegni": data})
+
+@require_GET
+async def sala_impegni(request, sala_id):
+    # calendario della sala tra ?dal= e ?al= (date AAAA-MM-GG, "al" compreso; default: i prossimi 7 giorni)
+    # con gli intervalli occupati (fine = inizio + durata + BUFFER_MINUTI) e gli spazi liberi
+    # abbastanza lunghi per un film di ?durata= minuti (oppure della durata del film ?film=)
+    try:
+        dal = parse_date(request.GET.get("dal") or "") or timezone.localdate()
+        al = parse_date(request.GET.get("al") or "") or dal + timedelta(days=6)
+        durata = int(request.GET.get("durata") or 0)
+        film_id = int(request.GET["film"]) if request.GET.get("film") else None
+    except ValueError:
+        return JsonResponse({"errore": "Parametri non validi."}, status=400)
+
+    if film_id is not None:
+        durata = (await aget_object_or_404(Film.objects.only("durata_minuti"), pk=film_id)).durata_minuti
+
+    if al < dal or (al - dal).days >= MAX_GIORNI_INTERVALLO or durata < 0:
+        return JsonResponse({"errore": f"Intervallo non valido (massimo {MAX_GIORNI_INTERVALLO} giorni)."}, status=400)
+
+    # in cache solo gli impegni: gli spazi liberi dipendono dalla durata e dall'ora attuale
+    inizio, fine = inizio_giorno(dal), inizio_giorno(al + timedelta(days=1))
+    chiave = f"calendario:sala:{sala_id}:{await aversione_programmazione()}:{dal.isoformat()}:{al.isoformat()}"
+    impegni = await cache.aget(chiave)
+    registra_cache("calendario", impegni is not None)
+    if impegni is None:
+        impegni = await aimpegni_sala(sala_id, inizio, fine)
+        await cache.aset(chiave, impegni, CACHE_TIMEOUT_CALENDARIO)
+
+    data = {
+        "impegni": [
+            {
+                "data_ora": timezone.localtime(i["inizio"]).strftime("%Y-%m-%d %H:%M"),
+                "film": i["film"],
+                "inizio": _orario(i["inizio"]),
+                "fine": _orario(i["fine"]),
+            }
+            for i in impegni
+        ],
+        # niente spazi liberi già passati (con dal=oggi partirebbero dalla mezzanotte)
+        "liberi": [
+            {"inizio": _orario(spazio["inizio"]), "fine": _orario(spazio["fine"])}
+            for spazio in spazi_liberi(impegni, max(inizio, timezone.now()), fine, durata)
+        ],
+        "buffer_minuti": Proiezione.BUFFER_MINUTI,
+    }
+    return JsonResponse(data)
 
 
 @require_GET
-def film_suggestions(request):
+async def film_suggestions(request):
     q = (request.GET.get("q") or "").strip() # legge il parametro 'q'
     if len(q) < 2:
         return JsonResponse({"results": []})
@@ -48,11 +103,97 @@ def film_suggestions(request):
         .values("id", "titolo")[:5] #limito a 5 risultati
     )
 
-    return JsonResponse({"results": list(qs)})
+    return JsonResponse({"results": [r async for r in qs]})
+
+
+
+@require_GET
+async def film_altre_date(request, pk):
+    # caricamento "lazy" delle date successive a quelle mostrate nella card del film
+    now = timezone.now()
+    try:
+        dopo = parse_datetime(request.GET.get("dopo") or "") or now
+    except ValueError:  # formato giusto ma data impossibile (es. mese 13)
+        return JsonResponse({"errore": "Parametro 'dopo' non valido."}, status=400)
+    if timezone.is_naive(dopo):
+        dopo = timezone.make_aware(dopo)
+    limite = max_proiezioni_film()
+
+    proiezioni = [
+        p async for p in
+        Proiezione.objects
+        .future(now)
+        .filter(film_id=pk, data_ora__gt=dopo)
+        .select_related("sala")
+        .order_by("data_ora")[:limite + 1] # una in più per sapere se ci sono altre date
+    ]
+    altre_date = len(proiezioni) > limite
+    proiezioni = proiezioni[:limite]
 
+    return JsonResponse({
+        "giorni": giorni_json(raggruppa_per_giorno(proiezioni)),
+        "altre_date": altre_date,
+        "dopo": proiezioni[-1].data_ora.isoformat() if proiezioni else None,
+    })
 
 
-class FilmInProgrammazioneListView(ListView):
+# TTL della programmazione in cache: le modifiche invalidano comunque la cache tramite le versioni (cinema/cache.py)
+CACHE_TIMEOUT_OGGI = 60
+CACHE_TIMEOUT_FUTURO = 60 * 60 * 24
+CACHE_TIMEOUT_PASSATO = 60 * 60 * 24 * 7
+
+
+@require_GET
+async def programmazione_giorno(request, giorno=None):
+    # API di sola lettura per chioschi e app partner: la programmazione di un giorno, in cache per giorno
+    oggi = timezone.localdate()
+    try:
+        giorno = parse_date(giorno) if giorno else oggi
+    except ValueError:
+        giorno = None
+    if giorno is None:
+        return JsonResponse({"errore": "Data non valida, usare il formato AAAA-MM-GG."}, status=400)
+
+    chiave = f"programmazione:{giorno.isoformat()}:{await aversione_giorno(giorno)}"
+    cached = await cache.aget(chiave)
+    registra_cache("programmazione", cached is not None)
+    if cached is None:
+        body = json.dumps(await aprogrammazione_del_giorno(giorno), separators=(",", ":")).encode()
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        if giorno == oggi:
+            timeout = CACHE_TIMEOUT_OGGI
+        elif giorno > oggi:
+            timeout = CACHE_TIMEOUT_FUTURO
+        else:
+            timeout = CACHE_TIMEOUT_PASSATO
+        cached = (body, etag)
+        await cache.aset(chiave, cached, timeout)
+    body, etag = cached
+
+    # If-None-Match: se il client ha già questa versione rispondiamo 304 senza corpo
+    non_modificato = get_conditional_response(request, etag=etag)
+    if non_modificato is not None:
+        return non_modificato
+
+    response = HttpResponse(body, content_type="application/json")
+    response["ETag"] = etag
+    if giorno < oggi:
+        patch_cache_control(response, public=True, max_age=CACHE_TIMEOUT_PASSATO)
+    else:
+        patch_cache_control(response, no_cache=True) # i posti liberi cambiano: il client rivalida con l'ETag
+    return response
+
+
+class VersioniFilmMixin:
+    # aggiunge film.versione_cache, usata come chiave dei frammenti {% cache %} delle card
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        annota_versioni(context["films"])
+        return context
+
+
+
+class FilmInProgrammazioneListView(VersioniFilmMixin, ListView):
     model = Film
     template_name = "cinema/film_in_programmazione.html"
     context_object_name = "films"
@@ -60,65 +201,37 @@ class FilmInProgrammazioneListView(ListView):
     def get_queryset(self):
         now = timezone.now()
 
-        proiezioni_future_qs = (
-            Proiezione.objects
-            .filter(data_ora__gte=now)
-            .select_related("sala")
-            .order_by("data_ora")
-        )
-
-        qs = (
-            Film.objects
+        qs = film_con_programmazione(
             # prendo solo film che hanno almeno una proiezione futura
-            .filter(rassegna=False, proiezione__data_ora__gte=now, in_programmazione__lte=now)
-            .distinct()
-            .prefetch_related(
-                Prefetch(
-                    "proiezione_set",
-                    queryset=proiezioni_future_qs,
-                    to_attr="proiezioni_future"
-                )
-            )
-            .order_by("titolo")
-        )
+            Film.objects.filter(rassegna=False, in_programmazione__lte=now),
+            now,
+        ).order_by("titolo")
         return qs
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        prepara_card(context["films"]) # proiezioni già raggruppate per giorno, il template non usa più regroup
+        context["orizzonte_giorni"] = orizzonte_giorni()
+        context["oggi"] = timezone.localdate()
+        return context
 
 
-class RassegnaFilmListView(ListView):
-    model = Film
-    template_name = "cinema/film_in_programmazione.html"
-    context_object_name = "films"
+
+class RassegnaFilmListView(FilmInProgrammazioneListView):
 
     def get_queryset(self):
         now = timezone.now()
 
-        proiezioni_future_qs = (
-            Proiezione.objects
-            .filter(data_ora__gte=now)
-            .select_related("sala")
-            .order_by("data_ora")
-        )
-
-        qs = (
-            Film.objects
+        qs = film_con_programmazione(
             # prendo solo film che hanno almeno una proiezione futura e che sono in rassegna
-            .filter(rassegna=True, proiezione__data_ora__gte=now)
-            .distinct()
-            .prefetch_related(
-                Prefetch(
-                    "proiezione_set",
-                    queryset=proiezioni_future_qs,
-                    to_attr="proiezioni_future"
-                )
-            )
-            .order_by("titolo")
-        )
+            Film.objects.filter(rassegna=True),
+            now,
+        ).order_by("titolo")
         return qs
 
 
 
-class FilmListView(ListView):
+class FilmListView(VersioniFilmMixin, ListView):
     model = Film
     template_name = "cinema/film_list.html"
     context_object_name = "films"
@@ -135,7 +248,7 @@ class FilmListView(ListView):
 
 
 
-class ProssimamenteFilmListView(ListView):
+class ProssimamenteFilmListView(VersioniFilmMixin, ListView):
     model = Film
     template_name = "cinema/film_list.html"
     context_object_name = "films"
@@ -171,8 +284,8 @@ class FilmDetailView(DetailView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["proiezioni"] = (
-            Proiezione.objects
-            .filter(film=self.object, data_ora__gte=timezone.now())
+            Proiezione.future
+            .filter(film=self.object)
             .select_related("sala")
             .order_by("data_ora")
         )
@@ -263,8 +376,8 @@ class ProiezioneCreateView(GroupRequiredMixin, CreateView):
         context = super().get_context_data(**kwargs)
         context["film"] = self.film
         context["proiezioni_film"] = (
-            Proiezione.objects
-            .filter(film=self.film, data_ora__gte=timezone.now())
+            Proiezione.future
+            .filter(film=self.film)
             .select_related("sala")
             .order_by("data_ora")
         )
@@ -293,8 +406,8 @@ class ProiezioneUpdateView(GroupRequiredMixin, UpdateView):
         context = super().get_context_data(**kwargs)
         context["film"] = self.object.film
         context["proiezioni_film"] = (
-            Proiezione.objects
-            .filter(film=self.object.film, data_ora__gte=timezone.now())
+            Proiezione.future
+            .filter(film=self.object.film)
             .select_related("sala")
             .order_by("data_ora")
         )
@@ -323,3 +436,100 @@ class ProiezioneDeleteView(GroupRequiredMixin, DeleteView):
         film_id = self.object.film.pk
         return reverse_lazy("cinema:film_detail", kwargs={"pk": film_id})
 
+
+
+class PianificaSettimanaView(GroupRequiredMixin, View):
+    # GET: form; POST: anteprima del palinsesto proposto, con "conferma" le proiezioni vengono create
+    template_name = "cinema/pianifica.html"
+    group_required = ["gestore_film"]
+    superuser_allowed = True
+    raise_exception = True
+
+    def get(self, request):
+        return render(request, self.template_name, {"form": PianificazioneForm()})
+
+    def post(self, request):
+        form = PianificazioneForm(request.POST)
+        if not form.is_valid():
+            return render(request, self.template_name, {"form": form})
+
+        d = form.cleaned_data
+        proposte, mancanti = pianifica(
+            form.richieste(), list(d["sale"]), d["dal"], d["giorni"],
+            d["apertura"], d["chiusura"], passo_minuti=d["passo"],
+        )
+
+        if "conferma" in request.POST and proposte:
+            # la pianificazione è deterministica: ricalcolata qui coincide con l'anteprima,
+            # a meno che nel frattempo qualcuno abbia cambiato le sale (lo segnala Proiezione.clean)
+            try:
+                create = salva_pianificazione(proposte)
+            except ValidationError as e:
+                messages.error(request, f"Pianificazione non salvata: {' '.join(e.messages)}")
+            else:
+                messages.success(request, f"Create {len(create)} proiezioni.")
+                return redirect("cinema:film_gestisci")
+
+        return render(request, self.template_name, {
+            "form": form,
+            "proposte": proposte,
+            "mancanti": mancanti,
+            "anteprima": True,
+        })
+
+
+
+class PiantaSalaView(GroupRequiredMixin, View):
+    # GET: pianta attuale della sala in formato testo (vuota per una sala nuova);
+    # POST: anteprima della pianta e delle differenze, con "applica" i posti vengono aggiornati
+    template_name = "cinema/pianta_sala.html"
+    group_required = ["gestore_film"]
+    superuser_allowed = True
+    raise_exception = True
+
+    def _render(self, request, sala, form, **extra):
+        return render(request, self.template_name, {
+            "sala": sala,
+            "sale": Sala.objects.order_by("nome"),
+            "form": form,
+            **extra,
+        })
+
+    def get(self, request, pk=None):
+        sala = get_object_or_404(Sala, pk=pk) if pk else None
+        initial = {"nome": sala.nome, "pianta": esporta_pianta(sala)} if sala else {}
+        return self._render(request, sala, PiantaSalaForm(initial=initial))
+
+    def post(self, request, pk=None):
+        sala = get_object_or_404(Sala, pk=pk) if pk else None
+        form = PiantaSalaForm(request.POST)
+        if not form.is_valid():
+            return self._render(request, sala, form)
+
+        nome, posti = form.cleaned_data["nome"], form.cleaned_data["pianta"]
+        if "applica" in request.POST:
+            try:
+                with transaction.atomic():
+                    if sala is None:
+                        sala = Sala.objects.create(nome=nome)
+                    elif sala.nome != nome:
+                        sala.nome = nome
+                        sala.save(update_fields=["nome"])
+                    modifiche = applica_pianta(sala, posti)
+            except ValidationError as e:
+                sala = get_object_or_404(Sala, pk=pk) if pk else None  # la transazione è stata annullata
+                messages.error(request, f"Pianta non salvata: {' '.join(e.messages)}")
+            else:
+                messages.success(
+                    request,
+                    f"Pianta di {sala.nome} salvata: {len(modifiche['nuovi'])} posti nuovi, "
+                    f"{len(modifiche['modificati'])} modificati, {len(modifiche['rimossi'])} tolti.",
+                )
+                return redirect("cinema:sala_pianta", pk=sala.pk)
+
+        colonne, righe = griglia(posti)
+        return self._render(
+            request, sala, form,
+            anteprima=True, colonne=colonne, righe=righe,
+            modifiche=confronta_pianta(sala, posti), totale=len(posti),
+        )
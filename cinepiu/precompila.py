@@ -0,0 +1,37 @@
+import time
+from django.conf import settings
+from django.template import TemplateSyntaxError, engines
+from django.template.autoreload import get_template_directories
+
+
+def trova_template():
+    # template del progetto: templates/ e le cartelle templates/ delle app (escluse librerie esterne)
+    base_dir = settings.BASE_DIR.resolve()
+    nomi = set()
+    for cartella in get_template_directories():
+        cartella = cartella.resolve()
+        if not cartella.is_dir() or not cartella.is_relative_to(base_dir):
+            continue
+        for file in cartella.rglob("*"):
+            if file.is_file() and file.suffix in {".html", ".txt"}:
+                nomi.add(file.relative_to(cartella).as_posix())
+    return sorted(nomi)
+
+
+def precompila_template():
+    """
+    Compila ogni template del progetto. Con il loader in cache (profilo di produzione) i template
+    compilati restano in memoria nel processo, quindi la prima richiesta dopo un deploy o il riavvio
+    di un worker non paga il parsing. Restituisce [(nome, millisecondi, errore)].
+    """
+    engine = engines["django"]
+    risultati = []
+    for nome in trova_template():
+        inizio = time.perf_counter()
+        errore = None
+        try:
+            engine.get_template(nome)
+        except TemplateSyntaxError as e:
+            errore = str(e)
+        risultati.append((nome, (time.perf_counter() - inizio) * 1000, errore))
+    return risultati
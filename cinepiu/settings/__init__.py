@@ -0,0 +1,23 @@
+"""
+Sceglie il profilo di impostazioni in base alla variabile d'ambiente CINEPIU_PROFILO:
+
+- dev   (default) sviluppo locale, DEBUG attivo
+- prod  produzione: DEBUG spento, cache, sessioni in cache, connessioni persistenti, template in cache
+- bench come prod, ma pensato per benchmark e prove di carico in locale
+
+In alternativa si può puntare direttamente a un profilo, es. DJANGO_SETTINGS_MODULE=cinepiu.settings.prod
+"""
+
+import os
+
+PROFILO = os.environ.get("CINEPIU_PROFILO", "dev").strip().lower()
+
+if PROFILO == "prod":
+    from .prod import *  # noqa: F401,F403
+elif PROFILO == "bench":
+    from .bench import *  # noqa: F401,F403
+elif PROFILO == "dev":
+    from .dev import *  # noqa: F401,F403
+else:
+    from django.core.exceptions import ImproperlyConfigured
+    raise ImproperlyConfigured(f"CINEPIU_PROFILO sconosciuto: {PROFILO!r} (valori ammessi: dev, prod, bench).")
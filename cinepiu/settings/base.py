@@ -0,0 +1,219 @@
+"""
+Django settings for cinepiu project.
+
+Generated by 'django-admin startproject' using Django 6.0.
+
+Impostazioni comuni a tutti i profili (dev/prod/bench): il profilo attivo viene scelto
+in cinepiu/settings/__init__.py tramite la variabile d'ambiente CINEPIU_PROFILO.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/6.0/topics/settings/
+
+For the full list of settings and their values, see
+https://docs.djangoproject.com/en/6.0/ref/settings/
+"""
+
+import os
+from decimal import Decimal
+from pathlib import Path
+
+# Build paths inside the project like this: BASE_DIR / 'subdir'.
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+
+
+def env_bool(nome, default=False):
+    valore = os.environ.get(nome)
+    if valore is None:
+        return default
+    return valore.strip().lower() in {"1", "true", "yes", "si", "on"}
+
+
+def env_list(nome, default=""):
+    return [v.strip() for v in os.environ.get(nome, default).split(",") if v.strip()]
+
+
+# SECURITY WARNING: keep the secret key used in production secret!
+# (ogni profilo decide se accettare un valore di default)
+SECRET_KEY = os.environ.get("DJANGO_SECRET_KEY", "")
+
+# SECURITY WARNING: don't run with debug turned on in production!
+DEBUG = False
+
+ALLOWED_HOSTS = env_list("DJANGO_ALLOWED_HOSTS")
+
+
+# Application definition
+
+INSTALLED_APPS = [
+    'django.contrib.admin',
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+    'cinema.apps.CinemaConfig',
+    'sales.apps.SalesConfig',
+    'accounts.apps.AccountsConfig',
+    'monitoraggio.apps.MonitoraggioConfig',
+    'crispy_forms',
+    'crispy_bootstrap5',
+]
+
+MIDDLEWARE = [
+    'django.middleware.security.SecurityMiddleware',
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'accounts.middleware.UtenteInCacheMiddleware',  # attivo solo con ACCOUNTS_CACHE_UTENTE
+    'monitoraggio.profiler.ProfilerMiddleware',  # attivo solo con PROFILER_ATTIVO
+    'monitoraggio.metriche.MetricheMiddleware',  # attivo solo con METRICHE_ATTIVE
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+
+ROOT_URLCONF = 'cinepiu.urls'
+
+TEMPLATES = [
+    {
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'DIRS': [BASE_DIR / 'templates'],
+        'APP_DIRS': True,
+        'OPTIONS': {
+            'context_processors': [
+                'django.template.context_processors.request',
+                'django.contrib.auth.context_processors.auth',
+                'django.contrib.messages.context_processors.messages',
+                "accounts.permissions.staff_flags",
+                "sales.idempotenza.chiave_idempotenza",
+            ],
+        },
+    },
+]
+
+WSGI_APPLICATION = 'cinepiu.wsgi.application'
+
+
+# Database
+# https://docs.djangoproject.com/en/6.0/ref/settings/#databases
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get("CINEPIU_DB_PATH", BASE_DIR / 'db.sqlite3'),
+    }
+}
+
+DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+
+# Password validation
+# https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
+
+AUTH_PASSWORD_VALIDATORS = [
+    {
+        'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.CommonPasswordValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator',
+    },
+]
+
+
+# Internationalization
+# https://docs.djangoproject.com/en/6.0/topics/i18n/
+
+LANGUAGE_CODE = 'it-it'
+
+TIME_ZONE = 'Europe/Rome'
+
+USE_I18N = True
+
+USE_TZ = True
+
+
+# Static files (CSS, JavaScript, Images)
+# https://docs.djangoproject.com/en/6.0/howto/static-files/
+
+STATIC_URL = '/static/'
+STATICFILES_DIRS = [BASE_DIR / 'static']
+
+CRISPY_ALLOWED_TEMPLATE_PACKS = ["bootstrap5"]
+CRISPY_TEMPLATE_PACK = "bootstrap5"
+
+LOGIN_REDIRECT_URL = 'home'   # nome della url, non il path
+LOGOUT_REDIRECT_URL = 'home'
+
+LOGIN_URL = 'login' #in caso un utente non loggato prova ad accedere ad una view protetta
+
+SECURE_REFERRER_POLICY = "strict-origin-when-cross-origin"
+
+AUTH_USER_MODEL = "accounts.User"
+
+# Programmazione: giorni mostrati nelle pagine e tetto di proiezioni caricate per film
+# (le date successive si caricano con "Altre date")
+PROGRAMMAZIONE_ORIZZONTE_GIORNI = 7
+PROGRAMMAZIONE_MAX_PROIEZIONI_FILM = 35
+
+# Prezzi senza tariffe configurate (vedi sales/prezzi.py)
+PREZZO_BASE = Decimal("8.00")
+SCONTO_SOCIO = Decimal("2.00")
+
+# Ammissione alle prenotazioni (vedi sales/ammissione.py): limiti di frequenza per utente e per IP,
+# come (gettoni, secondi per ricaricarli tutti), e tempi della sala d'attesa delle proiezioni più richieste
+LIMITI_PRENOTAZIONE_ATTIVI = env_bool("CINEPIU_LIMITI_PRENOTAZIONE")
+LIMITE_PRENOTAZIONE_UTENTE = (10, 60)
+LIMITE_PRENOTAZIONE_IP = (60, 60)
+SALA_ATTESA_ATTIVA = env_bool("CINEPIU_SALA_ATTESA", True)  # con più processi richiede redis (vedi prod.py)
+SALA_ATTESA_DURATA = 180  # secondi per scegliere i posti una volta ammessi
+SALA_ATTESA_CONFERMA = 30  # chi viene ammesso mentre non sta aspettando perde il turno dopo questi secondi
+
+# Reverse proxy fidati davanti al sito: l'IP del cliente (limiti di frequenza) si legge da X-Forwarded-For
+PROXY_FIDATI = int(os.environ.get("CINEPIU_PROXY_FIDATI", 0))
+
+# Chiavi di idempotenza delle prenotazioni e degli annullamenti (vedi sales/idempotenza.py)
+IDEMPOTENZA_DURATA = 60 * 60 * 24  # secondi per cui una richiesta ripetuta restituisce l'esito originale
+
+# Archiviazione (python manage.py archivia, vedi cinema/archivio.py)
+ARCHIVIO_GIORNI_FILM = 90  # film senza proiezioni da più di tanti giorni
+ARCHIVIO_GIORNI_PROIEZIONI = 365  # proiezioni (e biglietti) più vecchie di tanti giorni
+ARCHIVIO_CARTELLA = BASE_DIR / "archivio"
+
+# Email
+DEFAULT_FROM_EMAIL = "CINE+ <newsletter@cinepiu.it>"
+EMAIL_HOST = os.environ.get("EMAIL_HOST", "localhost")
+EMAIL_PORT = int(os.environ.get("EMAIL_PORT", 25))
+EMAIL_HOST_USER = os.environ.get("EMAIL_HOST_USER", "")
+EMAIL_HOST_PASSWORD = os.environ.get("EMAIL_HOST_PASSWORD", "")
+EMAIL_USE_TLS = env_bool("EMAIL_USE_TLS")
+
+# utente e gruppi in sessione invece che dal database a ogni richiesta (vedi accounts/middleware.py);
+# con più processi richiede una cache condivisa
+ACCOUNTS_CACHE_UTENTE = env_bool("CINEPIU_CACHE_UTENTE")
+
+# Profiler a campione (vedi monitoraggio/profiler.py): report consultabili dai superuser in /monitoraggio/profili/
+PROFILER_ATTIVO = env_bool("CINEPIU_PROFILER")
+PROFILER_FRAZIONE = float(os.environ.get("CINEPIU_PROFILER_FRAZIONE", 0.01))  # frazione di richieste profilate
+PROFILER_HEADER = "X-Profila"  # un superuser può chiedere il profilo di una richiesta con questo header
+PROFILER_CARTELLA = BASE_DIR / ".profili"
+PROFILER_MAX_REPORT = 200
+
+# Metriche Prometheus su /metrics (vedi monitoraggio/metriche.py). Con più processi ogni worker
+# salva il proprio stato in METRICHE_CARTELLA (al massimo ogni METRICHE_INTERVALLO secondi)
+METRICHE_ATTIVE = env_bool("CINEPIU_METRICHE")
+METRICHE_CARTELLA = os.environ.get("CINEPIU_METRICHE_CARTELLA") or None
+METRICHE_INTERVALLO = 1
+METRICHE_IP_AMMESSI = env_list("CINEPIU_METRICHE_IP", "127.0.0.1,::1")
+
+# Log delle query più lente di QUERY_LENTE_SOGLIA_MS (None = disattivo), vedi monitoraggio/query_lente.py
+QUERY_LENTE_SOGLIA_MS = float(os.environ["CINEPIU_QUERY_LENTE_MS"]) if os.environ.get("CINEPIU_QUERY_LENTE_MS") else None
+QUERY_LENTE_FILE = BASE_DIR / ".profili" / "query_lente.jsonl"
+
+# compila tutti i template all'avvio del worker (vedi wsgi.py / asgi.py)
+PRECOMPILA_TEMPLATE = False
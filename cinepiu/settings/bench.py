@@ -0,0 +1,25 @@
+"""
+Profilo per benchmark e prove di carico in locale: CINEPIU_PROFILO=bench
+
+Stesse ottimizzazioni di prod, ma con valori di default che non richiedono configurazione
+e un database separato (CINEPIU_DB_PATH, default bench.sqlite3) per non sporcare quello di sviluppo.
+"""
+
+import os
+from copy import deepcopy
+
+# prima di importare prod, che altrimenti rifiuta una SECRET_KEY vuota
+os.environ.setdefault("DJANGO_SECRET_KEY", "bench-insecure-solo-per-prove-di-carico")
+
+from .prod import *  # noqa: E402,F401,F403
+from .prod import BASE_DIR, DATABASES  # noqa: E402
+
+ALLOWED_HOSTS = ["*"]
+
+DATABASES = deepcopy(DATABASES)
+DATABASES["default"]["NAME"] = os.environ.get("CINEPIU_DB_PATH", BASE_DIR / "bench.sqlite3")
+
+# creare migliaia di utenti di prova con PBKDF2 richiederebbe minuti
+PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
+
+EMAIL_BACKEND = "django.core.mail.backends.locmem.EmailBackend"
@@ -0,0 +1,23 @@
+"""
+Profilo di sviluppo (default).
+"""
+
+from .base import *  # noqa: F401,F403
+from .base import env_list
+
+# Quick-start development settings - unsuitable for production
+# See https://docs.djangoproject.com/en/6.0/howto/deployment/checklist/
+SECRET_KEY = SECRET_KEY or 'django-insecure-_s%+ecd+i)j4$feb2+s)@vma1z$0)8p7-@b^=bcg7cmd5r5w$@'  # noqa: F405
+
+DEBUG = True
+
+ALLOWED_HOSTS = env_list("DJANGO_ALLOWED_HOSTS")
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+
+# in sviluppo le mail vengono stampate a console
+EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
@@ -0,0 +1,92 @@
+"""
+Profilo di produzione: CINEPIU_PROFILO=prod
+
+Variabili d'ambiente:
+- DJANGO_SECRET_KEY (obbligatoria), DJANGO_ALLOWED_HOSTS (separati da virgola)
+- CINEPIU_DB_PATH, CINEPIU_DB_CONN_MAX_AGE
+- CINEPIU_CACHE: locmem (default), file oppure redis
+- CINEPIU_CACHE_LOCATION: cartella per "file", URL per "redis" (es. redis://127.0.0.1:6379/1)
+- CINEPIU_CACHE_UTENTE=1: utente e gruppi in sessione (solo con cache file o redis)
+- CINEPIU_LIMITI_PRENOTAZIONE=1: limiti di frequenza sulle prenotazioni (solo con cache file o redis)
+- CINEPIU_SALA_ATTESA=1: sala d'attesa delle proiezioni più richieste (solo con cache redis)
+- CINEPIU_PROXY_FIDATI: numero di reverse proxy davanti al sito (IP del cliente da X-Forwarded-For)
+"""
+
+import os
+from copy import deepcopy
+from django.core.exceptions import ImproperlyConfigured
+from .base import *  # noqa: F401,F403
+from .base import (
+    ACCOUNTS_CACHE_UTENTE, BASE_DIR, DATABASES, LIMITI_PRENOTAZIONE_ATTIVI, SECRET_KEY, TEMPLATES, env_bool, env_list,
+)
+
+if not SECRET_KEY:
+    raise ImproperlyConfigured("Nel profilo prod la variabile DJANGO_SECRET_KEY è obbligatoria.")
+
+DEBUG = False  # con DEBUG attivo ogni query viene salvata in connection.queries: la memoria cresce senza limite
+
+ALLOWED_HOSTS = env_list("DJANGO_ALLOWED_HOSTS", "localhost,127.0.0.1")
+
+
+# Cache
+CACHE_BACKENDS = {
+    "locmem": "django.core.cache.backends.locmem.LocMemCache",
+    "file": "django.core.cache.backends.filebased.FileBasedCache",
+    "redis": "django.core.cache.backends.redis.RedisCache",
+}
+CACHE_LOCATION_DEFAULT = {
+    "locmem": "cinepiu",
+    "file": str(BASE_DIR / ".cache"),
+    "redis": "redis://127.0.0.1:6379/1",
+}
+
+_cache = os.environ.get("CINEPIU_CACHE", "locmem").strip().lower()
+if _cache not in CACHE_BACKENDS:
+    raise ImproperlyConfigured(f"CINEPIU_CACHE sconosciuta: {_cache!r} (valori ammessi: {', '.join(CACHE_BACKENDS)}).")
+
+CACHES = {
+    "default": {
+        "BACKEND": CACHE_BACKENDS[_cache],
+        "LOCATION": os.environ.get("CINEPIU_CACHE_LOCATION", CACHE_LOCATION_DEFAULT[_cache]),
+        "TIMEOUT": 300,
+    }
+}
+
+if ACCOUNTS_CACHE_UTENTE and _cache == "locmem":
+    raise ImproperlyConfigured("CINEPIU_CACHE_UTENTE richiede una cache condivisa tra i processi (CINEPIU_CACHE=file o redis).")
+
+# con locmem ogni worker avrebbe i propri secchi di gettoni (limiti moltiplicati per il numero di worker)
+if LIMITI_PRENOTAZIONE_ATTIVI and _cache == "locmem":
+    raise ImproperlyConfigured("CINEPIU_LIMITI_PRENOTAZIONE richiede una cache condivisa tra i processi (CINEPIU_CACHE=file o redis).")
+
+# la coda della sala d'attesa deve essere la stessa per tutti i worker e il suo lucchetto usa cache.add,
+# atomica solo con redis
+SALA_ATTESA_ATTIVA = env_bool("CINEPIU_SALA_ATTESA")
+if SALA_ATTESA_ATTIVA and _cache != "redis":
+    raise ImproperlyConfigured("CINEPIU_SALA_ATTESA richiede la cache redis (CINEPIU_CACHE=redis).")
+
+# sessioni lette dalla cache, con il database come persistenza
+SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
+
+
+# Database: connessioni persistenti tra una richiesta e l'altra
+DATABASES = deepcopy(DATABASES)
+DATABASES["default"]["CONN_MAX_AGE"] = int(os.environ.get("CINEPIU_DB_CONN_MAX_AGE", 60))
+DATABASES["default"]["CONN_HEALTH_CHECKS"] = True
+
+
+# Loader in cache: ogni template viene letto e compilato una volta sola per processo.
+# APP_DIRS va disattivato quando i loader sono indicati esplicitamente.
+TEMPLATES = deepcopy(TEMPLATES)
+TEMPLATES[0]["APP_DIRS"] = False
+TEMPLATES[0]["OPTIONS"]["loaders"] = [
+    (
+        "django.template.loaders.cached.Loader",
+        [
+            "django.template.loaders.filesystem.Loader",
+            "django.template.loaders.app_directories.Loader",
+        ],
+    ),
+]
+
+PRECOMPILA_TEMPLATE = True
@@ -21,6 +21,7 @@ from . import views
 from cinema.views import FilmInProgrammazioneListView
 from django.contrib.auth import views as auth_views
 from cinepiu.views import UserCreateView, InfoView
+from monitoraggio import views as monitoraggio_views
 
 urlpatterns = [
     path('', FilmInProgrammazioneListView.as_view(), name='home'),
@@ -34,6 +35,8 @@ urlpatterns = [
     path("", include("cinema.urls")),
     path("sales/", include("sales.urls")),
     path("accounts/", include("accounts.urls")),
+    path("monitoraggio/", include("monitoraggio.urls")),
+    path("metrics", monitoraggio_views.metriche, name="metriche"),
     path("accounts/", include("django.contrib.auth.urls"))
 
 
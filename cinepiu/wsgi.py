@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cinepiu.settings')
 
 application = get_wsgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if getattr(settings, "PRECOMPILA_TEMPLATE", False):
+    # warm-up: la prima richiesta dopo il riavvio del worker trova i template già compilati
+    from cinepiu.precompila import precompila_template
+    precompila_template()
@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+
+class MonitoraggioConfig(AppConfig):
+    name = 'monitoraggio'
+
+    def ready(self):
+        from .query_lente import installa
+        connection_created.connect(installa, dispatch_uid="monitoraggio_query_lente")
@@ -0,0 +1,84 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from cinema.models import Sala
+
+
+def _percentile(valori, p):
+    valori = sorted(valori)
+    return valori[min(len(valori) - 1, int(len(valori) * p))] if valori else 0
+
+
+class Command(BaseCommand):
+    help = (
+        "Confronta le API JSON servite dal gestore WSGI (thread) e ASGI (event loop) con richieste concorrenti, "
+        "nello stesso processo: richieste al secondo e latenza p50/p95."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--richieste", type=int, default=200, help="Richieste per ogni modalità (default: 200).")
+        parser.add_argument("--concorrenza", type=int, default=20, help="Richieste contemporanee (default: 20).")
+        parser.add_argument("--url", action="append", default=[], help="URL da chiamare, ripetibile (default: le API JSON).")
+
+    def _url_default(self):
+        url = [
+            reverse("cinema:film_suggestions") + "?q=the",
+            reverse("cinema:programmazione_oggi"),
+        ]
+        sala = Sala.objects.order_by("pk").first()
+        if sala:
+            url.append(reverse("cinema:sala_impegni", args=[sala.pk]) + f"?dal={timezone.localdate()}")
+        return url
+
+    def handle(self, *args, **options):
+        url = options["url"] or self._url_default()
+        n, concorrenza = options["richieste"], options["concorrenza"]
+        if n < 1 or concorrenza < 1:
+            raise CommandError("--richieste e --concorrenza devono essere positivi.")
+
+        self.stdout.write(f"{n} richieste, {concorrenza} contemporanee, su: {', '.join(url)}")
+        for nome, misura in [("WSGI (thread)", self._wsgi), ("ASGI (async)", self._asgi)]:
+            inizio = time.perf_counter()
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):  # host dei client di test
+                latenze, errori = misura(url, n, concorrenza)
+            totale = time.perf_counter() - inizio
+            self.stdout.write(self.style.SUCCESS(
+                f"{nome:14} {n / totale:8.1f} req/s  p50 {_percentile(latenze, 0.5) * 1000:7.1f} ms  "
+                f"p95 {_percentile(latenze, 0.95) * 1000:7.1f} ms  media {statistics.fmean(latenze) * 1000:7.1f} ms  errori {errori}"
+            ))
+
+    def _wsgi(self, url, n, concorrenza):
+        def richiesta(i):
+            client = Client()
+            inizio = time.perf_counter()
+            response = client.get(url[i % len(url)])
+            durata = time.perf_counter() - inizio
+            connections.close_all()  # ogni thread apre la propria connessione
+            return durata, response.status_code >= 400
+
+        with ThreadPoolExecutor(max_workers=concorrenza) as pool:
+            risultati = list(pool.map(richiesta, range(n)))
+        return [r[0] for r in risultati], sum(r[1] for r in risultati)
+
+    def _asgi(self, url, n, concorrenza):
+        async def tutte():
+            client = AsyncClient()
+            semaforo = asyncio.Semaphore(concorrenza)
+
+            async def richiesta(i):
+                async with semaforo:
+                    inizio = time.perf_counter()
+                    response = await client.get(url[i % len(url)])
+                    return time.perf_counter() - inizio, response.status_code >= 400
+
+            return await asyncio.gather(*(richiesta(i) for i in range(n)))
+
+        risultati = asyncio.run(tutte())
+        return [r[0] for r in risultati], sum(r[1] for r in risultati)
@@ -0,0 +1,175 @@
+import random
+import statistics
+import time
+from datetime import datetime, time as ora, timedelta
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from cinema.models import Film, Posto, Proiezione, Sala
+from sales.models import Biglietto
+
+User = get_user_model()
+
+# indici introdotti per le query sui dati "vivi" (Proiezione.future, Biglietto.active)
+INDICI = [
+    (Proiezione, "proiezione_data_ora_idx"),
+    (Proiezione, "proiezione_film_data_idx"),
+    (Biglietto, "biglietto_utente_online_idx"),
+]
+
+
+class _Annulla(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera uno storico sintetico di più anni dentro una transazione, misura le query sulle proiezioni "
+        "future e sulle prenotazioni attive con e senza gli indici dedicati, poi annulla tutto."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--anni", type=int, default=5, help="Anni di storico da generare (default: 5).")
+        parser.add_argument("--sale", type=int, default=3, help="Sale (default: 3).")
+        parser.add_argument("--biglietti", type=int, default=15, help="Biglietti per proiezione (default: 15).")
+        parser.add_argument("--ripetizioni", type=int, default=30, help="Esecuzioni di ogni query (default: 30).")
+        parser.add_argument("--piano", action="store_true", help="Mostra anche il piano di esecuzione delle query.")
+
+    def handle(self, *args, **options):
+        if min(options["anni"], options["sale"], options["biglietti"], options["ripetizioni"]) < 1:
+            raise CommandError("Tutti i parametri devono essere positivi.")
+        if not connection.features.can_rollback_ddl:
+            # gli indici vengono rimossi e ripristinati con il rollback: serve DDL transazionale
+            raise CommandError(f"Il backend {connection.vendor} non supporta DDL transazionale.")
+
+        try:
+            with transaction.atomic():
+                dati = self._genera(options)
+                query = self._query(dati)
+
+                con = self._misura(query, options)
+                self._rimuovi_indici()
+                senza = self._misura(query, options)
+
+                self._stampa(con, senza)
+                raise _Annulla
+        except _Annulla:
+            self.stdout.write("Dati di prova e indici ripristinati (rollback).")
+
+    def _genera(self, options):
+        rnd = random.Random(42)
+        now = timezone.now()
+        oggi = timezone.localdate()
+        inizio = oggi - timedelta(days=365 * options["anni"])
+        giorni = (oggi - inizio).days + 28  # storico + quattro settimane di programmazione
+
+        self.stdout.write(f"Genero {giorni} giorni di programmazione su {options['sale']} sale...")
+        sale = Sala.objects.bulk_create([Sala(nome=f"Benchmark {i + 1}") for i in range(options["sale"])])
+        posti = {
+            sala.pk: Posto.objects.bulk_create([
+                Posto(sala=sala, fila=chr(65 + i // 10), numero_posto=str(i % 10 + 1))
+                for i in range(max(options["biglietti"], 40))
+            ])
+            for sala in sale
+        }
+        utenti = User.objects.bulk_create([
+            User(username=f"benchmark-indici-{i}", email=f"benchmark-indici-{i}@example.com", password="!")
+            for i in range(500)
+        ])
+        # un film nuovo ogni settimana, come in programmazione reale
+        films = Film.objects.bulk_create([
+            Film(
+                titolo=f"Benchmark {i}", descrizione="-", durata_minuti=rnd.randint(90, 150),
+                data_uscita=inizio + timedelta(weeks=i), uscita_locale=inizio + timedelta(weeks=i),
+                in_programmazione=inizio + timedelta(weeks=i), genere="-", regista="-", cast_principale="-",
+                locandina_url="https://example.com/locandina.jpg",
+            )
+            for i in range(giorni // 7 + 1)
+        ])
+
+        proiezioni = []
+        for g in range(giorni):
+            giorno = inizio + timedelta(days=g)
+            in_sala = films[max(0, g // 7 - 3):g // 7 + 1]  # ogni film resta in sala quattro settimane
+            for sala in sale:
+                for turno, ore in enumerate((15, 18, 21)):
+                    proiezioni.append(Proiezione(
+                        film=in_sala[(turno + sala.pk) % len(in_sala)], sala=sala,
+                        data_ora=timezone.make_aware(datetime.combine(giorno, ora(ore))),
+                    ))
+        proiezioni = Proiezione.objects.bulk_create(proiezioni, batch_size=2000)
+
+        biglietti = []
+        for p in proiezioni:
+            for posto in rnd.sample(posti[p.sala_id], options["biglietti"]):
+                online = rnd.random() < 0.7  # il resto è venduto in segreteria, senza utente
+                biglietti.append(Biglietto(
+                    proiezione=p, posto=posto, utente=rnd.choice(utenti) if online else None,
+                    nome_cliente="" if online else "Cliente",
+                ))
+            if len(biglietti) >= 20000:
+                Biglietto.objects.bulk_create(biglietti, batch_size=2000)
+                biglietti = []
+        Biglietto.objects.bulk_create(biglietti, batch_size=2000)
+
+        self._analizza()
+        self.stdout.write(
+            f"{len(films)} film, {len(proiezioni)} proiezioni "
+            f"({Proiezione.future.count()} future), {Biglietto.objects.count()} biglietti"
+        )
+        return {"rnd": rnd, "films": films, "utenti": utenti, "now": now}
+
+    def _query(self, dati):
+        rnd, films, utenti, now = dati["rnd"], dati["films"], dati["utenti"], dati["now"]
+        recenti = films[-6:]
+        return {
+            # homepage e API: finestra della programmazione
+            "programmazione (7 giorni)": lambda: Proiezione.objects.future(now).filter(
+                data_ora__lt=now + timedelta(days=7)).order_by("data_ora"),
+            # FilmDetailView / form delle proiezioni
+            "proiezioni future di un film": lambda: Proiezione.future.filter(
+                film=rnd.choice(recenti)).order_by("data_ora"),
+            # UserDeleteView
+            "prenotazioni attive (utente)": lambda: Biglietto.active.filter(utente=rnd.choice(utenti)).values("pk")[:1],
+            # UserListView
+            "lista utenti con prenotazioni attive": lambda: User.objects.filter(
+                username__startswith="benchmark-indici-").annotate(
+                attive=Exists(Biglietto.active.filter(utente=OuterRef("pk")))).values("pk", "attive"),
+        }
+
+    def _misura(self, query, options):
+        risultati = {}
+        for nome, crea in query.items():
+            if options["piano"]:
+                self.stdout.write(f"-- {nome}\n{crea().explain()}")
+            durate = []
+            for _ in range(options["ripetizioni"]):
+                qs = crea()
+                inizio = time.perf_counter()
+                list(qs)
+                durate.append(time.perf_counter() - inizio)
+            risultati[nome] = statistics.median(durate)
+        return risultati
+
+    def _rimuovi_indici(self):
+        # DROP INDEX dentro la transazione (SQLite e PostgreSQL): il rollback finale lo annulla
+        with connection.cursor() as cursor:
+            for _, nome in INDICI:
+                cursor.execute(f"DROP INDEX {connection.ops.quote_name(nome)}")
+        self._analizza()
+        self.stdout.write("Indici rimossi: " + ", ".join(nome for _, nome in INDICI))
+
+    def _analizza(self):
+        # statistiche aggiornate per il planner (SQLite e PostgreSQL)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def _stampa(self, con, senza):
+        self.stdout.write(f"\n{'query':40} {'con indici':>12} {'senza':>12} {'guadagno':>9}")
+        for nome in con:
+            guadagno = senza[nome] / con[nome] if con[nome] else 0
+            self.stdout.write(self.style.SUCCESS(
+                f"{nome:40} {con[nome] * 1000:9.2f} ms {senza[nome] * 1000:9.2f} ms {guadagno:8.1f}x"
+            ))
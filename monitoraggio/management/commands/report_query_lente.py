@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from monitoraggio.query_lente import aggrega, leggi_log
+
+
+class Command(BaseCommand):
+    help = "Riepiloga il log delle query lente: impronte ordinate per tempo totale, con punti di chiamata e piano di esecuzione."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--file", default=None, help="Log da leggere (default: QUERY_LENTE_FILE).")
+        parser.add_argument("--limite", type=int, default=10, help="Quante impronte mostrare (default: 10).")
+        parser.add_argument("--piano", action="store_true", help="Mostra anche il piano di esecuzione della query più lenta.")
+
+    def handle(self, *args, **options):
+        file = options["file"] or settings.QUERY_LENTE_FILE
+        try:
+            righe = leggi_log(file)
+        except FileNotFoundError:
+            raise CommandError(f"Nessun log in {file}.")
+
+        voci = aggrega(righe)
+        self.stdout.write(self.style.NOTICE(f"{len(righe)} query lente, {len(voci)} impronte diverse."))
+
+        for voce in voci[:options["limite"]]:
+            self.stdout.write("")
+            self.stdout.write(self.style.SUCCESS(
+                f"{voce['totale_ms']:10.1f} ms totali  {voce['volte']:5}x  media {voce['media_ms']:.1f} ms  max {voce['max_ms']:.1f} ms"
+            ))
+            self.stdout.write(f"  {voce['impronta']}")
+            for sito, volte in sorted(voce["siti"].items(), key=lambda s: s[1], reverse=True)[:3]:
+                self.stdout.write(f"  <- {sito} ({volte}x)")
+            if options["piano"] and voce["piano"]:
+                for riga in voce["piano"].splitlines():
+                    self.stdout.write(f"     {riga}")
@@ -0,0 +1,257 @@
+import json
+import math
+import os
+import threading
+import time
+from pathlib import Path
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+# Registro delle metriche in memoria, esposto in formato testo Prometheus da /metrics.
+# Con più processi (gunicorn) ogni processo scrive periodicamente il proprio stato in
+# METRICHE_CARTELLA/<pid>.json e /metrics somma i file di tutti i processi.
+
+DURATE_SECONDI = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+NUMERO_QUERY = (1, 2, 5, 10, 20, 50, 100, 200)
+
+_lock = threading.Lock()
+_registro = {}
+_ultimo_salvataggio = 0.0
+
+
+class Metrica:
+    tipo = None
+
+    def __init__(self, nome, descrizione, etichette=()):
+        self.nome = nome
+        self.descrizione = descrizione
+        self.etichette = tuple(etichette)
+        self.valori = {}  # tupla dei valori delle etichette -> valore
+
+    def _chiave(self, etichette):
+        return tuple(str(etichette.get(e, "")) for e in self.etichette)
+
+    def stato(self):
+        return {
+            "tipo": self.tipo,
+            "descrizione": self.descrizione,
+            "etichette": list(self.etichette),
+            "valori": [[list(k), v] for k, v in self.valori.items()],
+        }
+
+
+class Contatore(Metrica):
+    tipo = "counter"
+
+    def inc(self, quanto=1, **etichette):
+        chiave = self._chiave(etichette)
+        with _lock:
+            self.valori[chiave] = self.valori.get(chiave, 0) + quanto
+
+
+class Istogramma(Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nome, descrizione, etichette=(), bucket=DURATE_SECONDI):
+        super().__init__(nome, descrizione, etichette)
+        self.bucket = tuple(bucket)
+
+    def osserva(self, valore, **etichette):
+        chiave = self._chiave(etichette)
+        with _lock:
+            # [conteggio per bucket (non cumulativo)..., +Inf, somma]
+            v = self.valori.setdefault(chiave, [0] * (len(self.bucket) + 1) + [0.0])
+            indice = next((i for i, limite in enumerate(self.bucket) if valore <= limite), len(self.bucket))
+            v[indice] += 1
+            v[-1] += valore
+
+    def stato(self):
+        return {**super().stato(), "bucket": list(self.bucket)}
+
+
+def _registra(metrica):
+    return _registro.setdefault(metrica.nome, metrica)
+
+
+def contatore(nome, descrizione, etichette=()):
+    return _registra(Contatore(nome, descrizione, etichette))
+
+
+def istogramma(nome, descrizione, etichette=(), bucket=DURATE_SECONDI):
+    return _registra(Istogramma(nome, descrizione, etichette, bucket))
+
+
+# --- metriche del sito ---
+
+DURATA_RICHIESTE = istogramma(
+    "cinepiu_richiesta_durata_secondi", "Durata delle richieste per vista.", ["vista", "metodo"],
+)
+QUERY_RICHIESTE = istogramma(
+    "cinepiu_richiesta_query", "Query al database per richiesta.", ["vista"], bucket=NUMERO_QUERY,
+)
+PRENOTAZIONI = contatore("cinepiu_prenotazioni_totale", "Prenotazioni completate.", ["canale"])
+BIGLIETTI_PRENOTATI = contatore("cinepiu_biglietti_prenotati_totale", "Biglietti creati dalle prenotazioni.", ["canale"])
+CONFLITTI = contatore("cinepiu_prenotazioni_conflitti_totale", "Prenotazioni fallite perché i posti erano appena stati presi.")
+RIFIUTI_LIMITE = contatore("cinepiu_prenotazioni_rifiutate_limite_totale", "Prenotazioni rifiutate per il limite di biglietti per utente.")
+RIFIUTI_FREQUENZA = contatore("cinepiu_prenotazioni_rifiutate_frequenza_totale", "POST di prenotazione rifiutate dai limiti di frequenza.", ["limite"])
+INGRESSI_SALA_ATTESA = contatore("cinepiu_sala_attesa_ingressi_totale", "Clienti entrati nella sala d'attesa di una proiezione.")
+RICHIESTE_RIPETUTE = contatore("cinepiu_richieste_ripetute_totale", "POST ripetute con la stessa chiave di idempotenza.", ["esito"])
+ANNULLAMENTI = contatore("cinepiu_annullamenti_totale", "Biglietti annullati dai clienti.")
+CACHE = contatore("cinepiu_cache_totale", "Letture dalla cache applicativa.", ["cache", "esito"])
+
+
+def registra_cache(nome, trovato):
+    CACHE.inc(cache=nome, esito="hit" if trovato else "miss")
+
+
+# --- più processi ---
+
+def stato_processo():
+    with _lock:
+        return {nome: m.stato() for nome, m in _registro.items()}
+
+
+def salva_stato(forza=False):
+    global _ultimo_salvataggio
+    cartella = settings.METRICHE_CARTELLA
+    if not cartella:
+        return
+    adesso = time.monotonic()
+    if not forza and adesso - _ultimo_salvataggio < settings.METRICHE_INTERVALLO:
+        return
+    _ultimo_salvataggio = adesso
+
+    cartella = Path(cartella)
+    cartella.mkdir(parents=True, exist_ok=True)
+    file = cartella / f"{os.getpid()}.json"
+    temporaneo = file.with_suffix(".tmp")
+    temporaneo.write_text(json.dumps(stato_processo()), encoding="utf-8")
+    os.replace(temporaneo, file)  # chi legge non vede mai un file scritto a metà
+
+
+def _somma(totale, stato):
+    for nome, m in stato.items():
+        voce = totale.setdefault(nome, {**m, "valori": {}})
+        for chiave, valore in m["valori"]:
+            chiave = tuple(chiave)
+            if chiave not in voce["valori"]:
+                voce["valori"][chiave] = valore
+            elif m["tipo"] == "histogram":
+                voce["valori"][chiave] = [a + b for a, b in zip(voce["valori"][chiave], valore)]
+            else:
+                voce["valori"][chiave] += valore
+
+
+def stato_aggregato():
+    totale = {}
+    cartella = settings.METRICHE_CARTELLA
+    if not cartella:
+        _somma(totale, stato_processo())
+        return totale
+
+    salva_stato(forza=True)
+    for file in Path(cartella).glob("*.json"):
+        try:
+            _somma(totale, json.loads(file.read_text(encoding="utf-8")))
+        except (OSError, ValueError):
+            continue
+    return totale
+
+
+# --- formato testo Prometheus ---
+
+def _escape(valore):
+    return str(valore).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _etichette(nomi, valori, extra=()):
+    coppie = [f'{n}="{_escape(v)}"' for n, v in list(zip(nomi, valori)) + list(extra)]
+    return "{" + ",".join(coppie) + "}" if coppie else ""
+
+
+def _numero(v):
+    if v == math.inf:
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+def formato_prometheus(stato):
+    righe = []
+    for nome in sorted(stato):
+        m = stato[nome]
+        righe.append(f"# HELP {nome} {m['descrizione']}")
+        righe.append(f"# TYPE {nome} {m['tipo']}")
+        for chiave, valore in sorted(m["valori"].items()):
+            if m["tipo"] == "histogram":
+                cumulativo = 0
+                for limite, conteggio in zip(list(m["bucket"]) + [math.inf], valore[:-1]):
+                    cumulativo += conteggio
+                    righe.append(f"{nome}_bucket{_etichette(m['etichette'], chiave, [('le', _numero(limite))])} {cumulativo}")
+                righe.append(f"{nome}_sum{_etichette(m['etichette'], chiave)} {_numero(valore[-1])}")
+                righe.append(f"{nome}_count{_etichette(m['etichette'], chiave)} {cumulativo}")
+            else:
+                righe.append(f"{nome}{_etichette(m['etichette'], chiave)} {_numero(valore)}")
+    return "\n".join(righe) + "\n"
+
+
+class MetricheMiddleware:
+    # durata e numero di query di ogni richiesta, per nome della vista (METRICHE_ATTIVE)
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICHE_ATTIVE:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _registra(self, request, durata, query):
+        match = request.resolver_match
+        vista = match.view_name if match else "non_trovata"  # etichetta limitata: mai il path
+        DURATA_RICHIESTE.osserva(durata, vista=vista, metodo=request.method)
+        QUERY_RICHIESTE.osserva(query, vista=vista)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        contatore = _ContaQuery()
+        inizio = time.perf_counter()
+        with connection.execute_wrapper(contatore):
+            response = self.get_response(request)
+        self._registra(request, time.perf_counter() - inizio, contatore.query)
+        salva_stato()
+        return response
+
+    async def __acall__(self, request):
+        # con l'ORM async le query girano nel thread di sync_to_async, che sotto ASGI è lo stesso per
+        # tutta la richiesta (ThreadSensitiveContext): il contatore si installa sulla connessione di quel
+        # thread, non su quella dell'event loop
+        contatore = _ContaQuery()
+        wrapper = await sync_to_async(contatore.installa)()
+        inizio = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(wrapper.__exit__)(None, None, None)
+        self._registra(request, time.perf_counter() - inizio, contatore.query)
+        await sync_to_async(salva_stato)()  # scrive su file: non nell'event loop
+        return response
+
+
+class _ContaQuery:
+    # execute_wrapper che conta le query di una richiesta
+    def __init__(self):
+        self.query = 0
+
+    def installa(self):
+        wrapper = connection.execute_wrapper(self)
+        wrapper.__enter__()
+        return wrapper
+
+    def __call__(self, execute, sql, params, many, context):
+        self.query += 1
+        return execute(sql, params, many, context)
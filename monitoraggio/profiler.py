@@ -0,0 +1,171 @@
+import cProfile
+import json
+import os
+import pstats
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from accounts.permissions import is_admin
+from .sql import normalizza_sql
+
+# Profiler a campione (PROFILER_ATTIVO): una frazione delle richieste (PROFILER_FRAZIONE) viene eseguita
+# sotto cProfile; un superuser può chiedere il profilo di una richiesta con l'header PROFILER_HEADER.
+# Ogni report è un file JSON in PROFILER_CARTELLA: vista, durata, riepilogo SQL e funzioni più costose.
+# Il middleware è solo sincrono (cProfile e il conteggio delle query lavorano sul thread corrente):
+# sotto ASGI, con il profiler attivo, le viste async vengono eseguite in un thread.
+# Dalla 3.12 può essere attivo un solo cProfile per processo (enable() solleva ValueError): le richieste
+# estratte mentre un'altra è già sotto profilo vengono servite normalmente, senza report.
+
+MAX_FUNZIONI = 30
+MAX_QUERY = 10
+
+_profilo_in_corso = threading.Lock()
+
+
+def cartella_report():
+    return Path(settings.PROFILER_CARTELLA)
+
+
+def _nome_funzione(chiave):
+    file, riga, funzione = chiave
+    if file == "~":  # funzioni built-in
+        return funzione
+    base = str(settings.BASE_DIR)
+    if file.startswith(base):
+        file = os.path.relpath(file, base)
+    elif "site-packages" in file:
+        file = file.split("site-packages" + os.sep, 1)[1]
+    return f"{file}:{riga}({funzione})"
+
+
+def riepilogo_funzioni(profiler):
+    stats = pstats.Stats(profiler).stats
+    righe = sorted(stats.items(), key=lambda kv: kv[1][3], reverse=True)[:MAX_FUNZIONI]
+    return [
+        {
+            "funzione": _nome_funzione(chiave),
+            "chiamate": nc,
+            "tempo_ms": round(tt * 1000, 2),
+            "cumulativo_ms": round(ct * 1000, 2),
+        }
+        for chiave, (cc, nc, tt, ct, callers) in righe
+    ]
+
+
+def riepilogo_sql(queries):
+    tempi = [(q["sql"], float(q.get("time") or 0) * 1000) for q in queries]
+    ripetute = Counter(normalizza_sql(sql) for sql, _ in tempi)
+    return {
+        "numero": len(tempi),
+        "tempo_ms": round(sum(ms for _, ms in tempi), 2),
+        "piu_lente": [
+            {"sql": sql, "ms": round(ms, 2)}
+            for sql, ms in sorted(tempi, key=lambda t: t[1], reverse=True)[:MAX_QUERY]
+        ],
+        # stessa query eseguita più volte: di solito un N+1
+        "ripetute": [
+            {"sql": sql, "volte": volte}
+            for sql, volte in ripetute.most_common(MAX_QUERY) if volte > 1
+        ],
+    }
+
+
+def salva_report(report):
+    cartella = cartella_report()
+    cartella.mkdir(parents=True, exist_ok=True)
+    report["id"] = f"{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+    (cartella / f"{report['id']}.json").write_text(json.dumps(report), encoding="utf-8")
+
+    # tengo solo gli ultimi PROFILER_MAX_REPORT
+    file = sorted(cartella.glob("*.json"))
+    for vecchio in file[:-settings.PROFILER_MAX_REPORT]:
+        vecchio.unlink(missing_ok=True)
+    return report["id"]
+
+
+def leggi_report(report_id):
+    try:
+        return json.loads((cartella_report() / f"{report_id}.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def report_piu_lenti(limite=50):
+    report = []
+    for file in cartella_report().glob("*.json"):
+        try:
+            dati = json.loads(file.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            continue  # file scritto a metà o rimosso nel frattempo
+        dati.pop("funzioni", None)
+        report.append(dati)
+    report.sort(key=lambda r: r["durata_ms"], reverse=True)
+    return report[:limite]
+
+
+class ProfilerMiddleware:
+    # va dopo AuthenticationMiddleware: l'header è accettato solo dai superuser
+
+    def __init__(self, get_response):
+        if not settings.PROFILER_ATTIVO:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def da_profilare(self, request):
+        if settings.PROFILER_HEADER in request.headers:
+            return is_admin(request.user)
+        return random.random() < settings.PROFILER_FRAZIONE
+
+    def __call__(self, request):
+        if not self.da_profilare(request):
+            return self.get_response(request)
+
+        if not _profilo_in_corso.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            return self._profila(request)
+        finally:
+            _profilo_in_corso.release()
+
+    def _profila(self, request):
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:  # un altro strumento di profiling è già attivo
+            return self.get_response(request)
+        queries = []
+
+        def registra(execute, sql, params, many, context):
+            inizio_query = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                queries.append({"sql": sql, "time": time.perf_counter() - inizio_query})
+
+        inizio = time.perf_counter()
+        try:
+            with connection.execute_wrapper(registra):
+                response = self.get_response(request)
+        finally:
+            profiler.disable()
+        durata_ms = (time.perf_counter() - inizio) * 1000
+
+        match = request.resolver_match
+        report_id = salva_report({
+            "path": request.path,
+            "metodo": request.method,
+            "vista": match.view_name if match else "",
+            "stato": response.status_code,
+            "durata_ms": round(durata_ms, 2),
+            "quando": time.time(),
+            "sql": riepilogo_sql(queries),
+            "funzioni": riepilogo_funzioni(profiler),
+        })
+        response["X-Profilo"] = report_id
+        return response
@@ -0,0 +1,119 @@
+import json
+import threading
+import time
+import traceback
+from pathlib import Path
+from django.conf import settings
+from django.db import DatabaseError
+from .sql import normalizza_sql
+
+# Log delle query lente (QUERY_LENTE_SOGLIA_MS): un execute_wrapper installato su ogni connessione
+# misura ogni query e scrive su QUERY_LENTE_FILE (una riga JSON per query) quelle sopra soglia, con
+# impronta normalizzata, parametri, punto del codice che l'ha eseguita e, per le SELECT su SQLite e
+# PostgreSQL, il piano di esecuzione. Il comando report_query_lente aggrega il file per impronta.
+
+MAX_PARAMETRI = 500
+EXPLAIN = {
+    "sqlite": "EXPLAIN QUERY PLAN ",
+    "postgresql": "EXPLAIN ",
+}
+
+_locale = threading.local()
+_scrittura = threading.Lock()
+
+
+def punto_di_chiamata():
+    # primo frame del progetto che non sia Django o questo modulo: di solito la vista o il servizio
+    base = str(settings.BASE_DIR)
+    for frame in reversed(traceback.extract_stack()[:-2]):
+        file = frame.filename
+        if file.startswith(base) and "site-packages" not in file and file != __file__:
+            return f"{Path(file).relative_to(base)}:{frame.lineno} in {frame.name}"
+    return ""
+
+
+def _piano(connection, sql, params):
+    prefisso = EXPLAIN.get(connection.vendor)
+    if not prefisso or not sql.lstrip().upper().startswith("SELECT"):
+        return None
+    _locale.in_explain = True  # le query dell'EXPLAIN non passano dal log
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(prefisso + sql, params)
+            return "\n".join(" ".join(str(c) for c in riga) for riga in cursor.fetchall())
+    except DatabaseError as e:
+        return f"EXPLAIN non riuscito: {e}"
+    finally:
+        _locale.in_explain = False
+
+
+class RegistraQueryLente:
+    def __init__(self, soglia_ms, file):
+        self.soglia_ms = soglia_ms
+        self.file = Path(file)
+
+    def __call__(self, execute, sql, params, many, context):
+        if getattr(_locale, "in_explain", False):
+            return execute(sql, params, many, context)
+
+        inizio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            ms = (time.perf_counter() - inizio) * 1000
+            if ms >= self.soglia_ms:
+                self.registra(context["connection"], sql, params, many, ms)
+
+    def registra(self, connection, sql, params, many, ms):
+        riga = {
+            "quando": time.time(),
+            "ms": round(ms, 2),
+            "impronta": normalizza_sql(sql),
+            "sql": sql,
+            "parametri": repr(params)[:MAX_PARAMETRI],
+            "sito": punto_di_chiamata(),
+            "piano": None if many else _piano(connection, sql, params),
+        }
+        self.file.parent.mkdir(parents=True, exist_ok=True)
+        with _scrittura, self.file.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(riga) + "\n")
+
+
+def installa(sender, connection, **kwargs):
+    # receiver di connection_created (vedi apps.py)
+    soglia = settings.QUERY_LENTE_SOGLIA_MS
+    if soglia is None:
+        return
+    if not any(isinstance(w, RegistraQueryLente) for w in connection.execute_wrappers):
+        connection.execute_wrappers.append(RegistraQueryLente(soglia, settings.QUERY_LENTE_FILE))
+
+
+def aggrega(righe):
+    # righe del log -> una voce per impronta, con tempi e punti di chiamata
+    impronte = {}
+    for r in righe:
+        voce = impronte.setdefault(r["impronta"], {
+            "impronta": r["impronta"], "volte": 0, "totale_ms": 0.0, "max_ms": 0.0, "siti": {}, "piano": None,
+        })
+        voce["volte"] += 1
+        voce["totale_ms"] += r["ms"]
+        if r["ms"] >= voce["max_ms"]:
+            voce["max_ms"] = r["ms"]
+            voce["piano"] = r.get("piano") or voce["piano"]
+        if r.get("sito"):
+            voce["siti"][r["sito"]] = voce["siti"].get(r["sito"], 0) + 1
+
+    for voce in impronte.values():
+        voce["media_ms"] = voce["totale_ms"] / voce["volte"]
+    return sorted(impronte.values(), key=lambda v: v["totale_ms"], reverse=True)
+
+
+def leggi_log(file):
+    righe = []
+    with Path(file).open(encoding="utf-8") as f:
+        for linea in f:
+            try:
+                righe.append(json.loads(linea))
+            except ValueError:
+                continue  # riga troncata (processo interrotto durante la scrittura)
+    return righe
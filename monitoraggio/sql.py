@@ -0,0 +1,16 @@
+import re
+
+# Normalizzazione delle query: valori letterali sostituiti da "?", così le stesse query con
+# parametri diversi hanno la stessa impronta e si possono contare/sommare insieme.
+
+_STRINGHE = re.compile(r"'(?:[^']|'')*'")
+_NUMERI = re.compile(r"\b\d+(?:\.\d+)?\b")
+_LISTE = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_SPAZI = re.compile(r"\s+")
+
+
+def normalizza_sql(sql):
+    sql = _STRINGHE.sub("?", sql)
+    sql = _NUMERI.sub("?", sql)
+    sql = _LISTE.sub("(?)", sql)  # IN (1, 2, 3) e IN (4, 5) sono la stessa query
+    return _SPAZI.sub(" ", sql).strip()
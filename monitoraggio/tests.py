@@ -0,0 +1,212 @@
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from cinema.models import Film, Posto, Proiezione, Sala
+from monitoraggio.metriche import ANNULLAMENTI, QUERY_RICHIESTE, salva_stato
+from monitoraggio.profiler import _profilo_in_corso, leggi_report
+from monitoraggio.query_lente import RegistraQueryLente, aggrega, leggi_log
+from monitoraggio.sql import normalizza_sql
+from sales.models import Biglietto
+
+User = get_user_model()
+
+
+class ProfilerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(username="admin", password="pass", email="a@x.it")
+        cls.cliente = User.objects.create_user(username="cliente", password="pass", email="c@x.it")
+
+    def setUp(self):
+        self.cartella = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cartella, ignore_errors=True)
+        impostazioni = override_settings(PROFILER_ATTIVO=True, PROFILER_FRAZIONE=0, PROFILER_CARTELLA=self.cartella)
+        impostazioni.enable()
+        self.addCleanup(impostazioni.disable)
+
+    # Con l'header un superuser ottiene il profilo della richiesta, che compare nella pagina dei report
+    def test_header_da_superuser(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse("info"), headers={"X-Profila": "1"})
+        report_id = response["X-Profilo"]
+
+        pagina = self.client.get(reverse("monitoraggio:profili"))
+        self.assertEqual([r["id"] for r in pagina.context["report"]], [report_id])
+
+        dettaglio = self.client.get(reverse("monitoraggio:profilo_dettaglio", args=[report_id]))
+        self.assertEqual(dettaglio.context["r"]["vista"], "info")
+        self.assertTrue(dettaglio.context["r"]["funzioni"])
+
+    # Per gli altri utenti l'header viene ignorato e la pagina dei report non è accessibile
+    def test_header_ignorato_per_non_superuser(self):
+        self.client.force_login(self.cliente)
+        response = self.client.get(reverse("info"), headers={"X-Profila": "1"})
+
+        self.assertNotIn("X-Profilo", response)
+        self.assertEqual(self.client.get(reverse("monitoraggio:profili")).status_code, 302)
+
+    # Se un'altra richiesta è già sotto profilo (un solo cProfile per processo) si risponde senza report
+    def test_richiesta_concorrente_non_profilata(self):
+        self.client.force_login(self.admin)
+
+        with _profilo_in_corso:
+            response = self.client.get(reverse("info"), headers={"X-Profila": "1"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("X-Profilo", response)
+
+    # Il report conta le query della richiesta
+    def test_report_con_query(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse("cinema:programmazione"), headers={"X-Profila": "1"})
+
+        report = leggi_report(response["X-Profilo"])
+        self.assertGreater(report["sql"]["numero"], 0)
+
+    # Query uguali con parametri diversi hanno la stessa impronta
+    def test_normalizza_sql(self):
+        self.assertEqual(
+            normalizza_sql("SELECT * FROM t WHERE id IN (1, 2, 3) AND nome = 'x'"),
+            normalizza_sql("SELECT *  FROM t WHERE id IN (4) AND nome = 'y''z'"),
+        )
+
+
+class QueryLenteTests(TestCase):
+    def setUp(self):
+        cartella = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cartella, ignore_errors=True)
+        self.file = os.path.join(cartella, "query_lente.jsonl")
+
+    # Con soglia 0 ogni query finisce nel log con impronta, punto di chiamata e piano di esecuzione
+    def test_registra_query_con_piano(self):
+        with connection.execute_wrapper(RegistraQueryLente(0, self.file)):
+            list(User.objects.filter(username="a"))
+            list(User.objects.filter(username="b"))
+
+        righe = leggi_log(self.file)
+        self.assertEqual(len(righe), 2)
+        self.assertEqual(righe[0]["impronta"], righe[1]["impronta"])
+        self.assertIn("monitoraggio/tests.py", righe[0]["sito"])
+        self.assertTrue(righe[0]["piano"])  # EXPLAIN QUERY PLAN su SQLite
+
+    # Il report somma le query con la stessa impronta e le ordina per tempo totale
+    def test_report_aggrega_per_impronta(self):
+        with connection.execute_wrapper(RegistraQueryLente(0, self.file)):
+            for i in range(3):
+                User.objects.filter(pk=i).exists()
+            User.objects.count()
+
+        voci = aggrega(leggi_log(self.file))
+        self.assertEqual(sorted(v["volte"] for v in voci), [1, 3])
+
+        out = StringIO()
+        call_command("report_query_lente", file=self.file, stdout=out)
+        self.assertIn("4 query lente, 2 impronte diverse", out.getvalue())
+
+
+def leggi_metriche(testo):
+    # scraper minimo al posto di Prometheus: {(nome, etichette): valore}
+    valori = {}
+    for riga in testo.splitlines():
+        if not riga or riga.startswith("#"):
+            continue
+        nome_etichette, valore = riga.rsplit(" ", 1)
+        nome, _, etichette = nome_etichette.partition("{")
+        coppie = frozenset(tuple(c.split("=", 1)) for c in etichette.rstrip("}").split(",") if c)
+        valori[(nome, frozenset((k, v.strip('"')) for k, v in coppie))] = float(valore)
+    return valori
+
+
+@override_settings(METRICHE_ATTIVE=True)
+class MetricheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="u", password="pass", email="u@x.it")
+        cls.sala = Sala.objects.create(nome="Sala 1")
+        cls.posti = [Posto.objects.create(sala=cls.sala, fila="A", numero_posto=str(n)) for n in range(1, 4)]
+        film = Film.objects.create(
+            titolo="Film Test",
+            descrizione="...",
+            data_uscita=timezone.localdate() - timedelta(days=30),
+            durata_minuti=120,
+            genere="Test",
+            regista="Reg",
+            cast_principale="Cast",
+            locandina_url="https://example.com/poster.jpg",
+        )
+        cls.proiezione = Proiezione.objects.create(film=film, sala=cls.sala, data_ora=timezone.now() + timedelta(days=1))
+
+    def _scrape(self, **kwargs):
+        response = self.client.get(reverse("metriche"), **kwargs)
+        self.assertEqual(response.status_code, 200)
+        return leggi_metriche(response.content.decode())
+
+    def _valore(self, metriche, nome, **etichette):
+        return metriche.get((nome, frozenset(etichette.items())), 0)
+
+    # Prenotazioni, rifiuti per il limite e annullamenti vengono contati
+    def test_contatori_prenotazioni(self):
+        prima = self._scrape()
+        self.client.force_login(self.user)
+        url = reverse("sales:prenota", args=[self.proiezione.id])
+
+        self.client.post(url, {"seat_ids": f"{self.posti[0].id},{self.posti[1].id}"})
+        self.client.post(url, {"seat_ids": str(self.posti[2].id)})  # oltre il limite di 2
+        biglietto = Biglietto.objects.filter(utente=self.user).first()
+        self.client.post(reverse("sales:annulla_biglietto", args=[biglietto.id]))
+
+        dopo = self._scrape()
+        for nome, etichette, delta in [
+            ("cinepiu_prenotazioni_totale", {"canale": "online"}, 1),
+            ("cinepiu_biglietti_prenotati_totale", {"canale": "online"}, 2),
+            ("cinepiu_prenotazioni_rifiutate_limite_totale", {}, 1),
+            ("cinepiu_annullamenti_totale", {}, 1),
+        ]:
+            self.assertEqual(self._valore(dopo, nome, **etichette) - self._valore(prima, nome, **etichette), delta, nome)
+
+    # Durata e query per richiesta sono raggruppate per nome della vista
+    def test_istogrammi_per_vista(self):
+        prima = self._scrape()
+        self.client.get(reverse("info"))
+        dopo = self._scrape()
+
+        nome = "cinepiu_richiesta_durata_secondi_count"
+        self.assertEqual(self._valore(dopo, nome, vista="info", metodo="GET") - self._valore(prima, nome, vista="info", metodo="GET"), 1)
+        self.assertIn(("cinepiu_richiesta_query_bucket", frozenset({("vista", "info"), ("le", "+Inf")})), dopo)
+
+    # Anche le viste async (ORM async sotto ASGI) registrano il numero di query
+    async def test_query_delle_viste_async(self):
+        await cache.aclear()  # la programmazione del giorno non deve arrivare dalla cache
+        vista = ("cinema:programmazione_giorno",)
+        prima = QUERY_RICHIESTE.valori.get(vista, [0.0])[-1]
+
+        response = await self.async_client.get(reverse("cinema:programmazione_giorno", args=[timezone.localdate().isoformat()]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(QUERY_RICHIESTE.valori[vista][-1] - prima, 0)
+
+    # Con più processi /metrics somma lo stato salvato da ogni processo
+    def test_aggregazione_tra_processi(self):
+        cartella = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cartella, ignore_errors=True)
+        with override_settings(METRICHE_CARTELLA=cartella):
+            ANNULLAMENTI.inc()
+            salva_stato(forza=True)
+            proprio = self._valore(self._scrape(), "cinepiu_annullamenti_totale")
+            # un altro worker con lo stesso stato
+            shutil.copy(os.path.join(cartella, f"{os.getpid()}.json"), os.path.join(cartella, "999999.json"))
+            self.assertEqual(self._valore(self._scrape(), "cinepiu_annullamenti_totale"), 2 * proprio)
+
+    # /metrics non è pubblico
+    def test_accesso_limitato(self):
+        response = self.client.get(reverse("metriche"), REMOTE_ADDR="10.0.0.1")
+        self.assertEqual(response.status_code, 403)
@@ -0,0 +1,9 @@
+from django.urls import path
+from . import views
+
+app_name = 'monitoraggio'
+
+urlpatterns = [
+    path("profili/", views.profili, name="profili"),
+    path("profili/<slug:report_id>/", views.profilo_dettaglio, name="profilo_dettaglio"),
+]
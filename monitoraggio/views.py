@@ -0,0 +1,36 @@
+from datetime import datetime
+from django.contrib.auth.decorators import user_passes_test
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.shortcuts import render
+from django.utils import timezone
+from accounts.permissions import is_admin
+from .metriche import formato_prometheus, stato_aggregato
+from .profiler import leggi_report, report_piu_lenti
+
+
+def _quando(report):
+    report["quando"] = datetime.fromtimestamp(report["quando"], tz=timezone.get_current_timezone())
+    return report
+
+
+@user_passes_test(is_admin)
+def profili(request):
+    return render(request, "monitoraggio/profili.html", {
+        "report": [_quando(r) for r in report_piu_lenti()],
+    })
+
+
+@user_passes_test(is_admin)
+def profilo_dettaglio(request, report_id):
+    report = leggi_report(report_id)
+    if report is None:
+        raise Http404("Report non trovato.")
+    return render(request, "monitoraggio/profilo_dettaglio.html", {"r": _quando(report)})
+
+
+def metriche(request):
+    # letto da Prometheus: accesso dagli IP in METRICHE_IP_AMMESSI oppure da un superuser
+    if request.META.get("REMOTE_ADDR") not in settings.METRICHE_IP_AMMESSI and not is_admin(request.user):
+        return HttpResponseForbidden()
+    return HttpResponse(formato_prometheus(stato_aggregato()), content_type="text/plain; version=0.0.4; charset=utf-8")
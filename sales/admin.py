@@ -1,3 +1,8 @@
 from django.contrib import admin
+from .models import Tariffa
 
-# Register your models here.
+
+@admin.register(Tariffa)
+class TariffaAdmin(admin.ModelAdmin):
+    list_display = ("nome", "prezzo", "sconto_socio", "categoria", "giorni_settimana", "ora_da", "ora_a", "rassegna", "priorita", "attiva")
+    list_filter = ("attiva", "categoria", "rassegna")
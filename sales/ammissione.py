@@ -0,0 +1,254 @@
+import math
+import time
+from contextlib import contextmanager
+from functools import wraps
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.http import JsonResponse
+from django.shortcuts import redirect
+from accounts.permissions import is_operational_staff
+from monitoraggio.metriche import INGRESSI_SALA_ATTESA, RIFIUTI_FREQUENZA
+
+# Ammissione alle prenotazioni, tutto nella cache di Django: quando apre una proiezione molto richiesta
+# il database vede al massimo le richieste dei clienti ammessi, non quelle di tutti.
+# Con più processi la cache deve essere condivisa (locmem dà a ogni worker code e secchi propri): i
+# limiti di frequenza vogliono file o redis, la sala d'attesa redis, l'unica con add atomica
+# (FileBasedCache.add controlla e poi scrive). Il profilo prod rifiuta le combinazioni sbagliate.
+#
+# 1) Limiti di frequenza (LIMITI_PRENOTAZIONE_ATTIVI): un secchio di gettoni per utente e uno per IP
+#    sulle POST di prenotazione. Ogni richiesta consuma un gettone, i gettoni si ricaricano a ritmo
+#    costante; a secchio vuoto risposta 429 (o messaggio e redirect per i form) con Retry-After.
+#    Lettura e scrittura del secchio non sono atomiche: con molte richieste simultanee dello stesso
+#    utente ne può passare qualcuna in più, che poi incontra comunque i lock sui posti.
+# 2) Sala d'attesa (Proiezione.sala_attesa = N): solo N clienti alla volta scelgono i posti, gli
+#    altri ricevono un numero e vedono posizione e attesa stimata, aggiornate da un endpoint JSON.
+#    Chi è ammesso ha SALA_ATTESA_DURATA secondi (SALA_ATTESA_CONFERMA se non si presenta) e libera
+#    il posto appena prenota. Lo stato della coda è un solo valore in cache per proiezione, modificato
+#    sotto un lucchetto (cache.add); i controlli di chi è ancora in coda sono sola lettura. Se il
+#    lucchetto non si libera in tempo si solleva CodaOccupata e il cliente riprova (503): la coda non
+#    si modifica mai senza lucchetto. Attiva solo con SALA_ATTESA_ATTIVA.
+# La segreteria non ha limiti né coda. L'IP del cliente è REMOTE_ADDR, oppure, dietro PROXY_FIDATI
+# reverse proxy, l'indirizzo che il più esterno di loro ha aggiunto a X-Forwarded-For.
+
+SESSIONE = "sala_attesa"  # {proiezione_id: numero}
+DURATA_STATO = 60 * 60 * 6
+INTERVALLO_POLLING = 5  # secondi, per la pagina d'attesa
+
+AMMESSO = "ammesso"
+IN_CODA = "in_coda"
+SCADUTO = "scaduto"
+
+
+class CodaOccupata(Exception):
+    """Il lucchetto della coda non si è liberato in tempo: la richiesta va ritentata."""
+
+
+# --- limiti di frequenza ---------------------------------------------------------------------
+
+def consuma_gettone(chiave, gettoni, periodo, now=None):
+    """
+    Secchio di `gettoni` gettoni che si ricaricano tutti in `periodo` secondi.
+    Restituisce 0 se la richiesta può passare (e consuma un gettone), altrimenti i secondi da aspettare.
+    """
+    now = time.time() if now is None else now
+    ritmo = gettoni / periodo
+    disponibili, ultimo = cache.get(chiave) or (gettoni, now)
+    disponibili = min(gettoni, disponibili + (now - ultimo) * ritmo)
+    if disponibili < 1:
+        cache.set(chiave, (disponibili, now), periodo)
+        return (1 - disponibili) / ritmo
+    cache.set(chiave, (disponibili - 1, now), periodo)
+    return 0
+
+
+def ip_cliente(request):
+    # ogni proxy fidato aggiunge a destra di X-Forwarded-For l'indirizzo da cui ha ricevuto la richiesta:
+    # quelli più a sinistra li scrive il client e non sono affidabili
+    if settings.PROXY_FIDATI:
+        indirizzi = [ip.strip() for ip in request.META.get("HTTP_X_FORWARDED_FOR", "").split(",") if ip.strip()]
+        if len(indirizzi) >= settings.PROXY_FIDATI:
+            return indirizzi[-settings.PROXY_FIDATI]
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def _attesa_limiti(request):
+    limiti = [("ip", ip_cliente(request), settings.LIMITE_PRENOTAZIONE_IP)]
+    if request.user.is_authenticated:
+        limiti.insert(0, ("utente", request.user.pk, settings.LIMITE_PRENOTAZIONE_UTENTE))
+    for nome, chi, (gettoni, periodo) in limiti:
+        attesa = consuma_gettone(f"limite:{nome}:{chi}", gettoni, periodo)
+        if attesa:
+            RIFIUTI_FREQUENZA.inc(limite=nome)
+            return attesa
+    return 0
+
+
+def limita_frequenza(vista):
+    """Decoratore per le viste di prenotazione: limita le POST per utente e per IP."""
+    @wraps(vista)
+    def wrapper(request, *args, **kwargs):
+        if (
+            request.method != "POST"
+            or not settings.LIMITI_PRENOTAZIONE_ATTIVI
+            or is_operational_staff(request.user)
+        ):
+            return vista(request, *args, **kwargs)
+
+        attesa = _attesa_limiti(request)
+        if not attesa:
+            return vista(request, *args, **kwargs)
+
+        secondi = math.ceil(attesa)
+        if request.content_type == "application/json":
+            risposta = JsonResponse({"errore": "Troppe richieste, riprova tra poco."}, status=429)
+        else:
+            messages.error(request, f"Troppe richieste di prenotazione: riprova tra {secondi} secondi.")
+            risposta = redirect(request.path)
+        risposta["Retry-After"] = str(secondi)
+        return risposta
+
+    return wrapper
+
+
+# --- sala d'attesa ---------------------------------------------------------------------------
+
+def _chiave(proiezione_id):
+    return f"attesa:{proiezione_id}"
+
+
+@contextmanager
+def _lucchetto(proiezione_id):
+    # cache.add è atomica (con redis): solo una richiesta alla volta modifica lo stato della coda.
+    # Dopo mezzo secondo si rinuncia: con due richieste insieme senza lucchetto si perderebbero numeri
+    chiave = _chiave(proiezione_id) + ":lucchetto"
+    for _ in range(100):
+        if cache.add(chiave, 1, 2):
+            break
+        time.sleep(0.005)
+    else:
+        raise CodaOccupata
+    try:
+        yield
+    finally:
+        cache.delete(chiave)
+
+
+def _aggiorna(stato, now):
+    # escono le ammissioni scadute, entrano in ordine i prossimi numeri finché ci sono posti
+    attivi = {numero: a for numero, a in stato["attivi"].items() if a["scadenza"] > now}
+    while len(attivi) < stato["capacita"] and stato["servito"] < stato["ultimo"]:
+        stato["servito"] += 1
+        attivi[stato["servito"]] = {"scadenza": now + settings.SALA_ATTESA_CONFERMA, "dal": now, "presente": False}
+    stato["attivi"] = attivi
+
+
+def _esito(stato, numero):
+    if numero in stato["attivi"]:
+        return {"esito": AMMESSO, "posizione": 0, "attesa_secondi": 0}
+    if numero <= stato["servito"]:
+        return {"esito": SCADUTO, "posizione": None, "attesa_secondi": None}
+    posizione = numero - stato["servito"]
+    return {
+        "esito": IN_CODA,
+        "posizione": posizione,
+        "attesa_secondi": math.ceil(posizione / stato["capacita"]) * round(stato["media"]),
+    }
+
+
+def entra(proiezione):
+    """Nuovo numero nella coda della proiezione."""
+    with _lucchetto(proiezione.pk):
+        stato = cache.get(_chiave(proiezione.pk)) or {
+            "ultimo": 0, "servito": 0, "attivi": {}, "media": settings.SALA_ATTESA_DURATA / 2,
+        }
+        stato["capacita"] = proiezione.sala_attesa  # i gestori possono cambiarla a coda aperta
+        stato["ultimo"] += 1
+        cache.set(_chiave(proiezione.pk), stato, DURATA_STATO)
+    INGRESSI_SALA_ATTESA.inc()
+    return stato["ultimo"]
+
+
+def turno(proiezione_id, numero, now=None):
+    """Esito (AMMESSO, IN_CODA, SCADUTO) con posizione e attesa stimata; None se la coda non esiste più."""
+    now = time.time() if now is None else now
+    stato = cache.get(_chiave(proiezione_id))
+    if stato is None:
+        return None
+
+    # sola lettura se non cambia niente: in coda e nessun posto che si libera, o già ammesso e presente
+    ammissione = stato["attivi"].get(numero)
+    liberi = stato["capacita"] - sum(1 for a in stato["attivi"].values() if a["scadenza"] > now)
+    if ammissione is None and numero > stato["servito"] + max(liberi, 0):
+        return _esito(stato, numero)
+    if ammissione is not None and ammissione["presente"] and ammissione["scadenza"] > now:
+        return _esito(stato, numero)
+
+    with _lucchetto(proiezione_id):
+        stato = cache.get(_chiave(proiezione_id))
+        if stato is None:
+            return None
+        _aggiorna(stato, now)
+        ammissione = stato["attivi"].get(numero)
+        if ammissione is not None and not ammissione["presente"]:
+            ammissione.update(presente=True, scadenza=now + settings.SALA_ATTESA_DURATA)
+        cache.set(_chiave(proiezione_id), stato, DURATA_STATO)
+    return _esito(stato, numero)
+
+
+def esci(proiezione_id, numero, now=None):
+    """Il cliente ha prenotato (o rinuncia): il suo posto passa al prossimo della coda."""
+    now = time.time() if now is None else now
+    with _lucchetto(proiezione_id):
+        stato = cache.get(_chiave(proiezione_id))
+        if stato is None:
+            return
+        ammissione = stato["attivi"].pop(numero, None)
+        if ammissione is not None:
+            # media mobile della durata di una prenotazione, per stimare l'attesa
+            stato["media"] = 0.8 * stato["media"] + 0.2 * min(now - ammissione["dal"], settings.SALA_ATTESA_DURATA)
+        _aggiorna(stato, now)
+        cache.set(_chiave(proiezione_id), stato, DURATA_STATO)
+
+
+def _con_coda(request, proiezione):
+    return settings.SALA_ATTESA_ATTIVA and proiezione.sala_attesa and not is_operational_staff(request.user)
+
+
+def controlla_turno(request, proiezione):
+    """
+    None se il cliente può prenotare la proiezione, altrimenti il suo stato in coda (esito, posizione,
+    attesa_secondi). Chi arriva per la prima volta o ha perso il turno riceve un numero nuovo.
+    Solleva CodaOccupata se la coda è troppo contesa per essere aggiornata.
+    """
+    if not _con_coda(request, proiezione):
+        return None
+
+    numeri = request.session.get(SESSIONE, {})
+    numero = numeri.get(str(proiezione.pk))
+    stato = turno(proiezione.pk, numero) if numero else None
+    if stato is None or stato["esito"] == SCADUTO:
+        numero = entra(proiezione)
+        request.session[SESSIONE] = {**numeri, str(proiezione.pk): numero}
+        stato = turno(proiezione.pk, numero)
+    return None if stato["esito"] == AMMESSO else stato
+
+
+def ammesso(request, proiezione):
+    """Come controlla_turno ma senza mettere in coda (carrello)."""
+    if not _con_coda(request, proiezione):
+        return True
+    numero = request.session.get(SESSIONE, {}).get(str(proiezione.pk))
+    stato = turno(proiezione.pk, numero) if numero else None
+    return stato is not None and stato["esito"] == AMMESSO
+
+
+def libera_turno(request, proiezione):
+    numeri = request.session.get(SESSIONE, {})
+    numero = numeri.get(str(proiezione.pk))
+    if numero:
+        try:
+            esci(proiezione.pk, numero)
+        except CodaOccupata:
+            pass  # l'ammissione scade comunque dopo SALA_ATTESA_DURATA
+        request.session[SESSIONE] = {k: v for k, v in numeri.items() if k != str(proiezione.pk)}
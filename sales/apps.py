@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class SalesConfig(AppConfig):
     name = 'sales'
+
+    def ready(self):
+        from . import signals  # noqa: F401 (registra i receiver per l'invalidazione della cache)
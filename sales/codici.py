@@ -0,0 +1,58 @@
+import hashlib
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+# Codici dei biglietti digitali (QR in "Le mie prenotazioni").
+# Il codice è "<id>-<firma>", con la firma HMAC (SECRET_KEY) di id, proiezione e posto: non si può
+# inventare né spostare su un altro posto o un'altra proiezione.
+# All'ingresso lo scanner non chiede al server un biglietto alla volta: scarica prima il manifest della
+# proiezione, cioè le impronte SHA-256 (troncate) dei codici validi, e controlla ogni QR in locale con una
+# ricerca in un Set, anche senza rete. Il manifest contiene solo impronte: chi lo legge non ricava i codici.
+# Un biglietto annullato sparisce dal manifest e non supera più la verifica.
+
+SALE = "sales.biglietto"
+LUNGHEZZA_FIRMA = 24  # caratteri esadecimali (96 bit): QR piccolo, firma non indovinabile
+LUNGHEZZA_IMPRONTA = 16
+MAX_CIFRE_ID = 18  # un BigAutoField ha al massimo 19 cifre
+
+
+def firma(biglietto_id, proiezione_id, posto_id):
+    valore = f"{biglietto_id}:{proiezione_id}:{posto_id}"
+    return salted_hmac(SALE, valore, algorithm="sha256").hexdigest()[:LUNGHEZZA_FIRMA]
+
+
+def codice_biglietto(biglietto):
+    return f"{biglietto.pk}-{firma(biglietto.pk, biglietto.proiezione_id, biglietto.posto_id)}"
+
+
+def leggi_codice(codice):
+    """Id del biglietto e firma, o None se il codice non ha il formato giusto."""
+    biglietto_id, _, firma_codice = (codice or "").strip().partition("-")
+    # isdecimal e non isdigit: "²" è una cifra per Python ma int() non la accetta
+    if not biglietto_id.isdecimal() or len(biglietto_id) > MAX_CIFRE_ID or len(firma_codice) != LUNGHEZZA_FIRMA:
+        return None
+    return int(biglietto_id), firma_codice
+
+
+def codice_valido(biglietto, firma_codice):
+    return constant_time_compare(firma(biglietto.pk, biglietto.proiezione_id, biglietto.posto_id), firma_codice)
+
+
+def impronta(codice):
+    # la stessa funzione in JavaScript nello scanner (crypto.subtle.digest)
+    return hashlib.sha256(codice.encode()).hexdigest()[:LUNGHEZZA_IMPRONTA]
+
+
+def manifest(proiezione, biglietti):
+    """
+    Manifest dello scanner: {impronta del codice: posto} per i biglietti della proiezione.
+    biglietti: righe con id, posto_id, posto__fila, posto__numero_posto (values()).
+    """
+    return {
+        "proiezione": proiezione.pk,
+        "film": proiezione.film.titolo,
+        "data_ora": proiezione.data_ora.isoformat(),
+        "biglietti": {
+            impronta(f"{b['id']}-{firma(b['id'], proiezione.pk, b['posto_id'])}"): f"{b['posto__fila']}{b['posto__numero_posto']}"
+            for b in biglietti
+        },
+    }
@@ -0,0 +1,147 @@
+import hashlib
+import json
+import time
+import uuid
+from datetime import timedelta
+from functools import wraps
+from django.conf import settings
+from django.contrib import messages
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, HttpResponseRedirect
+from django.utils import timezone
+from monitoraggio.metriche import RICHIESTE_RIPETUTE
+from .models import ChiaveIdempotenza
+
+# Chiavi di idempotenza per le POST di prenotazione e annullamento.
+# I form contengono un campo nascosto CAMPO con una chiave nuova a ogni pagina (context processor
+# chiave_idempotenza); le API JSON usano l'header Idempotency-Key. La prima richiesta con una chiave
+# registra la chiave, esegue la vista e ne salva l'esito (stato, corpo, redirect e messaggi); le
+# richieste successive con la stessa chiave e lo stesso percorso ricevono quell'esito con una sola
+# lettura, senza aprire transazioni né bloccare posti.
+# Se arrivano mentre la prima è ancora in corso (doppio clic) aspettano che finisca, fino ad ATTESA_MAX.
+# La chiave vale solo per lo stesso contenuto: riusata con dati diversi (altri posti, un altro carrello)
+# la richiesta è rifiutata con 422 invece di ripetere un esito che non le appartiene.
+# Le chiavi valgono IDEMPOTENZA_DURATA secondi; quelle scadute di un utente si eliminano quando ne
+# registra una nuova. Senza chiave le viste funzionano come prima.
+
+CAMPO = "chiave_idempotenza"
+HEADER = "Idempotency-Key"
+ATTESA_MAX = 5  # secondi
+INTERVALLO_ATTESA = 0.1
+
+
+def chiave_idempotenza(request):
+    # context processor: {{ chiave_idempotenza }} nei form di prenotazione e annullamento
+    return {"chiave_idempotenza": uuid.uuid4().hex}
+
+
+def _impronta(request):
+    # contenuto della richiesta: il corpo JSON così com'è, i campi del form in ordine (senza il token CSRF)
+    if request.content_type == "application/json":
+        contenuto = request.body
+    else:
+        campi = sorted((k, v) for k, v in request.POST.lists() if k != "csrfmiddlewaretoken")
+        contenuto = json.dumps(campi).encode()
+    return hashlib.sha256(contenuto).hexdigest()
+
+
+def _cerca(utente, chiave, percorso, now):
+    return ChiaveIdempotenza.objects.filter(utente=utente, chiave=chiave, percorso=percorso, scadenza__gt=now).first()
+
+
+def _messaggi(request):
+    storage = messages.get_messages(request)
+    elenco = list(storage)
+    storage.used = False  # leggerli non deve consumarli
+    return elenco
+
+
+def _salva_esito(record, request, risposta, messaggi_prima):
+    if hasattr(risposta, "render") and not risposta.is_rendered:
+        risposta.render()
+    record.completata = True
+    record.stato = risposta.status_code
+    record.tipo = risposta.get("Content-Type", "")
+    record.location = risposta.get("Location", "")
+    record.corpo = risposta.content.decode(risposta.charset)
+    record.messaggi = [[m.level, m.message, m.extra_tags] for m in _messaggi(request)[messaggi_prima:]]
+    record.save(update_fields=["completata", "stato", "tipo", "location", "corpo", "messaggi"])
+
+
+def _ripeti(request, record):
+    if record.location:
+        risposta = HttpResponseRedirect(record.location)
+        risposta.status_code = record.stato
+    else:
+        risposta = HttpResponse(record.corpo, status=record.stato, content_type=record.tipo or None)
+    # i messaggi della prima risposta possono essere ancora da mostrare (doppio clic): niente doppioni
+    in_attesa = {(m.level, m.message) for m in _messaggi(request)}
+    for livello, testo, tag in record.messaggi:
+        if (livello, testo) not in in_attesa:
+            messages.add_message(request, livello, testo, extra_tags=tag)
+    risposta["Idempotent-Replayed"] = "true"
+    return risposta
+
+
+def _attendi(record):
+    # la prima richiesta con questa chiave è ancora in corso
+    limite = time.monotonic() + ATTESA_MAX
+    while time.monotonic() < limite:
+        time.sleep(INTERVALLO_ATTESA)
+        record = ChiaveIdempotenza.objects.filter(pk=record.pk).first()
+        if record is None or record.completata:
+            return record
+    return None
+
+
+def idempotente(vista):
+    """Decoratore per le viste di prenotazione/annullamento (sotto login_required)."""
+    @wraps(vista)
+    def wrapper(request, *args, **kwargs):
+        chiave = (request.headers.get(HEADER) or "").strip()
+        if not chiave and request.method == "POST" and request.content_type != "application/json":
+            chiave = (request.POST.get(CAMPO) or "").strip()
+        if request.method != "POST" or not chiave or not request.user.is_authenticated:
+            return vista(request, *args, **kwargs)
+        if len(chiave) > 64:
+            return HttpResponse("Chiave di idempotenza non valida.", status=400)
+
+        now = timezone.now()
+        impronta = _impronta(request)
+        record = _cerca(request.user, chiave, request.path, now)
+        if record is None:
+            ChiaveIdempotenza.objects.filter(utente=request.user, scadenza__lte=now).delete()
+            try:
+                with transaction.atomic():
+                    record = ChiaveIdempotenza.objects.create(
+                        utente=request.user, chiave=chiave, percorso=request.path, impronta=impronta,
+                        scadenza=now + timedelta(seconds=settings.IDEMPOTENZA_DURATA),
+                    )
+            except IntegrityError:
+                # stessa chiave registrata in parallelo da un'altra richiesta
+                record = _cerca(request.user, chiave, request.path, now)
+            else:
+                messaggi_prima = len(_messaggi(request))
+                try:
+                    risposta = vista(request, *args, **kwargs)
+                except Exception:
+                    record.delete()  # nessun esito da ripetere: la richiesta si può ritentare
+                    raise
+                if risposta.status_code >= 500 or risposta.streaming:
+                    record.delete()
+                else:
+                    _salva_esito(record, request, risposta, messaggi_prima)
+                return risposta
+
+        if record is not None and record.impronta and record.impronta != impronta:  # vuota: chiavi di prima della migrazione
+            RICHIESTE_RIPETUTE.inc(esito="diversa")
+            return HttpResponse("Chiave di idempotenza già usata per una richiesta diversa.", status=422)
+        if record is not None and not record.completata:
+            record = _attendi(record)
+        if record is None:
+            RICHIESTE_RIPETUTE.inc(esito="in_corso")
+            return HttpResponse("Richiesta già in elaborazione, riprova tra poco.", status=409)
+        RICHIESTE_RIPETUTE.inc(esito="ripetuta")
+        return _ripeti(request, record)
+
+    return wrapper
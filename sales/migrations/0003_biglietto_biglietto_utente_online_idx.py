@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:18
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cinema', '0006_proiezione_proiezione_data_ora_idx_and_more'),
+        ('sales', '0002_alter_biglietto_stato'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='biglietto',
+            index=models.Index(condition=models.Q(('utente__isnull', False)), fields=['utente', 'proiezione'], name='biglietto_utente_online_idx'),
+        ),
+    ]
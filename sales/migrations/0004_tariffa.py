@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:26
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0003_biglietto_biglietto_utente_online_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tariffa',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(max_length=80)),
+                ('prezzo', models.DecimalField(decimal_places=2, max_digits=4)),
+                ('sconto_socio', models.DecimalField(decimal_places=2, default=Decimal('2.00'), max_digits=4)),
+                ('priorita', models.PositiveSmallIntegerField(default=0)),
+                ('attiva', models.BooleanField(default=True)),
+                ('categoria', models.CharField(blank=True, choices=[('STD', 'Standard'), ('PRE', 'Premium'), ('ACC', 'Accessibile')], max_length=3)),
+                ('giorni_settimana', models.CharField(blank=True, help_text='Giorni a cui si applica: 0 = lunedì, ..., 6 = domenica (es. "56" per il weekend).', max_length=7)),
+                ('ora_da', models.TimeField(blank=True, null=True)),
+                ('ora_a', models.TimeField(blank=True, null=True)),
+                ('rassegna', models.BooleanField(blank=True, help_text='Solo film in rassegna (sì), solo gli altri (no) o tutti (vuoto).', null=True)),
+                ('valida_dal', models.DateField(blank=True, null=True)),
+                ('valida_al', models.DateField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Tariffe',
+                'ordering': ['-priorita', '-id'],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0004_tariffa'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChiaveIdempotenza',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chiave', models.CharField(max_length=64)),
+                ('percorso', models.CharField(max_length=200)),
+                ('completata', models.BooleanField(default=False)),
+                ('stato', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('tipo', models.CharField(blank=True, max_length=100)),
+                ('location', models.CharField(blank=True, max_length=500)),
+                ('corpo', models.TextField(blank=True)),
+                ('messaggi', models.JSONField(blank=True, default=list)),
+                ('scadenza', models.DateTimeField()),
+                ('utente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Chiavi di idempotenza',
+                'constraints': [models.UniqueConstraint(fields=('utente', 'chiave', 'percorso'), name='uniq_chiave_idempotenza')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0005_chiaveidempotenza'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chiaveidempotenza',
+            name='impronta',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
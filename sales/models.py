@@ -1,5 +1,32 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
+from cinema.models import Posto
+from .codici import codice_biglietto
+
+
+class BigliettoQuerySet(models.QuerySet):
+    def active(self, oggi=None):
+        # prenotazioni attive: proiezioni da oggi in poi (per tutta la giornata, anche se già iniziate).
+        # Confronto data_ora con l'inizio del giorno invece di data_ora__date: così resta usabile l'indice
+        inizio = timezone.make_aware(datetime.combine(oggi or timezone.localdate(), time.min))
+        return self.filter(proiezione__data_ora__gte=inizio)
+
+    def con_annullabilita(self, now=None):
+        # annullabile dal cliente fino a ANTICIPO_ANNULLAMENTO prima della proiezione: lo calcola il database
+        limite = (now or timezone.now()) + self.model.ANTICIPO_ANNULLAMENTO
+        return self.annotate(
+            annullabile=models.ExpressionWrapper(models.Q(proiezione__data_ora__gt=limite), output_field=models.BooleanField())
+        )
+
+
+class BigliettiAttiviManager(models.Manager.from_queryset(BigliettoQuerySet)):
+    def get_queryset(self):
+        return super().get_queryset().active()
+
 
 class Biglietto(models.Model):
     class Stato(models.TextChoices):
@@ -20,10 +47,29 @@ class Biglietto(models.Model):
     stato = models.CharField(max_length=3, choices=Stato.choices, default=Stato.PRENOTATO)
     creato_il = models.DateTimeField(auto_now_add=True)
 
+    ANTICIPO_ANNULLAMENTO = timedelta(hours=1)  # non si può disdire a meno di un'ora dalla proiezione
+
+    objects = BigliettoQuerySet.as_manager()
+    active = BigliettiAttiviManager()
+
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=["proiezione", "posto"], name="uniq_posto_per_proiezione"),
         ]
+        indexes = [
+            # indice parziale (SQLite/PostgreSQL) sui soli biglietti online: la verifica delle prenotazioni
+            # attive di un utente legge (utente, proiezione) dall'indice, senza toccare la tabella
+            models.Index(
+                fields=["utente", "proiezione"],
+                condition=models.Q(utente__isnull=False),
+                name="biglietto_utente_online_idx",
+            ),
+        ]
+
+    @property
+    def codice(self):
+        # codice firmato per il QR del biglietto (vedi sales/codici.py)
+        return codice_biglietto(self)
 
     def __str__(self):
         film = getattr(self.proiezione, "film", None)
@@ -31,3 +77,70 @@ class Biglietto(models.Model):
         return f"{titolo} - {self.proiezione.data_ora:%d/%m %H:%M} - Posto {self.posto} - {self.get_stato_display()}"
 
 
+class Tariffa(models.Model):
+    # Regola di prezzo (vedi sales/prezzi.py): per ogni categoria di posto vale la tariffa attiva con
+    # priorità più alta tra quelle che corrispondono alla proiezione. I campi lasciati vuoti valgono sempre.
+    nome = models.CharField(max_length=80)
+    prezzo = models.DecimalField(max_digits=4, decimal_places=2)
+    sconto_socio = models.DecimalField(max_digits=4, decimal_places=2, default=Decimal("2.00"))
+    priorita = models.PositiveSmallIntegerField(default=0) # a parità vince la tariffa più recente
+    attiva = models.BooleanField(default=True)
+
+    categoria = models.CharField(max_length=3, choices=Posto.Categoria.choices, blank=True)
+    giorni_settimana = models.CharField(max_length=7, blank=True, help_text="Giorni a cui si applica: 0 = lunedì, ..., 6 = domenica (es. \"56\" per il weekend).")
+    ora_da = models.TimeField(null=True, blank=True) # inizio della proiezione in [ora_da, ora_a)
+    ora_a = models.TimeField(null=True, blank=True)
+    rassegna = models.BooleanField(null=True, blank=True, help_text="Solo film in rassegna (sì), solo gli altri (no) o tutti (vuoto).")
+    valida_dal = models.DateField(null=True, blank=True)
+    valida_al = models.DateField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = "Tariffe"
+        ordering = ["-priorita", "-id"]
+
+    def clean(self):
+        errors = {}
+
+        if any(c not in "0123456" for c in self.giorni_settimana) or len(set(self.giorni_settimana)) != len(self.giorni_settimana):
+            errors["giorni_settimana"] = "Indica i giorni con le cifre da 0 (lunedì) a 6 (domenica), senza ripetizioni."
+
+        if self.ora_da and self.ora_a and self.ora_da >= self.ora_a:
+            errors["ora_a"] = "L'ora di fine deve essere successiva all'ora di inizio."
+
+        if self.valida_dal and self.valida_al and self.valida_dal > self.valida_al:
+            errors["valida_al"] = "La data di fine validità non può precedere quella di inizio."
+
+        if self.prezzo is not None and self.sconto_socio is not None and self.sconto_socio > self.prezzo:
+            errors["sconto_socio"] = "Lo sconto soci non può superare il prezzo."
+
+        if errors:
+            raise ValidationError(errors)
+
+    def __str__(self):
+        return f"{self.nome} (€ {self.prezzo})"
+
+
+class ChiaveIdempotenza(models.Model):
+    # Esito di una POST di prenotazione o annullamento inviata con una chiave di idempotenza: se la
+    # stessa richiesta arriva di nuovo (doppio clic, ritentativo dopo un timeout) si restituisce questo
+    # esito senza rifare la transazione (vedi sales/idempotenza.py).
+    utente = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+")
+    chiave = models.CharField(max_length=64)
+    percorso = models.CharField(max_length=200)
+    impronta = models.CharField(max_length=64, blank=True) # sha256 del contenuto della richiesta: la chiave non vale per richieste diverse
+    completata = models.BooleanField(default=False) # False finché la prima richiesta è in corso
+    stato = models.PositiveSmallIntegerField(null=True, blank=True)
+    tipo = models.CharField(max_length=100, blank=True)
+    location = models.CharField(max_length=500, blank=True)
+    corpo = models.TextField(blank=True)
+    messaggi = models.JSONField(default=list, blank=True)
+    scadenza = models.DateTimeField()
+
+    class Meta:
+        verbose_name_plural = "Chiavi di idempotenza"
+        constraints = [
+            models.UniqueConstraint(fields=["utente", "chiave", "percorso"], name="uniq_chiave_idempotenza"),
+        ]
+
+    def __str__(self):
+        return f"{self.chiave} {self.percorso}"
@@ -0,0 +1,70 @@
+from operator import attrgetter, itemgetter
+from cinema.models import Posto
+from cinema.pianta import griglia
+
+# Scelta automatica dei "migliori N posti adiacenti" liberi di una proiezione.
+# Si lavora sulla pianta della sala (griglia: file di celle, None per corridoi e spazi vuoti), quindi
+# adiacenti vuol dire celle consecutive della stessa fila, senza corridoi in mezzo.
+# Ogni blocco di N posti liberi riceve un punteggio (più basso = migliore):
+#   PESO_CENTRO * distanza del centro del blocco dal centro della sala (0 al centro, 1 sul bordo)
+# + PESO_FILA   * distanza della fila da quella ideale (FILA_IDEALE, frazione della profondità della sala)
+# Un solo passaggio sulle celle con una finestra scorrevole: O(posti), sotto il millisecondo anche
+# per sale di centinaia di posti. I posti accessibili sono esclusi, salvo richiesta esplicita.
+
+FILA_IDEALE = 0.6  # circa a tre quinti della sala partendo dallo schermo
+PESO_CENTRO = 1.0
+PESO_FILA = 1.5
+
+
+def migliori_posti(posti, occupati, n, accessibili=False):
+    """
+    posti: oggetti o dict con id, fila, numero_posto, riga, colonna e categoria; occupati: id dei posti venduti.
+    Restituisce gli n posti adiacenti liberi con il punteggio migliore (da sinistra a destra), o None.
+    """
+    if n < 1:
+        return None
+    posti = list(posti)
+    colonne, righe = griglia(posti)
+    if not righe or n > colonne:
+        return None
+
+    # posti utilizzabili calcolati una volta, poi nel ciclo basta un test di appartenenza
+    leggi = itemgetter("id", "categoria") if isinstance(posti[0], dict) else attrgetter("id", "categoria")
+    liberi = set()
+    for posto in posti:
+        id_posto, categoria = leggi(posto)
+        if id_posto not in occupati and (accessibili or categoria != Posto.Categoria.ACCESSIBILE):
+            liberi.add(id_posto)
+    id_posto = itemgetter("id") if isinstance(posti[0], dict) else attrgetter("id")
+
+    centro = (colonne + 1) / 2
+    mezza_larghezza = max((colonne - 1) / 2, 1)
+    fila_ideale = (len(righe) - 1) * FILA_IDEALE
+    profondita = max(len(righe) - 1, 1)
+
+    migliore, punteggio_migliore = None, None
+    # file dalla più vicina a quella ideale: appena la sola distanza della fila supera il punteggio
+    # migliore, nessun blocco delle file successive può batterlo
+    for indice in sorted(range(len(righe)), key=lambda i: abs(i - fila_ideale)):
+        distanza_fila = abs(indice - fila_ideale) / profondita
+        if punteggio_migliore is not None and PESO_FILA * distanza_fila >= punteggio_migliore:
+            break
+
+        consecutivi = 0
+        for colonna, posto in enumerate(righe[indice]["celle"], start=1):
+            consecutivi = consecutivi + 1 if posto is not None and id_posto(posto) in liberi else 0
+            if consecutivi < n:
+                continue
+            # blocco che termina in questa colonna
+            centro_blocco = colonna - (n - 1) / 2
+            punteggio = (
+                PESO_CENTRO * abs(centro_blocco - centro) / mezza_larghezza
+                + PESO_FILA * distanza_fila
+            )
+            if punteggio_migliore is None or punteggio < punteggio_migliore:
+                migliore, punteggio_migliore = (indice, colonna), punteggio
+
+    if migliore is None:
+        return None
+    indice, ultima = migliore
+    return righe[indice]["celle"][ultima - n:ultima]
@@ -0,0 +1,206 @@
+from collections import Counter
+from functools import partial
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from cinema.cache import invalida_giorno
+from cinema.models import Posto
+from monitoraggio.metriche import BIGLIETTI_PRENOTATI, CONFLITTI, PRENOTAZIONI, RIFIUTI_LIMITE
+from .models import Biglietto
+from .prezzi import prezzo_posto, tabella_prezzi
+
+# Creazione dei biglietti, condivisa da prenota (scelta dei posti sulla mappa), dalla prenotazione
+# rapida della segreteria (posti scelti da migliori_posti) e dal carrello (più proiezioni insieme).
+# Le regole sono quelle di sempre:
+# - un cliente online può avere al massimo MAX_BIGLIETTI_CLIENTE biglietti per proiezione;
+# - la segreteria deve indicare almeno nome o telefono del cliente;
+# - i posti sono bloccati con select_for_update e il vincolo (proiezione, posto) impedisce
+#   comunque di vendere due volte lo stesso posto.
+#
+# prenota_carrello fa tutto il lavoro con un numero fisso di query, qualunque sia il numero di
+# proiezioni: una per i posti, una per quelli già venduti, una per i biglietti già prenotati
+# dal cliente e un solo bulk_create. È tutto o niente: se anche un solo posto non si può
+# prenotare non viene creato nessun biglietto, e l'esito di ogni posto dice perché.
+
+MAX_BIGLIETTI_CLIENTE = 2
+MAX_POSTI_CARRELLO = 60  # una classe con gli accompagnatori
+
+# Esito di ogni posto richiesto
+PRENOTATO = "prenotato"
+LIBERO = "libero"  # prenotabile, ma il carrello non è stato eseguito per colpa di altri posti
+OCCUPATO = "occupato"
+NON_VALIDO = "non_valido"  # inesistente, disattivato o di un'altra sala
+LIMITE = "limite"
+NON_PRENOTABILE = "non_prenotabile"  # proiezione passata o film non ancora in programmazione
+
+# Per prenota_posti: primo esito negativo trovato -> errore (code, messaggio)
+ERRORI = (
+    (LIMITE, "limite", f"Puoi prenotare al massimo {MAX_BIGLIETTI_CLIENTE} biglietti per questa proiezione."),
+    (NON_PRENOTABILE, "posti", "Questa proiezione non è prenotabile."),
+    (NON_VALIDO, "posti", "Uno o più posti non sono validi per questa sala."),
+    (OCCUPATO, "conflitto", "Alcuni posti sono appena stati prenotati da un altro utente. Riprova."),
+)
+
+
+def stato_posti(proiezione):
+    """Posti attivi della sala (dict per griglia e migliori_posti) e id di quelli già venduti: due query."""
+    posti = list(
+        Posto.objects
+        .filter(sala_id=proiezione.sala_id, attivo=True)
+        .values("id", "fila", "numero_posto", "riga", "colonna", "categoria")
+    )
+    occupati = set(
+        Biglietto.objects
+        .filter(proiezione=proiezione)
+        .values_list("posto_id", flat=True)
+    )
+    return posti, occupati
+
+
+def prenotabile(proiezione, now=None):
+    now = now or timezone.now()
+    film = proiezione.film
+    return proiezione.data_ora >= now and not (film.in_programmazione and film.in_programmazione > now.date())
+
+
+def _id_posti(posto_ids):
+    try:
+        return list(dict.fromkeys(int(i) for i in posto_ids))  # senza doppioni, nell'ordine ricevuto
+    except (TypeError, ValueError):
+        raise ValidationError("Uno o più posti non sono validi per questa sala.", code="posti")
+
+
+def prenota_carrello(richieste, utente, staff_mode=False, nome_cliente="", telefono_cliente=""):
+    """
+    richieste: lista di (proiezione, posto_ids); le proiezioni devono avere il film (select_related).
+    Restituisce un esito per posto: dict con proiezione, posto_id, posto, esito, prezzo e biglietto
+    (quest'ultimo solo se esito == PRENOTATO). Solleva ValidationError (code "posti" o "cliente")
+    solo per richieste malformate.
+    """
+    richieste = [(proiezione, _id_posti(posto_ids)) for proiezione, posto_ids in richieste]
+    tutti = {posto_id for _, ids in richieste for posto_id in ids}
+    if not tutti:
+        raise ValidationError("Seleziona almeno un posto.", code="posti")
+    if sum(len(ids) for _, ids in richieste) > MAX_POSTI_CARRELLO:
+        raise ValidationError(f"Puoi prenotare al massimo {MAX_POSTI_CARRELLO} posti alla volta.", code="posti")
+    if len({p.pk for p, _ in richieste}) != len(richieste):
+        raise ValidationError("Ogni proiezione va indicata una sola volta.", code="posti")
+    if staff_mode and not (nome_cliente or telefono_cliente):
+        raise ValidationError("Inserisci nome e telefono del cliente.", code="cliente")
+
+    socio = (not staff_mode) and getattr(utente, "socio", False)
+    prezzi = {p.pk: tabella_prezzi(p) for p, _ in richieste}  # dalla cache, prima di prendere i lock
+    proiezione_ids = [p.pk for p, _ in richieste]
+    now = timezone.now()
+    esiti = []
+
+    try:
+        with transaction.atomic():  # le prossime operazioni devono avvenire tutte insieme
+            # una query per tutti i posti richiesti (e lock per concorrenza)
+            posti = Posto.objects.select_for_update().filter(attivo=True).in_bulk(tutti)
+            venduti = set(
+                Biglietto.objects
+                .filter(proiezione_id__in=proiezione_ids, posto_id__in=tutti)
+                .values_list("proiezione_id", "posto_id")
+            )
+            gia_prenotati = Counter()
+            if not staff_mode:
+                gia_prenotati = Counter(
+                    Biglietto.objects
+                    .select_for_update()
+                    .filter(proiezione_id__in=proiezione_ids, utente=utente, stato=Biglietto.Stato.PRENOTATO)
+                    .values_list("proiezione_id", flat=True)
+                )
+
+            for proiezione, ids in richieste:
+                if not prenotabile(proiezione, now):
+                    stato_proiezione = NON_PRENOTABILE
+                elif not staff_mode and gia_prenotati[proiezione.pk] + len(ids) > MAX_BIGLIETTI_CLIENTE:
+                    stato_proiezione = LIMITE
+                else:
+                    stato_proiezione = LIBERO
+
+                for posto_id in ids:
+                    posto = posti.get(posto_id)
+                    if posto is None or posto.sala_id != proiezione.sala_id:
+                        esito = NON_VALIDO
+                    elif stato_proiezione != LIBERO:
+                        esito = stato_proiezione
+                    elif (proiezione.pk, posto_id) in venduti:
+                        esito = OCCUPATO
+                    else:
+                        esito = LIBERO
+                    esiti.append({
+                        "proiezione": proiezione,
+                        "posto_id": posto_id,
+                        "posto": posto if esito != NON_VALIDO else None,
+                        "esito": esito,
+                        "prezzo": prezzo_posto(prezzi[proiezione.pk], posto.categoria, socio) if esito != NON_VALIDO else None,
+                        "biglietto": None,
+                    })
+
+            negativi = Counter(e["esito"] for e in esiti if e["esito"] != LIBERO)
+            if negativi:
+                if negativi[LIMITE]:
+                    RIFIUTI_LIMITE.inc()
+                if negativi[OCCUPATO]:
+                    CONFLITTI.inc()
+                return esiti
+
+            biglietti = Biglietto.objects.bulk_create([
+                Biglietto(
+                    proiezione=e["proiezione"],
+                    posto=e["posto"],
+                    prezzo=e["prezzo"],
+                    utente=None if staff_mode else utente,
+                    nome_cliente=nome_cliente if staff_mode else "",
+                    telefono_cliente=telefono_cliente if staff_mode else "",
+                    stato=Biglietto.Stato.PRENOTATO,
+                )
+                for e in esiti
+            ])
+            # bulk_create non invia post_save; si invalida al commit, come nel signal
+            giorni = {timezone.localdate(p.data_ora): p.data_ora for p, _ in richieste}
+            for data_ora in giorni.values():
+                transaction.on_commit(partial(invalida_giorno, data_ora))
+
+    except IntegrityError:
+        # Scatta grazie al vincolo uniq_posto_per_proiezione (proiezione, posto): qualcuno ha venduto
+        # dei posti tra la verifica e l'inserimento, si rilegge quali
+        CONFLITTI.inc()
+        venduti = set(
+            Biglietto.objects
+            .filter(proiezione_id__in=proiezione_ids, posto_id__in=tutti)
+            .values_list("proiezione_id", "posto_id")
+        )
+        for e in esiti:
+            e["esito"] = OCCUPATO if (e["proiezione"].pk, e["posto_id"]) in venduti else LIBERO
+        return esiti
+
+    for e, biglietto in zip(esiti, biglietti):
+        e["esito"], e["biglietto"] = PRENOTATO, biglietto
+
+    canale = "segreteria" if staff_mode else "online"
+    PRENOTAZIONI.inc(canale=canale)
+    BIGLIETTI_PRENOTATI.inc(len(biglietti), canale=canale)
+    return esiti
+
+
+def prenota_posti(proiezione, posto_ids, utente, staff_mode=False, nome_cliente="", telefono_cliente=""):
+    """
+    Crea un biglietto per ogni posto di una proiezione e restituisce i biglietti creati.
+    Solleva ValidationError (code: "cliente", "posti", "limite", "conflitto") se non si può prenotare.
+    """
+    esiti = prenota_carrello(
+        [(proiezione, posto_ids)], utente, staff_mode=staff_mode,
+        nome_cliente=nome_cliente, telefono_cliente=telefono_cliente,
+    )
+    trovati = {e["esito"] for e in esiti}
+    for esito, code, messaggio in ERRORI:
+        if esito in trovati:
+            raise ValidationError(messaggio, code=code)
+    if trovati != {PRENOTATO}:
+        # inserimento fallito senza un conflitto ancora visibile (es. biglietto annullato nel frattempo):
+        # non è stato creato niente, si può riprovare
+        raise ValidationError("La prenotazione non è andata a buon fine. Riprova.", code="conflitto")
+    return [e["biglietto"] for e in esiti]
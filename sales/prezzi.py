@@ -0,0 +1,105 @@
+import time
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from cinema.models import Posto
+from monitoraggio.metriche import registra_cache
+from .models import Tariffa
+
+# Prezzi dei biglietti. Le tariffe attive vengono "compilate" una volta per versione (lista di regole
+# già convertite, in cache) e per ogni proiezione si calcola una tabella categoria -> (intero, socio),
+# anch'essa in cache. Prenotare N posti o disegnare la mappa della sala costa una sola lettura dalla
+# cache, senza valutare le regole per ogni biglietto.
+#
+# La chiave della tabella contiene tutto quello da cui dipende (versione delle tariffe, orario della
+# proiezione, rassegna): se la proiezione viene spostata la chiave cambia da sola; una modifica alle
+# tariffe (signals.py) assegna una nuova versione.
+# Senza tariffe valgono PREZZO_BASE e SCONTO_SOCIO (8.00 e 2.00 di sconto, i prezzi storici).
+
+CHIAVE_VERSIONE_TARIFFE = "tariffe:versione"
+DURATA_CACHE = 60 * 60 * 24
+
+
+def versione_tariffe():
+    versione = cache.get(CHIAVE_VERSIONE_TARIFFE)
+    if versione is None:
+        versione = time.time_ns()
+        cache.set(CHIAVE_VERSIONE_TARIFFE, versione, timeout=None)
+    return versione
+
+
+def invalida_tariffe():
+    cache.set(CHIAVE_VERSIONE_TARIFFE, time.time_ns(), timeout=None)
+
+
+def _compila(tariffe):
+    # già in ordine di priorità (Meta.ordering): per ogni categoria vince la prima che corrisponde
+    return [
+        {
+            "categoria": t.categoria or None,
+            "giorni": {int(g) for g in t.giorni_settimana} or None,
+            "ora_da": t.ora_da,
+            "ora_a": t.ora_a,
+            "rassegna": t.rassegna,
+            "dal": t.valida_dal,
+            "al": t.valida_al,
+            "prezzo": t.prezzo,
+            "sconto_socio": t.sconto_socio,
+        }
+        for t in tariffe
+    ]
+
+
+def regole(versione=None):
+    versione = versione or versione_tariffe()
+    chiave = f"tariffe:{versione}:regole"
+    compilate = cache.get(chiave)
+    if compilate is None:
+        compilate = _compila(Tariffa.objects.filter(attiva=True))
+        cache.set(chiave, compilate, DURATA_CACHE)
+    return compilate
+
+
+def _corrisponde(regola, inizio, rassegna):
+    giorno, ora = inizio.date(), inizio.time()
+    return (
+        (regola["giorni"] is None or giorno.weekday() in regola["giorni"])
+        and (regola["ora_da"] is None or ora >= regola["ora_da"])
+        and (regola["ora_a"] is None or ora < regola["ora_a"])
+        and (regola["rassegna"] is None or regola["rassegna"] == rassegna)
+        and (regola["dal"] is None or giorno >= regola["dal"])
+        and (regola["al"] is None or giorno <= regola["al"])
+    )
+
+
+def calcola_tabella(regole_compilate, data_ora, rassegna):
+    """{categoria: {"intero": Decimal, "socio": Decimal}} per una proiezione che inizia a data_ora."""
+    inizio = timezone.localtime(data_ora)
+    valide = [r for r in regole_compilate if _corrisponde(r, inizio, rassegna)]
+
+    tabella = {}
+    for categoria in Posto.Categoria.values:
+        regola = next((r for r in valide if r["categoria"] in (None, categoria)), None)
+        prezzo = regola["prezzo"] if regola else settings.PREZZO_BASE
+        sconto = regola["sconto_socio"] if regola else settings.SCONTO_SOCIO
+        tabella[categoria] = {"intero": prezzo, "socio": max(prezzo - sconto, Decimal("0.00"))}
+    return tabella
+
+
+def tabella_prezzi(proiezione):
+    """Tabella dei prezzi della proiezione (serve proiezione.film, meglio con select_related)."""
+    versione = versione_tariffe()
+    rassegna = proiezione.film.rassegna
+    chiave = f"prezzi:{proiezione.pk}:{versione}:{proiezione.data_ora.timestamp():.0f}:{int(rassegna)}"
+
+    tabella = cache.get(chiave)
+    registra_cache("prezzi", tabella is not None)
+    if tabella is None:
+        tabella = calcola_tabella(regole(versione), proiezione.data_ora, rassegna)
+        cache.set(chiave, tabella, DURATA_CACHE)
+    return tabella
+
+
+def prezzo_posto(tabella, categoria, socio=False):
+    return tabella[categoria]["socio" if socio else "intero"]
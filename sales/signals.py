@@ -0,0 +1,49 @@
+from threading import local
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from cinema.cache import invalida_giorno
+from cinema.models import Proiezione
+from .models import Biglietto, Tariffa
+from .prezzi import invalida_tariffe
+
+# proiezioni dei biglietti modificati e non ancora invalidate (una per thread, come le connessioni)
+_in_sospeso = local()
+
+
+def _invalida_in_sospeso():
+    # una sola query per tutte le proiezioni toccate dalla transazione (es. i delete riga per riga
+    # dell'archiviazione); le callback successive della stessa transazione trovano l'insieme vuoto
+    ids = getattr(_in_sospeso, "ids", None)
+    if not ids:
+        return
+    _in_sospeso.ids = set()
+    giorni = {}
+    for data_ora in Proiezione.objects.filter(pk__in=ids).values_list("data_ora", flat=True):
+        giorni.setdefault(timezone.localdate(data_ora), data_ora)
+    for data_ora in giorni.values():
+        invalida_giorno(data_ora)
+
+
+# la disponibilità dei posti fa parte della programmazione in cache di quel giorno.
+# Si invalida al commit: prima, una lettura concorrente rimetterebbe in cache sotto la nuova versione
+# la disponibilità non ancora confermata.
+# Attenzione: bulk_create non invia post_save, chi lo usa deve chiamare invalida_giorno a mano.
+@receiver([post_save, post_delete], sender=Biglietto)
+def biglietto_modificato(sender, instance, **kwargs):
+    if Biglietto.proiezione.is_cached(instance):
+        data_ora = instance.proiezione.data_ora
+        transaction.on_commit(lambda: invalida_giorno(data_ora))
+        return
+    # senza la proiezione già caricata basta il suo id: la data si legge al commit, una volta sola
+    if not hasattr(_in_sospeso, "ids"):
+        _in_sospeso.ids = set()
+    _in_sospeso.ids.add(instance.proiezione_id)
+    transaction.on_commit(_invalida_in_sospeso)
+
+
+# le tabelle dei prezzi in cache dipendono dalla versione delle tariffe
+@receiver([post_save, post_delete], sender=Tariffa)
+def tariffa_modificata(sender, instance, **kwargs):
+    invalida_tariffe()
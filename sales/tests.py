@@ -1,10 +1,25 @@
-from datetime import timedelta
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from unittest import mock
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.contrib.auth.models import Group
+from django.core.exceptions import ValidationError
+from django.core.cache import cache
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import IntegrityError, connection
 from django.urls import reverse
 from django.utils import timezone
+from accounts.permissions import GROUP_SEGRETARIO
+from cinema.calendario import inizio_giorno
 from cinema.models import Film, Proiezione, Sala, Posto
-from sales.models import Biglietto
+from cinema.pianta import applica_pianta, leggi_pianta
+from sales.models import Biglietto, Tariffa
+from sales.ammissione import SESSIONE, consuma_gettone, ip_cliente
+from sales.codici import impronta
+from sales.posti_migliori import migliori_posti
+from sales.prenotazioni import prenota_posti, stato_posti
+from sales.prezzi import tabella_prezzi
 
 User = get_user_model()
 
@@ -100,3 +115,435 @@ class PrenotaViewRulesTests(TestCase):
         # Assert: nessun biglietto creato
         self.assertEqual(resp.status_code, 200)
         self.assertEqual(Biglietto.objects.filter(proiezione=show).count(), 0)
+
+
+
+class ManagerDatiAttiviTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="u", password="pass", email="u@x.it")
+        sala = Sala.objects.create(nome="Sala 1")
+        cls.posto = Posto.objects.create(sala=sala, fila="A", numero_posto="1")
+        film = Film.objects.create(
+            titolo="Film Test", descrizione="...", data_uscita=timezone.localdate() - timedelta(days=30),
+            durata_minuti=100, genere="Test", regista="Reg", cast_principale="Cast",
+            locandina_url="https://example.com/poster.jpg",
+        )
+        inizio_oggi = inizio_giorno(timezone.localdate())
+        cls.ieri = Proiezione.objects.create(film=film, sala=sala, data_ora=inizio_oggi - timedelta(hours=4))
+        cls.oggi = Proiezione.objects.create(film=film, sala=sala, data_ora=inizio_oggi)  # già iniziata
+        cls.domani = Proiezione.objects.create(film=film, sala=sala, data_ora=inizio_oggi + timedelta(days=1, hours=20))
+
+    def test_proiezioni_future(self):
+        self.assertEqual(list(Proiezione.future.order_by("data_ora")), [self.domani])
+        self.assertEqual(Proiezione.objects.future(self.ieri.data_ora).count(), 3)
+        self.assertEqual(Proiezione.objects.count(), 3)  # il manager di default non filtra
+
+    def test_biglietti_attivi_da_inizio_giornata(self):
+        for p in (self.ieri, self.oggi, self.domani):
+            Biglietto.objects.create(proiezione=p, posto=self.posto, utente=self.user)
+
+        attivi = Biglietto.active.filter(utente=self.user)
+        self.assertEqual({b.proiezione_id for b in attivi}, {self.oggi.pk, self.domani.pk})
+
+
+
+class TariffeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="u", password="pass", email="u@x.it", socio=True)
+        sala = Sala.objects.create(nome="Sala 1")
+        cls.posto = Posto.objects.create(sala=sala, fila="A", numero_posto="1")
+        cls.premium = Posto.objects.create(sala=sala, fila="A", numero_posto="2", categoria=Posto.Categoria.PREMIUM)
+        cls.film = Film.objects.create(
+            titolo="Film Test", descrizione="...", data_uscita=timezone.localdate() - timedelta(days=30),
+            durata_minuti=100, genere="Test", regista="Reg", cast_principale="Cast",
+            locandina_url="https://example.com/poster.jpg",
+        )
+        oggi = timezone.localdate()
+        sabato = oggi + timedelta(days=(5 - oggi.weekday()) % 7 or 7)
+        cls.sabato_sera = Proiezione.objects.create(
+            film=cls.film, sala=sala, data_ora=timezone.make_aware(datetime.combine(sabato, time(21, 0))),
+        )
+        cls.sabato_pomeriggio = Proiezione.objects.create(
+            film=cls.film, sala=sala, data_ora=timezone.make_aware(datetime.combine(sabato, time(15, 0))),
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    # Senza tariffe restano i prezzi storici: 8.00, 6.00 per i soci
+    def test_prezzi_predefiniti_in_prenotazione(self):
+        self.client.force_login(self.user)
+        url = reverse("sales:prenota", kwargs={"proiezione_id": self.sabato_sera.id})
+        self.client.post(url, data={"seat_ids": str(self.posto.id)})
+        self.assertEqual(Biglietto.objects.get().prezzo, Decimal("6.00"))
+
+    # Vince la tariffa con priorità più alta tra quelle che corrispondono, categoria per categoria
+    def test_regole_per_fascia_giorno_e_categoria(self):
+        Tariffa.objects.create(nome="Base", prezzo=Decimal("7.00"))
+        Tariffa.objects.create(nome="Weekend sera", prezzo=Decimal("9.00"), giorni_settimana="56", ora_da=time(20, 0), priorita=10)
+        Tariffa.objects.create(nome="Premium", prezzo=Decimal("11.00"), sconto_socio=Decimal("1.00"), categoria=Posto.Categoria.PREMIUM, priorita=20)
+        Tariffa.objects.create(nome="Rassegna", prezzo=Decimal("5.00"), rassegna=True, priorita=30)
+
+        sera = tabella_prezzi(self.sabato_sera)
+        self.assertEqual(sera[Posto.Categoria.STANDARD], {"intero": Decimal("9.00"), "socio": Decimal("7.00")})
+        self.assertEqual(sera[Posto.Categoria.PREMIUM], {"intero": Decimal("11.00"), "socio": Decimal("10.00")})
+        self.assertEqual(tabella_prezzi(self.sabato_pomeriggio)[Posto.Categoria.STANDARD]["intero"], Decimal("7.00"))
+
+    # La tabella di una proiezione si calcola una volta; una modifica alle tariffe la rinnova
+    def test_tabella_in_cache_e_invalidata(self):
+        tabella_prezzi(self.sabato_sera)
+        with self.assertNumQueries(0):
+            tabella_prezzi(self.sabato_sera)
+
+        Tariffa.objects.create(nome="Base", prezzo=Decimal("7.50"))
+        self.assertEqual(tabella_prezzi(self.sabato_sera)[Posto.Categoria.STANDARD]["intero"], Decimal("7.50"))
+
+
+
+class MiglioriPostiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="u", password="pass", email="u@x.it")
+        cls.staff = User.objects.create_user(username="s", password="pass", email="s@x.it")
+        cls.staff.groups.add(Group.objects.create(name=GROUP_SEGRETARIO))
+        cls.sala = Sala.objects.create(nome="Sala 1")
+        # 5 file da 8 posti con un corridoio centrale; l'ultima ha i posti accessibili ai lati
+        applica_pianta(cls.sala, leggi_pianta("\n".join(["oooo.oooo"] * 4 + ["aooo.oooa"])))
+        film = Film.objects.create(
+            titolo="Film Test", descrizione="...", data_uscita=timezone.localdate() - timedelta(days=30),
+            durata_minuti=100, genere="Test", regista="Reg", cast_principale="Cast",
+            locandina_url="https://example.com/poster.jpg",
+        )
+        cls.proiezione = Proiezione.objects.create(film=film, sala=cls.sala, data_ora=timezone.now() + timedelta(days=1))
+
+    def setUp(self):
+        cache.clear()
+
+    def _etichette(self, posti):
+        return [f"{p['fila']}{p['numero_posto']}" for p in posti]
+
+    # Blocco di posti vicini nella fila ideale, il più centrale possibile, senza scavalcare il corridoio
+    def test_sceglie_blocco_centrale_senza_corridoi_ne_occupati(self):
+        posti, occupati = stato_posti(self.proiezione)
+        self.assertEqual(self._etichette(migliori_posti(posti, occupati, 2)), ["C3", "C4"])
+
+        occupati = {p["id"] for p in posti if p["fila"] == "C" and p["numero_posto"] == "3"}
+        self.assertEqual(self._etichette(migliori_posti(posti, occupati, 2)), ["C5", "C6"])
+        self.assertEqual(len(migliori_posti(posti, occupati, 4)), 4)
+        self.assertIsNone(migliori_posti(posti, occupati, 5))  # nessuna fila ha 5 posti senza corridoio
+
+    def test_endpoint_json(self):
+        self.client.force_login(self.user)
+        url = reverse("sales:posti_migliori", kwargs={"proiezione_id": self.proiezione.id})
+        resp = self.client.get(url, {"n": 2})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([p["label"] for p in resp.json()["posti"]], ["C3", "C4"])
+        self.assertEqual(resp.json()["posti"][0]["prezzo"], "8.00")
+        self.assertEqual(self.client.get(url, {"n": 3}).status_code, 400)  # oltre il limite del cliente
+
+    def test_prenotazione_rapida_segreteria(self):
+        url = reverse("sales:prenotazione_rapida", kwargs={"proiezione_id": self.proiezione.id})
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.post(url, {"n": 2, "nome_cliente": "Rossi"}).status_code, 403)
+
+        self.client.force_login(self.staff)
+        self.client.post(url, {"n": 4, "nome_cliente": "Rossi"})
+        self.client.post(url, {"n": 4, "nome_cliente": "Bianchi"})
+        biglietti = Biglietto.objects.filter(proiezione=self.proiezione).select_related("posto")
+        self.assertEqual(len(biglietti), 8)
+        self.assertEqual({b.nome_cliente for b in biglietti}, {"Rossi", "Bianchi"})
+        self.assertFalse(any(b.posto.categoria == Posto.Categoria.ACCESSIBILE for b in biglietti))
+
+
+
+class CarrelloTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="u", password="pass", email="u@x.it")
+        cls.staff = User.objects.create_user(username="s", password="pass", email="s@x.it")
+        cls.staff.groups.add(Group.objects.create(name=GROUP_SEGRETARIO))
+        sala = Sala.objects.create(nome="Sala 1")
+        cls.posti = Posto.objects.bulk_create([Posto(sala=sala, fila="A", numero_posto=str(i)) for i in range(1, 6)])
+        film = Film.objects.create(
+            titolo="Film Test", descrizione="...", data_uscita=timezone.localdate() - timedelta(days=30),
+            durata_minuti=100, genere="Test", regista="Reg", cast_principale="Cast",
+            locandina_url="https://example.com/poster.jpg",
+        )
+        domani = inizio_giorno(timezone.localdate() + timedelta(days=1))
+        cls.proiezioni = [
+            Proiezione.objects.create(film=film, sala=sala, data_ora=domani + timedelta(hours=15 + 3 * i))
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def _prenota(self, righe, **extra):
+        corpo = {"prenotazioni": [{"proiezione": p.id, "posti": [x.id for x in posti]} for p, posti in righe], **extra}
+        return self.client.post(reverse("sales:carrello"), data=corpo, content_type="application/json")
+
+    # Tutte le proiezioni in una transazione, con un numero di query che non dipende da quante sono
+    def test_prenota_piu_proiezioni(self):
+        self.client.force_login(self.user)
+        tabella_prezzi(self.proiezioni[0])  # regole delle tariffe già in cache
+        with CaptureQueriesContext(connection) as una:
+            resp = self._prenota([(self.proiezioni[0], self.posti[:2])])
+        self.assertEqual(resp.status_code, 201)
+
+        with CaptureQueriesContext(connection) as due:
+            resp = self._prenota([(self.proiezioni[1], self.posti[:2]), (self.proiezioni[2], self.posti[2:4])])
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(len(una), len(due))
+
+        dati = resp.json()
+        self.assertEqual(dati["totale"], "32.00")
+        self.assertEqual({p["esito"] for p in dati["posti"]}, {"prenotato"})
+        self.assertEqual(Biglietto.objects.filter(utente=self.user).count(), 6)
+
+    # Tutto o niente: un posto occupato o il limite superato bloccano l'intero carrello, con l'esito di ogni posto
+    def test_esiti_per_posto_senza_prenotare_nulla(self):
+        Biglietto.objects.create(proiezione=self.proiezioni[0], posto=self.posti[0], nome_cliente="Rossi")
+        self.client.force_login(self.user)
+
+        resp = self._prenota([(self.proiezioni[0], self.posti[:2]), (self.proiezioni[1], self.posti[:3])])
+        self.assertEqual(resp.status_code, 409)
+        esiti = [(p["proiezione"], p["label"], p["esito"]) for p in resp.json()["posti"]]
+        self.assertEqual(esiti, [
+            (self.proiezioni[0].id, "A1", "occupato"),
+            (self.proiezioni[0].id, "A2", "libero"),
+            (self.proiezioni[1].id, "A1", "limite"),
+            (self.proiezioni[1].id, "A2", "limite"),
+            (self.proiezioni[1].id, "A3", "limite"),
+        ])
+        self.assertEqual(Biglietto.objects.count(), 1)
+
+    # La segreteria (gruppi scolastici) non ha il limite per proiezione ma deve indicare il cliente
+    def test_segreteria_senza_limite(self):
+        self.client.force_login(self.staff)
+        self.assertEqual(self._prenota([(self.proiezioni[0], self.posti)]).status_code, 400)
+
+        resp = self._prenota([(p, self.posti) for p in self.proiezioni], nome_cliente="Scuola Verdi")
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(Biglietto.objects.filter(nome_cliente="Scuola Verdi").count(), 15)
+
+    # Se l'inserimento fallisce ma alla rilettura non c'è nessun posto occupato, non è un successo
+    def test_inserimento_fallito_senza_conflitto(self):
+        with mock.patch.object(Biglietto.objects, "bulk_create", side_effect=IntegrityError):
+            with self.assertRaises(ValidationError) as errore:
+                prenota_posti(self.proiezioni[0], [self.posti[0].id], self.user)
+
+        self.assertEqual(errore.exception.code, "conflitto")
+        self.assertFalse(Biglietto.objects.exists())
+
+
+
+class IdempotenzaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="u", password="pass", email="u@x.it")
+        sala = Sala.objects.create(nome="Sala 1")
+        cls.posto = Posto.objects.create(sala=sala, fila="A", numero_posto="1")
+        film = Film.objects.create(
+            titolo="Film Test", descrizione="...", data_uscita=timezone.localdate() - timedelta(days=30),
+            durata_minuti=100, genere="Test", regista="Reg", cast_principale="Cast",
+            locandina_url="https://example.com/poster.jpg",
+        )
+        cls.proiezione = Proiezione.objects.create(film=film, sala=sala, data_ora=timezone.now() + timedelta(days=1))
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    # Il doppio invio dello stesso form ripete l'esito della prima richiesta senza toccare posti e biglietti
+    def test_prenotazione_ripetuta(self):
+        url = reverse("sales:prenota", kwargs={"proiezione_id": self.proiezione.id})
+        dati = {"seat_ids": str(self.posto.id), "chiave_idempotenza": "abc"}
+        self.client.post(url, data=dati)
+
+        with CaptureQueriesContext(connection) as query:
+            resp = self.client.post(url, data=dati)
+        self.assertEqual(resp["Idempotent-Replayed"], "true")
+        self.assertRedirects(resp, url, fetch_redirect_response=False)
+        self.assertFalse([q for q in query.captured_queries if "sales_biglietto" in q["sql"] or "cinema_posto" in q["sql"]])
+
+        self.assertEqual(Biglietto.objects.count(), 1)
+        messaggi = [str(m) for m in self.client.get(url).context["messages"]]
+        self.assertEqual(messaggi, ["Prenotazione completata! Biglietti creati."])  # non ripetuto se ancora da mostrare
+
+    def test_annullamento_ripetuto(self):
+        biglietto = Biglietto.objects.create(proiezione=self.proiezione, posto=self.posto, utente=self.user)
+        url = reverse("sales:annulla_biglietto", kwargs={"biglietto_id": biglietto.id})
+        self.client.post(url, data={"chiave_idempotenza": "abc"})
+        resp = self.client.post(url, data={"chiave_idempotenza": "abc"})  # senza chiave sarebbe un 404
+        self.assertRedirects(resp, reverse("accounts:mie_prenotazioni"))
+        self.assertEqual(Biglietto.objects.count(), 0)
+
+    # Le API JSON usano l'header Idempotency-Key; una chiave nuova esegue di nuovo la richiesta
+    def test_carrello_con_header(self):
+        url = reverse("sales:carrello")
+        corpo = {"prenotazioni": [{"proiezione": self.proiezione.id, "posti": [self.posto.id]}]}
+        prima = self.client.post(url, data=corpo, content_type="application/json", headers={"Idempotency-Key": "k1"})
+        ripetuta = self.client.post(url, data=corpo, content_type="application/json", headers={"Idempotency-Key": "k1"})
+        self.assertEqual(prima.status_code, 201)
+        self.assertEqual((ripetuta.status_code, ripetuta.json()), (201, prima.json()))
+
+        nuova = self.client.post(url, data=corpo, content_type="application/json", headers={"Idempotency-Key": "k2"})
+        self.assertEqual(nuova.json()["posti"][0]["esito"], "occupato")
+
+    # La stessa chiave con un contenuto diverso non ripete l'esito di un'altra richiesta
+    def test_chiave_riusata_con_dati_diversi(self):
+        altro = Posto.objects.create(sala=self.posto.sala, fila="A", numero_posto="2")
+        url = reverse("sales:prenota", kwargs={"proiezione_id": self.proiezione.id})
+        self.client.post(url, data={"seat_ids": str(self.posto.id), "chiave_idempotenza": "abc"})
+
+        resp = self.client.post(url, data={"seat_ids": str(altro.id), "chiave_idempotenza": "abc"})
+
+        self.assertEqual(resp.status_code, 422)
+        self.assertFalse(Biglietto.objects.filter(posto=altro).exists())
+
+
+
+class AmmissioneTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="u", password="pass", email="u@x.it")
+        cls.altro = User.objects.create_user(username="v", password="pass", email="v@x.it")
+        sala = Sala.objects.create(nome="Sala 1")
+        cls.posti = Posto.objects.bulk_create([Posto(sala=sala, fila="A", numero_posto=str(i)) for i in range(1, 4)])
+        film = Film.objects.create(
+            titolo="Film Test", descrizione="...", data_uscita=timezone.localdate() - timedelta(days=30),
+            durata_minuti=100, genere="Test", regista="Reg", cast_principale="Cast",
+            locandina_url="https://example.com/poster.jpg",
+        )
+        cls.proiezione = Proiezione.objects.create(film=film, sala=sala, data_ora=timezone.now() + timedelta(days=1))
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_secchio_di_gettoni(self):
+        self.assertEqual(consuma_gettone("prova", 2, 10, now=100), 0)
+        self.assertEqual(consuma_gettone("prova", 2, 10, now=100), 0)
+        self.assertEqual(consuma_gettone("prova", 2, 10, now=100), 5)  # un gettone ogni 5 secondi
+        self.assertEqual(consuma_gettone("prova", 2, 10, now=105), 0)
+
+    @override_settings(LIMITI_PRENOTAZIONE_ATTIVI=True, LIMITE_PRENOTAZIONE_UTENTE=(1, 60))
+    def test_limite_di_frequenza_per_utente(self):
+        url = reverse("sales:prenota", kwargs={"proiezione_id": self.proiezione.id})
+        self.client.post(url, data={"seat_ids": str(self.posti[0].id)})
+        resp = self.client.post(url, data={"seat_ids": str(self.posti[1].id)})
+        self.assertEqual(resp["Retry-After"], "60")
+        self.assertEqual(Biglietto.objects.count(), 1)
+
+        corpo = {"prenotazioni": [{"proiezione": self.proiezione.id, "posti": [self.posti[1].id]}]}
+        resp = self.client.post(reverse("sales:carrello"), data=corpo, content_type="application/json")
+        self.assertEqual(resp.status_code, 429)
+
+        altro = Client()
+        altro.force_login(self.altro)  # il limite è per utente
+        altro.post(url, data={"seat_ids": str(self.posti[1].id)})
+        self.assertEqual(Biglietto.objects.count(), 2)
+
+    # Con sala_attesa=1 sceglie i posti un cliente alla volta; chi prenota lascia il turno al prossimo
+    def test_sala_attesa(self):
+        Proiezione.objects.filter(pk=self.proiezione.pk).update(sala_attesa=1)
+        url = reverse("sales:prenota", kwargs={"proiezione_id": self.proiezione.id})
+        attesa = reverse("sales:sala_attesa", kwargs={"proiezione_id": self.proiezione.id})
+
+        self.assertTemplateUsed(self.client.get(url), "sales/prenota.html")
+        altro = Client()
+        altro.force_login(self.altro)
+        resp = altro.get(url)
+        self.assertTemplateUsed(resp, "sales/sala_attesa.html")
+        self.assertEqual(resp.context["attesa"]["posizione"], 1)
+
+        altro.post(url, data={"seat_ids": str(self.posti[2].id)})  # non ancora ammesso
+        self.assertFalse(Biglietto.objects.exists())
+        self.assertEqual(altro.get(attesa).json()["ammesso"], False)
+
+        self.client.post(url, data={"seat_ids": str(self.posti[0].id)})
+        self.assertEqual(altro.get(attesa).json()["ammesso"], True)
+        self.assertTemplateUsed(altro.get(url), "sales/prenota.html")
+
+    # Se il lucchetto della coda resta occupato si risponde 503 senza toccare la coda
+    def test_coda_occupata(self):
+        Proiezione.objects.filter(pk=self.proiezione.pk).update(sala_attesa=1)
+        cache.set(f"attesa:{self.proiezione.id}:lucchetto", 1)
+
+        resp = self.client.get(reverse("sales:prenota", kwargs={"proiezione_id": self.proiezione.id}))
+
+        self.assertEqual(resp.status_code, 503)
+        self.assertTemplateUsed(resp, "sales/sala_attesa.html")
+        self.assertIsNone(cache.get(f"attesa:{self.proiezione.id}"))
+        self.assertNotIn(SESSIONE, self.client.session)
+
+    # Dietro un reverse proxy l'IP del cliente è quello aggiunto dal proxy a X-Forwarded-For
+    def test_ip_cliente(self):
+        request = RequestFactory().get("/", REMOTE_ADDR="10.0.0.1", HTTP_X_FORWARDED_FOR="6.6.6.6, 1.2.3.4")
+
+        self.assertEqual(ip_cliente(request), "10.0.0.1")
+        with self.settings(PROXY_FIDATI=1):
+            self.assertEqual(ip_cliente(request), "1.2.3.4")  # 6.6.6.6 lo ha scritto il client
+
+
+
+class CodiciBigliettoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="u", password="pass", email="u@x.it")
+        cls.staff = User.objects.create_user(username="s", password="pass", email="s@x.it")
+        cls.staff.groups.add(Group.objects.create(name=GROUP_SEGRETARIO))
+        sala = Sala.objects.create(nome="Sala 1")
+        cls.posti = Posto.objects.bulk_create([Posto(sala=sala, fila="A", numero_posto=str(i)) for i in range(1, 3)])
+        film = Film.objects.create(
+            titolo="Film Test", descrizione="...", data_uscita=timezone.localdate() - timedelta(days=30),
+            durata_minuti=100, genere="Test", regista="Reg", cast_principale="Cast",
+            locandina_url="https://example.com/poster.jpg",
+        )
+        cls.proiezione = Proiezione.objects.create(film=film, sala=sala, data_ora=timezone.now() + timedelta(days=1))
+        cls.biglietto = Biglietto.objects.create(proiezione=cls.proiezione, posto=cls.posti[0], utente=cls.user)
+        cls.segreteria = Biglietto.objects.create(proiezione=cls.proiezione, posto=cls.posti[1], nome_cliente="Rossi")
+
+    def _verifica(self, codice, **extra):
+        return self.client.post(reverse("sales:verifica_biglietto"), {"codice": codice, **extra}).json()
+
+    # Il codice firmato vale solo per quel biglietto: non si può modificare né riusare dopo l'annullamento
+    def test_verifica_online(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.post(reverse("sales:verifica_biglietto"), {"codice": self.biglietto.codice}).status_code, 403)
+
+        self.client.force_login(self.staff)
+        esito = self._verifica(self.biglietto.codice, proiezione=self.proiezione.id)
+        self.assertEqual((esito["valido"], esito["posto"], esito["cliente"]), (True, "A1", "u"))
+
+        altro_id = self.biglietto.codice.replace(f"{self.biglietto.pk}-", f"{self.segreteria.pk}-", 1)
+        self.assertFalse(self._verifica(altro_id)["valido"])
+        self.assertFalse(self._verifica("non-un-codice")["valido"])
+        firma = self.biglietto.codice.split("-", 1)[1]
+        self.assertFalse(self._verifica(f"²-{firma}")["valido"])  # isdigit() ma non int()
+        self.assertFalse(self._verifica(f"{'9' * 40}-{firma}")["valido"])
+        self.assertFalse(self._verifica(self.biglietto.codice, proiezione=self.proiezione.id + 1)["valido"])
+
+        codice = self.biglietto.codice
+        Biglietto.objects.filter(pk=self.biglietto.pk).delete()
+        self.assertFalse(self._verifica(codice)["valido"])
+
+    # Il manifest contiene le impronte dei codici, non i codici
+    def test_manifest(self):
+        self.client.force_login(self.staff)
+        resp = self.client.get(reverse("sales:manifest", kwargs={"proiezione_id": self.proiezione.id}))
+        self.assertEqual(resp.json()["biglietti"], {
+            impronta(self.biglietto.codice): "A1",
+            impronta(self.segreteria.codice): "A2",
+        })
+        self.assertNotIn(self.biglietto.codice, resp.content.decode())
+
+        scanner = self.client.get(reverse("sales:scanner", kwargs={"proiezione_id": self.proiezione.id}))
+        self.assertContains(scanner, reverse("sales:manifest", kwargs={"proiezione_id": self.proiezione.id}))
+
+    def test_qr_nelle_mie_prenotazioni(self):
+        self.client.force_login(self.user)
+        resp = self.client.get(reverse("accounts:mie_prenotazioni"))
+        self.assertContains(resp, f'data-codice="{self.biglietto.codice}"')
@@ -5,6 +5,13 @@ app_name = "sales"
 
 urlpatterns = [
     path("prenota/<int:proiezione_id>/", views.prenota, name="prenota"),
+    path("prenota/<int:proiezione_id>/posti-migliori/", views.posti_migliori, name="posti_migliori"),
+    path("prenota/<int:proiezione_id>/attesa/", views.sala_attesa, name="sala_attesa"),
+    path("prenota/<int:proiezione_id>/rapida/", views.PrenotazioneRapidaView.as_view(), name="prenotazione_rapida"),
+    path("carrello/", views.carrello, name="carrello"),
+    path("proiezioni/<int:proiezione_id>/scanner/", views.ScannerView.as_view(), name="scanner"),
+    path("proiezioni/<int:proiezione_id>/manifest/", views.ManifestView.as_view(), name="manifest"),
+    path("biglietti/verifica/", views.VerificaBigliettoView.as_view(), name="verifica_biglietto"),
     path("prenotazioni/<int:biglietto_id>/annulla/", views.annulla_biglietto, name="annulla_biglietto"),
     path("film/<int:film_id>/prenotazioni/", views.PrenotazioniFilmView.as_view(), name="prenotazioni_film"),
     path("biglietti/<int:biglietto_id>/annulla-staff/", views.BigliettoStaffDeleteView.as_view(), name="annulla_biglietto_staff"),
@@ -1,7 +1,10 @@
-from datetime import timedelta
+import json
 from django.contrib import messages
-from django.db import IntegrityError, transaction
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET, require_POST
+from django.core.exceptions import ValidationError
 from django.shortcuts import get_object_or_404, render, redirect
+from django.utils.decorators import method_decorator
 from django.utils import timezone
 from django.contrib.auth.decorators import login_required
 from cinema.models import Posto, Proiezione
@@ -11,7 +14,19 @@ from django.views.generic import DetailView, DeleteView, View
 from django.urls import reverse
 from braces.views import GroupRequiredMixin
 from accounts.permissions import is_operational_staff
-from decimal import Decimal
+from cinema.pianta import griglia
+from .ammissione import (
+    AMMESSO, INTERVALLO_POLLING, SCADUTO, SESSIONE, CodaOccupata, ammesso, controlla_turno, libera_turno, limita_frequenza, turno,
+)
+from .codici import codice_valido, leggi_codice, manifest
+from .idempotenza import idempotente
+from .posti_migliori import migliori_posti
+from .prenotazioni import MAX_BIGLIETTI_CLIENTE, PRENOTATO, prenota_carrello, prenota_posti, stato_posti
+from .prezzi import prezzo_posto, tabella_prezzi
+from monitoraggio.metriche import ANNULLAMENTI
+
+
+MAX_POSTI_RICERCA = 10  # gruppo più grande per la scelta automatica dei posti (segreteria)
 
 
 class PrenotazioniFilmView(GroupRequiredMixin, DetailView):
@@ -58,6 +73,7 @@ class BigliettoSegnaPagatoView(GroupRequiredMixin, View):
 
 
 
+@method_decorator(idempotente, name="post")
 class BigliettoStaffDeleteView(GroupRequiredMixin, DeleteView):
     model = Biglietto
     pk_url_kwarg = "biglietto_id"
@@ -76,6 +92,8 @@ class BigliettoStaffDeleteView(GroupRequiredMixin, DeleteView):
 
 
 @login_required
+@limita_frequenza
+@idempotente
 def prenota(request, proiezione_id):
     proiezione = get_object_or_404(
         Proiezione.objects.select_related("film", "sala"),
@@ -93,126 +111,247 @@ def prenota(request, proiezione_id):
         messages.error(request, "Non puoi prenotare: il film non è ancora in programmazione.")
         return redirect("cinema:prossimamente")
 
+    # proiezioni molto richieste: si scelgono i posti a turno (sales/ammissione.py)
+    try:
+        attesa = controlla_turno(request, proiezione)
+        stato = 200
+    except CodaOccupata:
+        # troppi accessi insieme alla coda: la pagina d'attesa riprova da sola
+        attesa, stato = {"posizione": None, "attesa_secondi": INTERVALLO_POLLING}, 503
+    if attesa is not None:
+        if request.method == "POST":
+            messages.error(request, "Aspetta il tuo turno per scegliere i posti.")
+            return redirect("sales:prenota", proiezione_id=proiezione.id)
+        risposta = render(request, "sales/sala_attesa.html", {
+            "proiezione": proiezione, "attesa": attesa, "intervallo": INTERVALLO_POLLING,
+        }, status=stato)
+        if stato == 503:
+            risposta["Retry-After"] = str(INTERVALLO_POLLING)
+        return risposta
+
     # -------- POST: crea i biglietti --------
     if request.method == "POST":
         # seat_ids arriva come "12,15,18"
         seat_ids_raw = (request.POST.get("seat_ids") or "").strip()
         seat_ids = [s.strip() for s in seat_ids_raw.split(",") if s.strip()] #alla fine abbiamo una semplice lista di ID
 
-        if not seat_ids:
-            messages.error(request, "Seleziona almeno un posto.")
-            return redirect("sales:prenota", proiezione_id=proiezione.id)
-        
-        staff_mode = is_operational_staff(request.user)
-
-        prezzo_unitario = Decimal("8.00")
-        if (not staff_mode) and getattr(request.user, "socio", False):
-            prezzo_unitario = Decimal("6.00")
-
-        nome_cliente = (request.POST.get("nome_cliente") or "").strip()
-        telefono_cliente = (request.POST.get("telefono_cliente") or "").strip()
-
-        if staff_mode:
-            # obbliga almeno un dato cliente
-            if not (nome_cliente or telefono_cliente):
-                messages.error(request, "Inserisci nome e telefono del cliente.")
-                return redirect("sales:prenota", proiezione_id=proiezione.id)
-
-
         try:
-            with transaction.atomic():  # le prossime operazioni devono avvenire tutte insieme
-
-                if not staff_mode:
-                    gia_prenotati = (
-                        Biglietto.objects
-                        .select_for_update()
-                        .filter(proiezione=proiezione, utente=request.user, stato=Biglietto.Stato.PRENOTATO)
-                        .count()
-                    )
-                    if gia_prenotati + len(seat_ids) > 2:
-                        messages.error(request, "Puoi prenotare al massimo 2 biglietti per questa proiezione.")
-                        return redirect("sales:prenota", proiezione_id=proiezione.id)
-                    
-                # Verifica che i posti siano della sala della proiezione (e lock per concorrenza)
-                posti = list(
-                    Posto.objects.select_for_update()
-                    .filter(id__in=seat_ids, sala=proiezione.sala)
-                )
-
-                if len(posti) != len(seat_ids):
-                    messages.error(request, "Uno o più posti non sono validi per questa sala.")
-                    return redirect("sales:prenota", proiezione_id=proiezione.id)
-
-                # Crea un biglietto per ogni posto
-                Biglietto.objects.bulk_create([
-                    Biglietto(
-                        proiezione=proiezione,
-                        posto=posto,
-                        prezzo=prezzo_unitario,
-                        utente=None if staff_mode else request.user,
-                        nome_cliente=nome_cliente if staff_mode else "",
-                        telefono_cliente=telefono_cliente if staff_mode else "",
-                        stato=Biglietto.Stato.PRENOTATO,
-                    )
-                    for posto in posti
-                ])
-
-
-        except IntegrityError:
-            # Scatta grazie al vincolo uniq_posto_per_proiezione (proiezione, posto)
-            messages.error(request, "Alcuni posti sono appena stati prenotati da un altro utente. Riprova.")
+            prenota_posti(
+                proiezione, seat_ids, request.user,
+                staff_mode=is_operational_staff(request.user),
+                nome_cliente=(request.POST.get("nome_cliente") or "").strip(),
+                telefono_cliente=(request.POST.get("telefono_cliente") or "").strip(),
+            )
+        except ValidationError as e:
+            messages.error(request, e.messages[0])
             return redirect("sales:prenota", proiezione_id=proiezione.id)
 
+        libera_turno(request, proiezione)
         messages.success(request, "Prenotazione completata! Biglietti creati.")
         return redirect("sales:prenota", proiezione_id=proiezione.id)  # o profilo
 
     # -------- GET --------
-    posti = (
-        Posto.objects
-        .filter(sala=proiezione.sala)
-        .order_by("fila", "numero_posto")
-    )
+    posti, occupati = stato_posti(proiezione)
+
+    prezzi = tabella_prezzi(proiezione)
+    socio = not is_operational_staff(request.user) and getattr(request.user, "socio", False)
+
+    # la pianta della sala: celle vuote per corridoi e spazi senza posto
+    colonne, righe = griglia([
+        {
+            **posto,
+            "label": f"{posto['fila']}{posto['numero_posto']}",
+            "occupied": posto["id"] in occupati,
+            "prezzo": prezzo_posto(prezzi, posto["categoria"], socio),
+        }
+        for posto in posti
+    ])
+    categorie_presenti = {posto["categoria"] for posto in posti}
 
-    occupati = set(
-        Biglietto.objects
-        .filter(proiezione=proiezione)
-        .values_list("posto_id", flat=True)
-    )
+    context = {
+        "proiezione": proiezione,
+        "righe": righe,
+        "colonne": colonne,
+        "listino": [
+            {"categoria": etichetta, "prezzo": prezzo_posto(prezzi, categoria, socio)}
+            for categoria, etichetta in Posto.Categoria.choices
+            if categoria in categorie_presenti
+        ],
+        "now": timezone.now(),
+        "staff_mode": is_operational_staff(request.user),
+        "max_posti": MAX_POSTI_RICERCA if is_operational_staff(request.user) else MAX_BIGLIETTI_CLIENTE,
+    }
+    return render(request, "sales/prenota.html", context)
 
-    righe = []
-    riga_corrente = None
-    buffer_posti = []
 
-    for posto in posti:
-        if riga_corrente is None:
-            riga_corrente = posto.fila
+def _numero_posti(valore, massimo):
+    try:
+        n = int(valore)
+    except (TypeError, ValueError):
+        return None
+    return n if 1 <= n <= massimo else None
 
-        if posto.fila != riga_corrente:
-            righe.append({"fila": riga_corrente, "posti": buffer_posti})
-            riga_corrente = posto.fila
-            buffer_posti = []
 
-        buffer_posti.append(
+@require_GET
+@login_required
+def posti_migliori(request, proiezione_id):
+    # i migliori N posti vicini ancora liberi, per preselezionarli sulla mappa
+    proiezione = get_object_or_404(Proiezione.objects.select_related("film"), id=proiezione_id)
+    staff_mode = is_operational_staff(request.user)
+
+    n = _numero_posti(request.GET.get("n", 2), MAX_POSTI_RICERCA if staff_mode else MAX_BIGLIETTI_CLIENTE)
+    if n is None:
+        return JsonResponse({"errore": "Numero di posti non valido."}, status=400)
+    if proiezione.data_ora < timezone.now():
+        return JsonResponse({"errore": "La proiezione è già passata."}, status=400)
+
+    posti, occupati = stato_posti(proiezione)
+    scelti = migliori_posti(posti, occupati, n, accessibili=request.GET.get("accessibili") == "1") or []
+
+    prezzi = tabella_prezzi(proiezione)
+    socio = not staff_mode and getattr(request.user, "socio", False)
+    return JsonResponse({
+        "posti": [
             {
-                "id": posto.id,
-                "label": f"{posto.fila}{posto.numero_posto}",
-                "occupied": posto.id in occupati,
+                "id": p["id"],
+                "label": f"{p['fila']}{p['numero_posto']}",
+                "prezzo": str(prezzo_posto(prezzi, p["categoria"], socio)),
             }
-        )
+            for p in scelti
+        ],
+    })
 
-    if riga_corrente is not None:
-        righe.append({"fila": riga_corrente, "posti": buffer_posti})
 
-    context = {
-        "proiezione": proiezione,
-        "righe": righe,
-        "now": timezone.now(),
-        "staff_mode": is_operational_staff(request.user),
-    }
-    return render(request, "sales/prenota.html", context)
+@method_decorator(idempotente, name="post")
+class PrenotazioneRapidaView(GroupRequiredMixin, View):
+    # segreteria: prenota in un colpo i migliori N posti vicini per un cliente al telefono o alla cassa
+    group_required = ["segretario", "gestore_film"]
+    superuser_allowed = True
+    raise_exception = True
+    TENTATIVI = 3  # se i posti scelti vengono venduti nel frattempo si ricalcola
+
+    def post(self, request, proiezione_id):
+        proiezione = get_object_or_404(Proiezione.objects.select_related("film", "sala"), id=proiezione_id)
+        if proiezione.data_ora < timezone.now():
+            messages.error(request, "Non puoi prenotare: la proiezione è già passata.")
+            return redirect("cinema:programmazione")
+
+        n = _numero_posti(request.POST.get("n"), MAX_POSTI_RICERCA)
+        if n is None:
+            messages.error(request, f"Indica da 1 a {MAX_POSTI_RICERCA} posti.")
+            return redirect("sales:prenota", proiezione_id=proiezione.id)
+
+        for _ in range(self.TENTATIVI):
+            posti, occupati = stato_posti(proiezione)
+            scelti = migliori_posti(posti, occupati, n, accessibili=request.POST.get("accessibili") == "1")
+            if not scelti:
+                messages.error(request, f"Non ci sono {n} posti vicini liberi.")
+                break
+            try:
+                prenota_posti(
+                    proiezione, [p["id"] for p in scelti], request.user, staff_mode=True,
+                    nome_cliente=(request.POST.get("nome_cliente") or "").strip(),
+                    telefono_cliente=(request.POST.get("telefono_cliente") or "").strip(),
+                )
+            except ValidationError as e:
+                if e.code == "conflitto":
+                    continue
+                messages.error(request, e.messages[0])
+                break
+            messages.success(request, "Prenotati i posti " + ", ".join(f"{p['fila']}{p['numero_posto']}" for p in scelti) + ".")
+            break
+        else:
+            messages.error(request, "Alcuni posti sono appena stati prenotati da un altro utente. Riprova.")
+
+        return redirect("sales:prenota", proiezione_id=proiezione.id)
+
+
+@require_GET
+def sala_attesa(request, proiezione_id):
+    # polling della pagina d'attesa: solo sessione e cache, nessuna query sulla proiezione
+    numero = request.session.get(SESSIONE, {}).get(str(proiezione_id))
+    try:
+        stato = turno(proiezione_id, numero) if numero else None
+    except CodaOccupata:
+        risposta = JsonResponse({"ammesso": False, "riprova": True}, status=503)
+        risposta["Retry-After"] = str(INTERVALLO_POLLING)
+        return risposta
+    if stato is None or stato["esito"] == SCADUTO:
+        return JsonResponse({"ammesso": False, "ricarica": True})  # la pagina di prenotazione assegna un nuovo numero
+    return JsonResponse({
+        "ammesso": stato["esito"] == AMMESSO,
+        "posizione": stato["posizione"],
+        "attesa_secondi": stato["attesa_secondi"],
+    })
+
+
+@require_POST
+@login_required
+@limita_frequenza
+@idempotente
+def carrello(request):
+    """
+    Prenota in una sola transazione posti di più proiezioni (scuole, abbonati alle rassegne).
+    Corpo JSON: {"prenotazioni": [{"proiezione": 5, "posti": [12, 13]}, ...], "nome_cliente": "", "telefono_cliente": ""}
+    Risponde 201 se tutti i posti sono prenotati, altrimenti 409 senza creare nulla; in entrambi i
+    casi con l'esito di ogni posto.
+    """
+    try:
+        dati = json.loads(request.body)
+        richieste = [(int(r["proiezione"]), r["posti"]) for r in dati["prenotazioni"]]
+        if not all(isinstance(posti, list) for _, posti in richieste):
+            raise TypeError
+    except (ValueError, TypeError, KeyError):
+        return JsonResponse({"errore": "Richiesta non valida."}, status=400)
+
+    proiezioni = Proiezione.objects.select_related("film").in_bulk({pk for pk, _ in richieste})
+    if len(proiezioni) != len({pk for pk, _ in richieste}):
+        return JsonResponse({"errore": "Proiezione inesistente."}, status=404)
+
+    try:
+        in_coda = [pk for pk, p in proiezioni.items() if not ammesso(request, p)]
+    except CodaOccupata:
+        return JsonResponse({"errore": "Troppe richieste, riprova tra poco."}, status=503)
+    if in_coda:
+        return JsonResponse({
+            "errore": "Per alcune proiezioni bisogna aspettare il proprio turno.",
+            "sala_attesa": [reverse("sales:prenota", kwargs={"proiezione_id": pk}) for pk in in_coda],
+        }, status=429)
+
+    try:
+        esiti = prenota_carrello(
+            [(proiezioni[pk], posti) for pk, posti in richieste],
+            request.user,
+            staff_mode=is_operational_staff(request.user),
+            nome_cliente=str(dati.get("nome_cliente") or "").strip(),
+            telefono_cliente=str(dati.get("telefono_cliente") or "").strip(),
+        )
+    except ValidationError as e:
+        return JsonResponse({"errore": e.messages[0]}, status=400)
+
+    ok = all(e["esito"] == PRENOTATO for e in esiti)
+    if ok:
+        for p in proiezioni.values():
+            libera_turno(request, p)
+    return JsonResponse({
+        "ok": ok,
+        "totale": str(sum(e["prezzo"] for e in esiti)) if ok else None,
+        "posti": [
+            {
+                "proiezione": e["proiezione"].pk,
+                "posto": e["posto_id"],
+                "label": f"{e['posto'].fila}{e['posto'].numero_posto}" if e["posto"] else None,
+                "esito": e["esito"],
+                "prezzo": str(e["prezzo"]) if e["prezzo"] is not None else None,
+                "biglietto": e["biglietto"].pk if e["biglietto"] else None,
+            }
+            for e in esiti
+        ],
+    }, status=201 if ok else 409)
 
 
 @login_required
+@idempotente
 def annulla_biglietto(request, biglietto_id):
     biglietto = get_object_or_404(
         Biglietto.objects.select_related("proiezione"),
@@ -226,7 +365,7 @@ def annulla_biglietto(request, biglietto_id):
         return redirect("accounts:mie_prenotazioni")
 
     now = timezone.now()
-    limite = biglietto.proiezione.data_ora - timedelta(hours=1)
+    limite = biglietto.proiezione.data_ora - Biglietto.ANTICIPO_ANNULLAMENTO
 
     # non annullabile da 1 ora prima della proiezione
     if now >= limite:
@@ -234,6 +373,72 @@ def annulla_biglietto(request, biglietto_id):
         return redirect("accounts:mie_prenotazioni")
 
     biglietto.delete()
+    ANNULLAMENTI.inc()
     messages.success(request, "Prenotazione annullata. Il posto è stato liberato.")
     return redirect("accounts:mie_prenotazioni")
 
+
+class ScannerView(GroupRequiredMixin, DetailView):
+    # controllo dei biglietti all'ingresso: verifica i QR in locale con il manifest della proiezione
+    model = Proiezione
+    pk_url_kwarg = "proiezione_id"
+    context_object_name = "proiezione"
+    template_name = "sales/scanner.html"
+    group_required = ["segretario", "gestore_film"]
+    superuser_allowed = True
+    raise_exception = True
+
+    def get_queryset(self):
+        return Proiezione.objects.select_related("film", "sala")
+
+
+class ManifestView(GroupRequiredMixin, View):
+    # impronte dei codici validi della proiezione (sales/codici.py), scaricate una volta dallo scanner
+    group_required = ["segretario", "gestore_film"]
+    superuser_allowed = True
+    raise_exception = True
+
+    def get(self, request, proiezione_id):
+        proiezione = get_object_or_404(Proiezione.objects.select_related("film"), id=proiezione_id)
+        biglietti = (
+            Biglietto.objects
+            .filter(proiezione=proiezione)
+            .values("id", "posto_id", "posto__fila", "posto__numero_posto")
+        )
+        dati = manifest(proiezione, biglietti)
+        dati["generato"] = timezone.now().isoformat()
+        return JsonResponse(dati)
+
+
+class VerificaBigliettoView(GroupRequiredMixin, View):
+    # verifica online di un codice (QR illeggibile per lo scanner, manifest non aggiornato, ...)
+    group_required = ["segretario", "gestore_film"]
+    superuser_allowed = True
+    raise_exception = True
+
+    def post(self, request):
+        letto = leggi_codice(request.POST.get("codice"))
+        biglietto = None
+        if letto:
+            biglietto = (
+                Biglietto.objects
+                .select_related("proiezione__film", "posto", "utente")
+                .filter(pk=letto[0])
+                .first()
+            )
+        if biglietto is None or not codice_valido(biglietto, letto[1]):
+            return JsonResponse({"valido": False, "motivo": "Biglietto inesistente o annullato."})
+
+        proiezione_id = request.POST.get("proiezione")
+        if proiezione_id and proiezione_id != str(biglietto.proiezione_id):
+            return JsonResponse({"valido": False, "motivo": "Il biglietto è di un'altra proiezione."})
+
+        return JsonResponse({
+            "valido": True,
+            "biglietto": biglietto.pk,
+            "proiezione": biglietto.proiezione_id,
+            "film": biglietto.proiezione.film.titolo,
+            "data_ora": biglietto.proiezione.data_ora.isoformat(),
+            "posto": f"{biglietto.posto.fila}{biglietto.posto.numero_posto}",
+            "cliente": biglietto.utente.username if biglietto.utente else biglietto.nome_cliente,
+        })